@@ -0,0 +1,91 @@
+"""Measure how quickly job_runner notices a marker file.
+
+Extracts ``wait_for_markers`` from the v4.0 ``log`` job and times, for each
+watch mode, the gap between a marker file being created and the wait
+returning. Run from the repository root:
+
+    python benchmarks/marker_latency.py --samples 20
+"""
+
+import argparse
+import pathlib
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import yaml
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+
+def load_wait_function(workflow="v4.0.yaml", job="log", step="Job Output"):
+    data = yaml.safe_load((ROOT / workflow).read_text(encoding="utf-8"))
+    for item in data["jobs"][job]["steps"]:
+        if item["name"] == step:
+            run = item["run"]
+            break
+    else:
+        raise SystemExit(f"step '{step}' not found in {workflow}")
+
+    lines = run.splitlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith("WATCH_MODE="))
+    func = next(i for i, line in enumerate(lines) if line.startswith("wait_for_markers() {"))
+    end = next(i for i in range(func, len(lines)) if lines[i] == "}")
+    return "\n".join(lines[start : end + 1])
+
+
+def measure(snippet, mode, samples, timeout):
+    latencies = []
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = pathlib.Path(workdir)
+        script = snippet.replace("${{ inputs.watch_mode }}", mode)
+        script += '\necho "${WATCH_MODE}"\nwait_for_markers %d job.started\n' % timeout
+        for _ in range(samples):
+            marker = workdir / "job.started"
+            marker.unlink(missing_ok=True)
+            proc = subprocess.Popen(
+                ["bash", "-c", script],
+                cwd=workdir,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            effective_mode = proc.stdout.readline().strip()
+            time.sleep(random.uniform(0.2, 1.0))
+            marker.touch()
+            created = time.monotonic()
+            proc.wait()
+            latencies.append((time.monotonic() - created) * 1000.0)
+    return effective_mode, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--timeout", type=int, default=15, help="seconds, like poll_interval")
+    args = parser.parse_args()
+
+    snippet = load_wait_function()
+    modes = ["poll"]
+    if shutil.which("inotifywait"):
+        modes.insert(0, "inotify")
+    else:
+        print("inotifywait not found; skipping inotify mode")
+
+    print(f"{'mode':<10}{'samples':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for mode in modes:
+        effective, latencies = measure(snippet, mode, args.samples, args.timeout)
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{effective:<10}{len(latencies):>8}{statistics.median(latencies):>10.1f}"
+            f"{p95:>10.1f}{latencies[-1]:>10.1f}"
+        )
+    print(f"(previous fixed sleep: up to {args.timeout * 1000} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Count the writes a chatty job makes to its shared output file, with and without buffering.
+
+Stages the v4.0 job script (``run-template.sh``, as ``create_script_template``
+renders it) for a script that prints ``--rate`` lines per second for
+``--seconds`` seconds, once with ``output_buffer`` off and once on, runs each
+with its output redirected to ``run.out`` like the SSH and scheduler paths do,
+and reports:
+
+- write calls on ``run.out``: without buffering every write the job makes
+  (``syscw`` in ``/proc/<pid>/io``, which includes reaped children); with
+  buffering the records ``dd`` writes when flushing, counted by a ``dd``
+  wrapper put first on ``PATH``
+- write calls on the node-local buffer, the bytes in ``run.out``, the mean write
+  size and the wall-clock time; both runs must produce the same output
+
+Run from the repository root on Linux:
+
+    python benchmarks/output_buffer.py --seconds 10 --rate 2000 --interval 2 --json results.json
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tests.harness import Execution  # noqa: E402
+
+
+PRINTER = """for (( s = 0; s < {seconds}; s++ )); do
+  for (( i = 0; i < {rate}; i++ )); do
+    echo "step ${{s}}.${{i}}: residual=0.${{RANDOM}} dt=1e-3"
+  done
+  sleep 1
+done"""
+
+
+def measure(tmp, buffered, seconds, rate, interval):
+    execution = Execution("v4.0.yaml", tmp, {
+        "resource": {"ip": "localhost", "schedulerType": ""},
+        "scheduler": False,
+        "script": PRINTER.format(seconds=seconds, rate=rate),
+        "output_buffer": buffered,
+        "output_buffer_interval": interval,
+    })
+    assert execution.run("create_script_template").returncode == 0
+    rundir = execution.rundir
+    bin_dir = pathlib.Path(tmp) / "dd-bin"
+    bin_dir.mkdir()
+    dd_log = pathlib.Path(tmp) / "dd.log"
+    wrapper = bin_dir / "dd"
+    wrapper.write_text(f'#!/bin/sh\n"{shutil.which("dd")}" "$@" status=noxfer 2>> "{dd_log}"\n')
+    wrapper.chmod(0o755)
+
+    env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}", OUT_BUFFER_DIR=tmp)
+    started = time.monotonic()
+    io = subprocess.run(["bash", "-c", 'bash run-template.sh > run.out 2>&1; grep ^syscw: /proc/$$/io'],
+                        cwd=rundir, env=env, capture_output=True, text=True, check=True).stdout
+    elapsed = time.monotonic() - started
+    job_writes = int(io.split()[1])
+    flushes = 0
+    dd_writes = 0
+    if dd_log.exists():
+        for line in dd_log.read_text().splitlines():
+            if line.endswith("records out"):
+                full, partial = line.split()[0].split("+")
+                dd_writes += int(full) + int(partial)
+                flushes += 1
+    output = (rundir / "run.out").read_bytes()
+    shared = dd_writes if buffered else job_writes
+    return {
+        "shared_writes": shared,
+        "local_writes": job_writes - dd_writes if buffered else 0,
+        "flushes": flushes,
+        "bytes": len(output),
+        "mean_write_bytes": len(output) / shared if shared else 0,
+        "seconds": elapsed,
+        "lines": output.count(b"step "),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=int, default=10, help="how long the job prints")
+    parser.add_argument("--rate", type=int, default=2000, help="lines printed per second")
+    parser.add_argument("--interval", type=int, default=2, help="output_buffer_interval (seconds)")
+    parser.add_argument("--json", type=pathlib.Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'output':<12}{'run.out writes':>16}{'buffer writes':>15}{'flushes':>9}{'bytes':>11}"
+          f"{'bytes/write':>13}{'seconds':>9}")
+    for name, buffered in (("direct", False), ("buffered", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            result = measure(tmp, buffered, args.seconds, args.rate, args.interval)
+        results[name] = result
+        print(f"{name:<12}{result['shared_writes']:>16}{result['local_writes']:>15}{result['flushes']:>9}"
+              f"{result['bytes']:>11}{result['mean_write_bytes']:>13.0f}{result['seconds']:>9.2f}")
+    if results["direct"]["lines"] != results["buffered"]["lines"]:
+        sys.exit(f"buffered run lost output: {results['buffered']['lines']} of {results['direct']['lines']} lines")
+
+    if args.json:
+        args.json.write_text(json.dumps({"seconds": args.seconds, "rate": args.rate, "interval": args.interval,
+                                         "results": results}, indent=2) + "\n")
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Measure SSH handshakes and step latency with and without connection reuse.
+
+Runs against the fake ``ssh`` in ``tests/harness``, where every new connection
+costs ``--handshake`` seconds and a connection through a live ControlMaster
+costs nothing, and reports for ``SSH_MUX_PERSIST=0`` (reuse off) and the
+default:
+
+- the v4.0 SLURM step cleanup (cancel.sh on the job's node) over consecutive
+  runs sharing one ``SSH_MUX_DIR``: handshakes and cleanup latency
+- ``node_fanout`` of a command to ``--nodes`` nodes, repeated ``--runs`` times
+
+Run from the repository root:
+
+    python benchmarks/ssh_reuse.py --runs 5 --nodes 8 --handshake 1.5 --json results.json
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tests.harness import Execution, install_fake_ssh  # noqa: E402
+from tools import sched_sync  # noqa: E402
+
+
+MODES = {"reuse off": "0", "reuse on": "300"}
+
+
+def cleanup_runs(runs, handshake, persist):
+    """Per run: (handshakes, seconds) of the SLURM step cleanup."""
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {"SSH_MUX_DIR": f"{tmp}/mux", "SSH_MUX_PERSIST": persist, "FAKESSH_HANDSHAKE": str(handshake)}
+        for run in range(runs):
+            execution = Execution("v4.0.yaml", f"{tmp}/run{run}", {
+                "resource": {"ip": "localhost", "schedulerType": "slurm"},
+                "scheduler": True,
+                "script": "sleep 60",
+            })
+            (execution.rundir / "cancel.sh").write_text("true\n")
+            execution.run("create_script_template")
+            job = execution.start("slurm_job", env={"FAKESCHED_QUEUE_WAIT": "0"})
+            deadline = time.monotonic() + 10
+            while not (execution.rundir / "job.started").exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            result = execution.run("slurm_job", kind="cleanup", env=env)
+            execution.wait(job)
+            handshakes = sum(1 for _, kind, _ in execution.ssh_connections() if kind == "handshake")
+            samples.append((handshakes, result.seconds))
+    return samples
+
+
+def fanout_runs(runs, nodes, handshake, persist):
+    """Per round: (handshakes, seconds) of node_fanout to ``nodes`` nodes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        install_fake_ssh(tmp / "bin")
+        names = " ".join(f"node{index:02d}" for index in range(nodes))
+        script = f"source {sched_sync.MUX_LIBRARY}\n" + "\n".join(
+            [f"start=$(date +%s%N); node_fanout 20 true {names}; echo $(( $(date +%s%N) - start ))"] * runs
+        )
+        env = dict(os.environ, PATH=f"{tmp / 'bin'}{os.pathsep}{os.environ['PATH']}", FAKESCHED_STATE=str(tmp),
+                   SSH_MUX_DIR=str(tmp / "mux"), SSH_MUX_PERSIST=persist, FAKESSH_HANDSHAKE=str(handshake))
+        output = subprocess.run(["bash", "-c", script], cwd=tmp, env=env, capture_output=True, text=True,
+                                check=True).stdout.split()
+        kinds = [line.split("\t")[1] for line in (tmp / "ssh.log").read_text().splitlines()]
+    per_round = len(kinds) // runs
+    return [(kinds[i * per_round:(i + 1) * per_round].count("handshake"), int(ns) / 1e9)
+            for i, ns in enumerate(output)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="consecutive runs (cleanups, fan-out rounds)")
+    parser.add_argument("--nodes", type=int, default=8, help="nodes in the fan-out")
+    parser.add_argument("--handshake", type=float, default=1.5, help="seconds per new SSH connection")
+    parser.add_argument("--json", type=pathlib.Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'metric':<40}{'handshakes':>12}{'median s':>10}{'max s':>10}")
+
+    def report(name, samples):
+        handshakes = sum(count for count, _ in samples)
+        seconds = [elapsed for _, elapsed in samples]
+        results[name] = {"handshakes": handshakes, "median_s": statistics.median(seconds),
+                         "max_s": max(seconds), "samples": samples}
+        print(f"{name:<40}{handshakes:>12}{statistics.median(seconds):>10.2f}{max(seconds):>10.2f}")
+
+    for mode, persist in MODES.items():
+        report(f"v4 slurm cleanup x{args.runs} ({mode})", cleanup_runs(args.runs, args.handshake, persist))
+    for mode, persist in MODES.items():
+        report(f"fan-out {args.nodes} nodes x{args.runs} ({mode})",
+               fanout_runs(args.runs, args.nodes, args.handshake, persist))
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
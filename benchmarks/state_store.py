@@ -0,0 +1,158 @@
+"""Count file operations on the v5.0 coordination directory per execution.
+
+Runs a parallel v5.0 execution against the fake scheduler in ``tests/harness``
+and watches ``lb_<job id>`` and its site directories with inotify while it
+runs. Per phase (initialize, site jobs, summary) it reports the files opened,
+created, deleted, renamed into place and touched, and after the run the
+number of files left in the coordination directory. ``--workflow`` measures
+another revision of the workflow for comparison:
+
+    git show HEAD~1:v5.0.yaml > /tmp/v5.0.old.yaml
+    python benchmarks/state_store.py --workflow /tmp/v5.0.old.yaml --json old.json
+    python benchmarks/state_store.py --json new.json
+
+Run from the repository root on Linux.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import pathlib
+import select
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tests.harness import Execution  # noqa: E402
+
+
+EVENTS = {"open": 0x20, "create": 0x100, "delete": 0x200, "rename": 0x80, "attrib": 0x04}
+IN_ISDIR = 0x40000000
+SCHEDULERS = ("slurm", "pbs", "ssh")
+
+
+class Watch:
+    """Count inotify events under a directory, following new subdirectories."""
+
+    def __init__(self, top, within):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.within = str(within)
+        self.paths = {}
+        self.add(top)
+        self.counts = dict.fromkeys(EVENTS, 0)
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self.read)
+        self.thread.start()
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), sum(EVENTS.values()))
+        if wd >= 0:
+            self.paths[wd] = str(directory)
+
+    def read(self):
+        while self.running or select.select([self.fd], [], [], 0.5)[0]:
+            if not select.select([self.fd], [], [], 0.1)[0]:
+                continue
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, event, _, length = struct.unpack_from("iIII", data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b"\0").decode()
+                offset += 16 + length
+                path = os.path.join(self.paths.get(wd, ""), name)
+                if event & EVENTS["create"] and event & IN_ISDIR:
+                    self.add(path)
+                if not path.startswith(self.within):
+                    continue
+                with self.lock:
+                    for kind, bit in EVENTS.items():
+                        if event & bit:
+                            self.counts[kind] += 1
+
+    def take(self):
+        """Counts since the last call."""
+        with self.lock:
+            counts, self.counts = self.counts, dict.fromkeys(EVENTS, 0)
+        return counts
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.fd)
+
+
+def execution(tmp, workflow, sites):
+    inputs = {"sites_0.enabled": False, "execution_mode": "parallel", "script": "true", "log_rate_limit": 0}
+    for index in range(sites):
+        scheduler = SCHEDULERS[index % len(SCHEDULERS)]
+        inputs.update({
+            f"sites_{index}.enabled": True,
+            f"sites_{index}.name": f"site{index}",
+            f"sites_{index}.scheduler": scheduler != "ssh",
+            f"sites_{index}.resource": {"ip": "clusterA", "schedulerType": "" if scheduler == "ssh" else scheduler},
+        })
+    return Execution(workflow, tmp, inputs)
+
+
+def measure(workflow, sites):
+    """Per phase: counts of each kind of file event; plus files left behind."""
+    with tempfile.TemporaryDirectory() as tmp:
+        run = execution(tmp, workflow, sites)
+        coord = run.workdir("cleanup")
+        coord.rmdir()
+        watch = Watch(run.rundir, coord)
+        phases = {}
+        try:
+            assert run.run("initialize").returncode == 0
+            time.sleep(0.2)
+            phases["initialize"] = watch.take()
+            processes = [run.start(f"site_{index}") for index in range(sites)]
+            for process in processes:
+                assert run.wait(process).returncode == 0
+            time.sleep(0.2)
+            phases["site jobs"] = watch.take()
+            assert run.run("cleanup").returncode == 0
+            time.sleep(0.2)
+            phases["summary"] = watch.take()
+        finally:
+            watch.stop()
+        files = sum(1 for path in coord.rglob("*") if path.is_file())
+    return phases, files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workflow", default="v5.0.yaml", help="workflow file (default: v5.0.yaml)")
+    parser.add_argument("--sites", type=int, default=3, help="sites, cycling slurm/pbs/ssh (1-5)")
+    parser.add_argument("--json", type=pathlib.Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    phases, files = measure(args.workflow, args.sites)
+    print(f"{'phase':<14}" + "".join(f"{name:>9}" for name in EVENTS) + f"{'total':>9}")
+    for phase, counts in phases.items():
+        print(f"{phase:<14}" + "".join(f"{count:>9}" for count in counts.values()) + f"{sum(counts.values()):>9}")
+    print(f"files in the coordination directory: {files}")
+
+    if args.json:
+        args.json.write_text(json.dumps({"workflow": args.workflow, "sites": args.sites, "phases": phases,
+                                         "files": files}, indent=2) + "\n")
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Measure end-to-end workflow overhead against the fake scheduler.
+
+Runs the real v4.0/v5.0 step scripts through ``tests/harness`` (stand-in
+sbatch/squeue/sacct/scancel/qsub/qstat/qdel, jobs executed locally) and
+reports:
+
+- overhead: workflow wall time minus queue wait and payload runtime
+- scheduler calls per minute while a job is being monitored
+- race cancellation latency: winner claim to the last loser cancelled
+- log streaming throughput of the v5 aggregated output job
+
+Run from the repository root:
+
+    python benchmarks/workflow_overhead.py --samples 3 --json results.json
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from tests.harness import Execution  # noqa: E402
+
+
+V4_JOBS = {"ssh": "ssh_job", "slurm": "slurm_job", "pbs": "pbs_job"}
+
+
+def v4_execution(tmp, scheduler, script, poll_interval):
+    return Execution("v4.0.yaml", tmp, {
+        "resource": {"ip": "localhost", "schedulerType": "" if scheduler == "ssh" else scheduler},
+        "scheduler": scheduler != "ssh",
+        "script": script,
+        "poll_interval": poll_interval,
+    })
+
+
+def v5_execution(tmp, sites, mode, script, poll_interval):
+    # Only site 0 is enabled by default
+    inputs = {"sites_0.enabled": False}
+    for index, scheduler in enumerate(sites):
+        inputs.update({
+            f"sites_{index}.enabled": True,
+            f"sites_{index}.name": f"site{index}",
+            f"sites_{index}.scheduler": scheduler != "ssh",
+            f"sites_{index}.resource": {"ip": "clusterA", "schedulerType": "" if scheduler == "ssh" else scheduler},
+        })
+    inputs.update(execution_mode=mode, script=script, poll_interval=poll_interval, log_rate_limit=0)
+    return Execution("v5.0.yaml", tmp, inputs)
+
+
+def v4_overhead(scheduler, queue_wait, poll_interval):
+    """Seconds the v4 workflow adds on top of queue wait and a no-op payload."""
+    with tempfile.TemporaryDirectory() as tmp:
+        execution = v4_execution(tmp, scheduler, "true", poll_interval)
+        start = time.monotonic()
+        execution.run("create_script_template")
+        execution.run(V4_JOBS[scheduler], env={"FAKESCHED_QUEUE_WAIT": str(queue_wait)})
+        execution.run("cleanup")
+        elapsed = time.monotonic() - start
+    return elapsed - (queue_wait if scheduler != "ssh" else 0)
+
+
+def v4_call_rate(scheduler, runtime, poll_interval):
+    """Scheduler calls per minute while a v4 job of ``runtime`` seconds runs."""
+    with tempfile.TemporaryDirectory() as tmp:
+        execution = v4_execution(tmp, scheduler, f"sleep {runtime}", poll_interval)
+        execution.run("create_script_template")
+        result = execution.run(V4_JOBS[scheduler], env={"FAKESCHED_QUEUE_WAIT": "0"})
+        calls = len(execution.calls())
+    return calls / result.seconds * 60
+
+
+def v5_race(sites, poll_interval):
+    """Race cancellation latency (ms, from summary.json) and calls per minute."""
+    with tempfile.TemporaryDirectory() as tmp:
+        execution = v5_execution(tmp, ["slurm"] * sites, "race", "sleep 2", poll_interval)
+        execution.run("initialize")
+        start = time.monotonic()
+        processes = [
+            execution.start(f"site_{i}", env={"FAKESCHED_QUEUE_WAIT": "0.2" if i == 0 else "120"})
+            for i in range(sites)
+        ]
+        for process in processes:
+            execution.wait(process)
+        elapsed = time.monotonic() - start
+        execution.run("cleanup")
+        summary = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+        calls = len(execution.calls())
+    return summary["race_cancel_latency_ms"], calls / elapsed * 60
+
+
+def v5_log_throughput(sites, megabytes):
+    """MiB/s streamed by the v5 log job from ``sites`` pre-written run.out files."""
+    with tempfile.TemporaryDirectory() as tmp:
+        execution = v5_execution(tmp, ["ssh"] * sites, "parallel", "true", 1)
+        execution.run("initialize")
+        line = b"x" * 99 + b"\n"
+        for index in range(sites):
+            (execution.workdir(f"site_{index}") / "run.out").write_bytes(line * (megabytes * 1024 * 1024 // 100))
+        (execution.workdir("log") / "STOP_STREAMING").touch()
+        result = execution.run("log")
+        streamed = sum(1 for out in result.output.splitlines() if out.startswith("[site_"))
+    return streamed * 100 / result.seconds / (1024 * 1024)
+
+
+def summarize(values):
+    return statistics.median(values), max(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--poll-interval", type=int, default=2, help="seconds, the poll_interval input")
+    parser.add_argument("--queue-wait", type=float, default=1.0, help="seconds each fake job stays pending")
+    parser.add_argument("--runtime", type=int, default=20, help="payload seconds for the call-rate runs")
+    parser.add_argument("--sites", type=int, default=3, help="sites in the race and log runs (2-5)")
+    parser.add_argument("--log-mb", type=int, default=20, help="MiB of output per site for the log run")
+    parser.add_argument("--json", type=pathlib.Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'metric':<36}{'median':>10}{'max':>10}")
+
+    def report(name, unit, values):
+        median, worst = summarize(values)
+        results[name] = {"unit": unit, "median": median, "max": worst, "samples": values}
+        print(f"{name + ' (' + unit + ')':<36}{median:>10.2f}{worst:>10.2f}")
+
+    for scheduler in ("ssh", "slurm", "pbs"):
+        report(f"v4 {scheduler} overhead", "s",
+               [v4_overhead(scheduler, args.queue_wait, args.poll_interval) for _ in range(args.samples)])
+    for scheduler in ("slurm", "pbs"):
+        report(f"v4 {scheduler} scheduler calls", "/min",
+               [v4_call_rate(scheduler, args.runtime, args.poll_interval) for _ in range(args.samples)])
+
+    races = [v5_race(args.sites, args.poll_interval) for _ in range(args.samples)]
+    report(f"v5 race cancel latency x{args.sites}", "ms", [float(latency) for latency, _ in races])
+    report(f"v5 race scheduler calls x{args.sites}", "/min", [rate for _, rate in races])
+    report(f"v5 log throughput x{args.sites}", "MiB/s",
+           [v5_log_throughput(args.sites, args.log_mb) for _ in range(args.samples)])
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
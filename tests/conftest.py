@@ -29,3 +29,10 @@ def v5_workflow_text():
 @pytest.fixture(scope="session")
 def v5_workflow_data(v5_workflow_text):
     return yaml.safe_load(v5_workflow_text)
+
+
+@pytest.fixture(scope="session")
+def v5_sites(v5_workflow_data):
+    """Site indices present in the generated v5.0 workflow."""
+    jobs = v5_workflow_data["jobs"]
+    return sorted(int(name[len("site_"):]) for name in jobs if name.startswith("site_"))
@@ -0,0 +1,279 @@
+"""Execute the workflows' embedded bash locally against a fake scheduler.
+
+The platform renders ``${{ inputs.* }}`` into each step's ``run``/``cleanup``
+block and runs it over SSH in the job's ``working-directory``. This module does
+the same on the local machine: every ``remoteHost`` is localhost, the
+scheduler commands on ``PATH`` are the stand-ins from ``fakesched.py``,
+``ssh`` to compute nodes is the stand-in from ``fakessh.py`` and ``rsync`` the
+one from ``fakersync.py``.
+
+    execution = Execution("v4.0.yaml", tmp_path, {"resource.schedulerType": "slurm", ...})
+    execution.run("create_script_template")
+    result = execution.run("slurm_job")
+    assert result.returncode == 0
+
+Tuning the fake scheduler (queue wait, preemption, ...) is done per job through
+``env=`` with the ``FAKESCHED_*`` variables documented in ``fakesched.py``, and
+the SSH handshake time with ``FAKESSH_HANDSHAKE`` and interrupted transfers with
+``FAKERSYNC_FAILURES``.
+"""
+
+import json
+import os
+import pathlib
+import re
+import shlex
+import subprocess
+import sys
+import time
+
+import yaml
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+FAKESCHED = pathlib.Path(__file__).resolve().parent / "fakesched.py"
+FAKESSH = pathlib.Path(__file__).resolve().parent / "fakessh.py"
+FAKERSYNC = pathlib.Path(__file__).resolve().parent / "fakersync.py"
+COMMANDS = ("sbatch", "squeue", "sacct", "scancel", "scontrol", "qsub", "qstat", "qdel")
+EXPRESSION = re.compile(r"\$\{\{(.*?)\}\}")
+
+
+def load_workflow(name):
+    return yaml.safe_load((ROOT / name).read_text(encoding="utf-8"))
+
+
+def input_defaults(workflow):
+    """Flatten the input tree into ``{"group.key": default}``."""
+    defaults = {}
+
+    def walk(items, prefix):
+        for key, spec in items.items():
+            if spec.get("type") == "group":
+                walk(spec.get("items", {}), f"{prefix}{key}.")
+            elif "default" in spec:
+                defaults[prefix + key] = spec["default"]
+
+    walk(workflow["on"]["execute"]["inputs"], "")
+    return defaults
+
+
+def lookup(inputs, key):
+    """Resolve ``a.b.c`` against dotted keys and nested dicts; None if unset."""
+    if key in inputs:
+        return inputs[key]
+    head = key.rpartition(".")[0]
+    while head:
+        if head in inputs and isinstance(inputs[head], dict):
+            value = inputs[head]
+            for part in key[len(head) + 1:].split("."):
+                if not isinstance(value, dict) or part not in value:
+                    return None
+                value = value[part]
+            return value
+        head = head.rpartition(".")[0]
+    return None
+
+
+def evaluate(expression, inputs):
+    """Evaluate the small expression language used by ``if:`` and defaults."""
+    expression = expression.strip()
+    if expression == "always":
+        return True
+    values = {}
+
+    def name(match):
+        values[f"_v{len(values)}"] = lookup(inputs, match.group(0)[len("inputs."):])
+        return f"_v{len(values) - 1}"
+
+    python = re.sub(r"inputs(?:\.\w+)+", name, expression)
+    python = python.replace("&&", " and ").replace("||", " or ")
+    python = re.sub(r"\btrue\b", "True", re.sub(r"\bfalse\b", "False", python))
+    return eval(python, {"__builtins__": {}}, values)  # noqa: S307 - trusted workflow text
+
+
+def format_value(value):
+    if value is None:
+        return "undefined"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)
+
+
+def render(text, inputs):
+    def substitute(match):
+        expression = match.group(1).strip()
+        if re.fullmatch(r"inputs(?:\.\w+)+", expression):
+            return format_value(lookup(inputs, expression[len("inputs."):]))
+        return format_value(evaluate(expression, inputs))
+
+    return EXPRESSION.sub(substitute, text)
+
+
+def install_fake_scheduler(bin_dir):
+    """Write one wrapper per scheduler command that dispatches to fakesched.py."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for command in COMMANDS:
+        wrapper = bin_dir / command
+        wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKESCHED}" {command} "$@"\n')
+        wrapper.chmod(0o755)
+
+
+def install_fake_ssh(bin_dir):
+    """Write an ``ssh`` wrapper that dispatches to fakessh.py."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    wrapper = bin_dir / "ssh"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKESSH}" "$@"\n')
+    wrapper.chmod(0o755)
+
+
+def install_fake_rsync(bin_dir):
+    """Write an ``rsync`` wrapper that dispatches to fakersync.py."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    wrapper = bin_dir / "rsync"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKERSYNC}" "$@"\n')
+    wrapper.chmod(0o755)
+
+
+class Result:
+    def __init__(self, job, kind, returncode, output, seconds):
+        self.job = job
+        self.kind = kind
+        self.returncode = returncode
+        self.output = output
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"<Result {self.job} {self.kind} rc={self.returncode} {self.seconds:.2f}s>"
+
+
+class Execution:
+    """One workflow execution: rendered inputs, a run directory and a fake scheduler."""
+
+    def __init__(self, workflow, base, inputs=None, job_id="00001"):
+        self.name = workflow
+        self.workflow = load_workflow(workflow)
+        self.base = pathlib.Path(base)
+        self.rundir = self.base / "rundir"
+        self.rundir.mkdir(parents=True, exist_ok=True)
+        self.state = self.base / "fakesched"
+        self.bin = self.base / "bin"
+        install_fake_scheduler(self.bin)
+        install_fake_ssh(self.bin)
+        install_fake_rsync(self.bin)
+        self.job_id = job_id
+
+        self.inputs = input_defaults(self.workflow)
+        self.inputs.update({"rundir": str(self.rundir), "watch_mode": "poll", "poll_interval": 1})
+        self.inputs.update(inputs or {})
+        for key, value in list(self.inputs.items()):
+            if isinstance(value, str) and EXPRESSION.fullmatch(value.strip()):
+                self.inputs[key] = evaluate(EXPRESSION.fullmatch(value.strip()).group(1), self.inputs)
+
+    def env(self, extra=None):
+        env = dict(os.environ)
+        env.update(
+            PATH=f"{self.bin}{os.pathsep}{env.get('PATH', '')}",
+            PW_JOB_ID=self.job_id,
+            OUTPUTS=str(self.base / "outputs"),
+            FAKESCHED_STATE=str(self.state),
+            USER=env.get("USER", "harness"),
+        )
+        env.update(extra or {})
+        return env
+
+    def enabled(self, job):
+        condition = self.workflow["jobs"][job].get("if")
+        if condition is None:
+            return True
+        return bool(evaluate(EXPRESSION.fullmatch(condition.strip()).group(1), self.inputs))
+
+    def workdir(self, job):
+        path = self.workflow["jobs"][job].get("working-directory")
+        if path is None:
+            return self.rundir
+        path = pathlib.Path(render(path, self.inputs).replace("${PW_JOB_ID}", self.job_id))
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def site_state(self, job):
+        """Current values of a v5.0 site's ``state.log`` (the last line of each key)."""
+        log = self.workdir(job) / "state.log"
+        if not log.exists():
+            return {}
+        return {key: value for _, key, value in
+                (line.split("\t", 2) for line in log.read_text().splitlines())}
+
+    def script(self, job, kind="run", step=None):
+        steps = self.workflow["jobs"][job]["steps"]
+        chosen = [s for s in steps if step is None or s["name"] == step]
+        blocks = [s[kind] for s in chosen if kind in s]
+        if not blocks:
+            raise KeyError(f"{self.name}: job {job!r} has no {kind} block")
+        return "\n".join(render(block, self.inputs) for block in blocks)
+
+    def start(self, job, kind="run", step=None, env=None):
+        """Start a job's steps (bash -c per block, like the platform) in the background."""
+        if step is None and kind == "run" and len(self.workflow["jobs"][job]["steps"]) > 1:
+            script = "\n".join(
+                f"bash -c {shlex.quote(render(s['run'], self.inputs))} || exit $?"
+                for s in self.workflow["jobs"][job]["steps"]
+            )
+        else:
+            script = self.script(job, kind, step)
+        process = subprocess.Popen(
+            ["bash", "-c", script], cwd=self.workdir(job), env=self.env(env),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, start_new_session=True,
+        )
+        process.harness_job = (job, kind, time.monotonic())
+        return process
+
+    def wait(self, process, timeout=120):
+        try:
+            output, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, 9)
+            output, _ = process.communicate()
+            raise AssertionError(f"{process.harness_job[0]} timed out after {timeout}s:\n{output}")
+        job, kind, started = process.harness_job
+        return Result(job, kind, process.returncode, output, time.monotonic() - started)
+
+    def run(self, job, kind="run", step=None, env=None, timeout=120):
+        return self.wait(self.start(job, kind, step, env), timeout)
+
+    def jobs(self):
+        """Fake scheduler records, oldest first."""
+        jobs_dir = self.state / "jobs"
+        if not jobs_dir.is_dir():
+            return []
+        paths = sorted(jobs_dir.glob("*.json"), key=lambda p: int(p.stem))
+        return [json.loads(p.read_text()) for p in paths]
+
+    def calls(self):
+        """Scheduler invocations as ``(epoch, command, args)`` tuples."""
+        log = self.state / "calls.log"
+        if not log.exists():
+            return []
+        calls = []
+        for line in log.read_text().splitlines():
+            epoch, argv = line.split("\t", 1)
+            command, *args = json.loads(argv)
+            calls.append((float(epoch), command, args))
+        return calls
+
+    def ssh_connections(self):
+        """SSH connections as ``(epoch, "handshake" | "reuse", host)`` tuples."""
+        log = self.state / "ssh.log"
+        if not log.exists():
+            return []
+        return [(float(epoch), kind, host) for epoch, kind, host in
+                (line.split("\t") for line in log.read_text().splitlines())]
+
+    def rsync_runs(self):
+        """rsync invocations as ``(epoch, args, exit code, bytes received)`` tuples."""
+        log = self.state / "rsync.log"
+        if not log.exists():
+            return []
+        return [(float(epoch), json.loads(argv), int(rc), int(received)) for epoch, argv, rc, received in
+                (line.split("\t") for line in log.read_text().splitlines())]
@@ -0,0 +1,183 @@
+"""Stand-in ``rsync`` for executing the workflow scripts locally.
+
+Every host is the local machine: ``host:path`` reads ``path`` directly and the
+remote shell (``-e``) is not started. What the workflows rely on is modelled:
+
+- ``-a`` copies with modification times; a file whose size and modification
+  time match the destination is skipped (rsync's quick check)
+- ``--include``/``--exclude`` filters, first match wins; a pattern ending in
+  ``/`` matches directories only, one containing ``/`` matches the end of the
+  path (the whole path if it starts with ``/``), any other the file name, and
+  ``**`` crosses directories; ``--prune-empty-dirs`` drops empty directories
+- ``--partial-dir=<dir>``: an interrupted file is kept in ``<dir>`` next to its
+  destination and a later run only receives the rest of it
+- ``--bwlimit=<KiB/s>`` slows the transfer down accordingly
+- ``--stats`` prints the files transferred and the bytes received
+
+Other options (``-z``, ``--timeout``, ...) are accepted and ignored. Behaviour
+is set by the environment:
+
+    FAKERSYNC_FAILURES    the first N runs per destination stop half-way through
+                          their first file and exit 12
+
+Every run is logged to ``$FAKESCHED_STATE/rsync.log``: epoch, tab, JSON argv,
+tab, exit code, tab, bytes received.
+"""
+
+import json
+import os
+import pathlib
+import re
+import shutil
+import sys
+import time
+
+
+STATE = pathlib.Path(os.environ.get("FAKESCHED_STATE", "/tmp/fakesched"))
+# Options that take an argument
+WITH_ARGUMENT = ("-e", "--rsh", "--partial-dir", "--bwlimit", "--include", "--exclude", "--timeout")
+
+
+def parse(argv):
+    options, filters, paths = {}, [], []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        i += 1
+        if not arg.startswith("-") or arg == "-":
+            paths.append(arg)
+            continue
+        name, equals, value = arg.partition("=")
+        if name in WITH_ARGUMENT and not equals:
+            value = argv[i]
+            i += 1
+        if name in ("--include", "--exclude"):
+            filters.append((name == "--include", value))
+        elif name.startswith("--"):
+            options[name] = value
+        else:
+            for flag in name[1:]:
+                options[f"-{flag}"] = value if flag == "e" else ""
+    return options, filters, paths
+
+
+def pattern_regex(pattern):
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def matches(pattern, path, is_dir):
+    if pattern.endswith("/"):
+        if not is_dir:
+            return False
+        pattern = pattern.rstrip("/")
+    if pattern.startswith("/"):
+        return re.fullmatch(pattern_regex(pattern[1:]), path) is not None
+    if "/" in pattern or "**" in pattern:
+        return re.fullmatch(f"(?:.*/)?{pattern_regex(pattern)}", path) is not None
+    return re.fullmatch(pattern_regex(pattern), path.rpartition("/")[2]) is not None
+
+
+def included(filters, path, is_dir):
+    for include, pattern in filters:
+        if matches(pattern, path, is_dir):
+            return include
+    return True
+
+
+def walk(source, filters, prefix=""):
+    """Relative paths of the files to transfer, in rsync's order."""
+    files = []
+    for entry in sorted(os.scandir(source / prefix if prefix else source), key=lambda entry: entry.name):
+        path = f"{prefix}{entry.name}"
+        if entry.is_dir(follow_symlinks=False):
+            if included(filters, path, True):
+                files.extend(walk(source, filters, f"{path}/"))
+        elif included(filters, path, False):
+            files.append(path)
+    return files
+
+
+def failures_left(destination):
+    """Whether this run is one of the first FAKERSYNC_FAILURES for the destination."""
+    limit = int(os.environ.get("FAKERSYNC_FAILURES", "0") or 0)
+    if not limit:
+        return False
+    STATE.mkdir(parents=True, exist_ok=True)
+    counter = STATE / "rsync.failures"
+    counts = json.loads(counter.read_text()) if counter.exists() else {}
+    key = str(destination.resolve())
+    counts[key] = counts.get(key, 0) + 1
+    counter.write_text(json.dumps(counts))
+    return counts[key] <= limit
+
+
+def main(argv):
+    options, filters, paths = parse(argv)
+    source, destination = paths[-2], pathlib.Path(paths[-1])
+    source = pathlib.Path(source.partition(":")[2] if ":" in source.split("/")[0] else source)
+    partial_dir = options.get("--partial-dir")
+    bwlimit = float(options.get("--bwlimit") or 0)
+    fail = failures_left(destination)
+
+    rc = 0
+    received = 0
+    transferred = 0
+    for path in walk(source, filters):
+        src, dst = source / path, destination / path
+        stat = src.stat()
+        if dst.exists() and dst.stat().st_size == stat.st_size and int(dst.stat().st_mtime) == int(stat.st_mtime):
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        partial = dst.parent / partial_dir / dst.name if partial_dir else None
+        have = partial.stat().st_size if partial is not None and partial.exists() else 0
+        if fail:
+            if partial is not None:
+                partial.parent.mkdir(parents=True, exist_ok=True)
+                with open(src, "rb") as handle:
+                    partial.write_bytes(handle.read(stat.st_size // 2))
+                received += stat.st_size // 2 - have
+            print(f'rsync: [receiver] write failed on "{dst}": Broken pipe (32)', file=sys.stderr)
+            print("rsync error: error in rsync protocol data stream (code 12)", file=sys.stderr)
+            rc = 12
+            break
+        if bwlimit:
+            time.sleep((stat.st_size - have) / (bwlimit * 1024))
+        shutil.copy2(src, dst)
+        if partial is not None and partial.exists():
+            partial.unlink()
+            if not any(partial.parent.iterdir()):
+                partial.parent.rmdir()
+        received += stat.st_size - have
+        transferred += 1
+
+    if "--prune-empty-dirs" in options or "-m" in options:
+        for directory in sorted((p for p in destination.rglob("*") if p.is_dir()), reverse=True):
+            if not any(directory.iterdir()):
+                directory.rmdir()
+    if "--stats" in options:
+        print(f"Number of regular files transferred: {transferred:,}")
+        print(f"Total bytes received: {received:,}")
+
+    STATE.mkdir(parents=True, exist_ok=True)
+    with open(STATE / "rsync.log", "a") as handle:
+        handle.write(f"{time.time():.6f}\t{json.dumps(argv)}\t{rc}\t{received}\n")
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,679 @@
+"""Stand-in SLURM/PBS commands for executing the workflow scripts locally.
+
+Every scheduler command the workflows call (``sbatch``, ``squeue``, ``sacct``,
+``scancel``, ``scontrol``, ``qsub``, ``qstat``, ``qdel``) is a small wrapper
+that runs ``fakesched.py <command> <args>``. Jobs are real local processes:
+a detached runner sleeps through the queue wait, runs the job script with
+``bash`` in its own process group and records the outcome.
+
+State lives in ``$FAKESCHED_STATE``: one JSON file per job, plus ``calls.log``
+with one line per scheduler call (epoch, tab, JSON argv). Behaviour of a job is
+fixed at submission from the submitter's environment:
+
+    FAKESCHED_QUEUE_WAIT       seconds a job stays pending (default 0.5)
+    FAKESCHED_PREEMPT_AFTER    seconds after start at which the job is preempted
+    FAKESCHED_PREEMPT_COUNT    only preempt the first N jobs of the same name
+    FAKESCHED_SUBMIT_FAIL      non-empty: sbatch/qsub reject the submission
+    FAKESCHED_SUBMIT_FAILURES  reject the first N submissions of a job name
+    FAKESCHED_KEEP_COMPLETED   seconds PBS keeps finished jobs in qstat (default 60)
+    FAKESCHED_PENDING_JOBS     extra pending jobs reported to queue-depth queries
+    FAKESCHED_NO_ACCOUNTING    non-empty: sacct knows no jobs, as without slurmdbd
+    FAKESCHED_START_ESTIMATE   seconds after submission the scheduler expects the
+                               job to start (default: the queue wait); "none"
+                               reports no estimate
+
+Array jobs (``--array``/``#PBS -J``) keep one record with an ``elements`` map;
+``sacct --array`` and ``qstat -t`` list the elements individually.
+
+Requested CPUs, memory and time limit come from the job's directives; the CPU
+time and peak RSS that ``sacct`` and ``qstat -f`` report are measured from the
+job's processes.
+"""
+
+import fcntl
+import json
+import os
+import pathlib
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+
+STATE = pathlib.Path(os.environ.get("FAKESCHED_STATE", "/tmp/fakesched"))
+USER = os.environ.get("USER", "user")
+HOST = "fakenode01"
+
+SLURM_CODES = {
+    "PENDING": "PD", "RUNNING": "R", "COMPLETED": "CD", "FAILED": "F",
+    "CANCELLED": "CA", "PREEMPTED": "PR",
+}
+ACTIVE = ("PENDING", "RUNNING")
+
+
+class Lock:
+    def __enter__(self):
+        STATE.mkdir(parents=True, exist_ok=True)
+        self.handle = open(STATE / "lock", "w")
+        fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.handle, fcntl.LOCK_UN)
+        self.handle.close()
+
+
+def job_path(jobid):
+    return STATE / "jobs" / f"{jobid}.json"
+
+
+def load(jobid):
+    try:
+        return json.loads(job_path(jobid).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def save(job):
+    path = job_path(job["id"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(job))
+    tmp.replace(path)
+
+
+def update(jobid, **fields):
+    with Lock():
+        job = load(jobid)
+        if job is None:
+            return None
+        job.update(fields)
+        save(job)
+        return job
+
+
+def all_jobs():
+    jobs = []
+    for path in sorted((STATE / "jobs").glob("*.json"), key=lambda p: int(p.stem)):
+        try:
+            jobs.append(json.loads(path.read_text()))
+        except ValueError:
+            continue
+    return jobs
+
+
+def visible(job):
+    """PBS keeps finished jobs listed for a while (Torque-style), SLURM does not."""
+    if job["state"] in ACTIVE:
+        return True
+    if job["scheduler"] == "pbs" and job.get("end_time"):
+        return time.time() - job["end_time"] < float(os.environ.get("FAKESCHED_KEEP_COMPLETED", "60"))
+    return False
+
+
+def estimated_start(job):
+    """Epoch at which a pending job is expected to start, or None."""
+    if job["state"] != "PENDING" or job.get("start_estimate") == "none":
+        return None
+    offset = job.get("start_estimate")
+    return job["submit_time"] + (float(offset) if offset else job["queue_wait"])
+
+
+def log_call(argv):
+    STATE.mkdir(parents=True, exist_ok=True)
+    with open(STATE / "calls.log", "a") as handle:
+        handle.write(f"{time.time():.3f}\t{json.dumps(argv)}\n")
+
+
+# ---------------------------------------------------------------------------
+# Submission and job execution
+# ---------------------------------------------------------------------------
+
+def parse_array(spec):
+    """Indices and throttle of an array spec such as ``0-9``, ``1,3,5-11:2%4``."""
+    spec, _, throttle = spec.partition("%")
+    indices = []
+    for part in spec.split(","):
+        bounds, _, step = part.partition(":")
+        first, _, last = bounds.partition("-")
+        indices += range(int(first), int(last or first) + 1, int(step or 1))
+    return {"indices": indices, "throttle": int(throttle) if throttle else None}
+
+
+def parse_directives(script, prefix):
+    directives = []
+    for line in pathlib.Path(script).read_text(errors="replace").splitlines():
+        if line.startswith(prefix):
+            directives.append(line[len(prefix):].strip())
+    return directives
+
+
+def rejected(name):
+    """Whether this submission of ``name`` is one of the first FAKESCHED_SUBMIT_FAILURES."""
+    limit = int(os.environ.get("FAKESCHED_SUBMIT_FAILURES") or 0)
+    if not limit:
+        return False
+    with Lock():
+        counter = STATE / "rejected" / name
+        counter.parent.mkdir(parents=True, exist_ok=True)
+        count = int(counter.read_text()) if counter.exists() else 0
+        if count >= limit:
+            return False
+        counter.write_text(str(count + 1))
+        return True
+
+
+def submit(scheduler, script, name, output, chdir, array=None, resources=None):
+    if os.environ.get("FAKESCHED_SUBMIT_FAIL") or rejected(name):
+        print(f"{'sbatch' if scheduler == 'slurm' else 'qsub'}: error: submission rejected", file=sys.stderr)
+        return None
+    with Lock():
+        counter = STATE / "next_id"
+        jobid = int(counter.read_text()) + 1 if counter.exists() else 1001
+        counter.write_text(str(jobid))
+        preempt = os.environ.get("FAKESCHED_PREEMPT_AFTER")
+        preempt_count = os.environ.get("FAKESCHED_PREEMPT_COUNT")
+        if preempt_count and sum(job["name"] == name for job in all_jobs()) >= int(preempt_count):
+            preempt = None
+        save({
+            "id": jobid,
+            "scheduler": scheduler,
+            "name": name,
+            "user": USER,
+            "script": str(pathlib.Path(script).resolve()),
+            "chdir": chdir,
+            "output": output,
+            "state": "PENDING",
+            "exit_code": None,
+            "submit_time": time.time(),
+            "start_time": None,
+            "end_time": None,
+            "queue_wait": float(os.environ.get("FAKESCHED_QUEUE_WAIT", "0.5")),
+            "start_estimate": os.environ.get("FAKESCHED_START_ESTIMATE"),
+            "preempt_after": float(preempt) if preempt else None,
+            "runner_pid": None,
+            "pgid": None,
+            "array": array,
+            "resources": resources or {"cpus": 1, "mem_mb": None, "time_limit": None},
+            "usage": None,
+            "elements": {
+                str(index): {"state": "PENDING", "exit_code": None, "pgid": None} for index in array["indices"]
+            } if array else None,
+        })
+    runner = subprocess.Popen(
+        [sys.executable, __file__, "_run", str(jobid)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True, env=dict(os.environ, FAKESCHED_STATE=str(STATE)),
+    )
+    update(jobid, runner_pid=runner.pid)
+    return jobid
+
+
+def job_env(job, index=None):
+    env = dict(os.environ)
+    for key in [k for k in env if k.startswith("FAKESCHED_")]:
+        del env[key]
+    jobid = job["id"]
+    if job["scheduler"] == "slurm":
+        env.update(SLURM_JOB_ID=str(jobid), SLURM_NNODES="1", SLURM_CPUS_ON_NODE=str(os.cpu_count() or 1),
+                   SLURM_JOB_NODELIST=HOST)
+        if job["resources"].get("cpus_per_task"):
+            env.update(SLURM_CPUS_PER_TASK=str(job["resources"]["cpus"]))
+        if index is not None:
+            env.update(SLURM_ARRAY_JOB_ID=str(jobid), SLURM_ARRAY_TASK_ID=str(index))
+    else:
+        env.update(PBS_JOBID=f"{jobid}.fakeserver", PBS_O_WORKDIR=job["chdir"], NCPUS=str(os.cpu_count() or 1))
+        if index is not None:
+            env.update(PBS_JOBID=f"{jobid}[{index}].fakeserver", PBS_ARRAY_INDEX=str(index))
+    return env
+
+
+def launch(job, index=None):
+    with open(job["output"] or os.devnull, "ab") as out:
+        return subprocess.Popen(
+            ["bash", job["script"]], cwd=job["chdir"], env=job_env(job, index),
+            stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+
+
+def run_job(jobid):
+    job = load(jobid)
+    deadline = job["submit_time"] + job["queue_wait"]
+    while time.time() < deadline:
+        if load(jobid)["state"] != "PENDING":
+            return
+        time.sleep(0.05)
+    if job["array"]:
+        run_array(jobid)
+        return
+
+    with Lock():
+        if load(jobid)["state"] != "PENDING":
+            return
+        proc = launch(job)
+        job = load(jobid)
+        job.update(state="RUNNING", start_time=time.time(), pgid=proc.pid)
+        save(job)
+
+    preempted = False
+    while proc.poll() is None:
+        if job["preempt_after"] is not None and time.time() - job["start_time"] >= job["preempt_after"]:
+            kill_group(proc.pid)
+            preempted = True
+            proc.wait()
+            break
+        time.sleep(0.05)
+
+    # The runner's only child is the job, so its reaped children are the job's processes
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with Lock():
+        job = load(jobid)
+        job["usage"] = {"cpu_s": usage.ru_utime + usage.ru_stime, "max_rss_kb": usage.ru_maxrss}
+        if job["state"] == "RUNNING":
+            if preempted:
+                job["state"] = "PREEMPTED"
+            else:
+                job["state"] = "COMPLETED" if proc.returncode == 0 else "FAILED"
+            job["exit_code"] = proc.returncode if not preempted else -11
+        job["end_time"] = job["end_time"] or time.time()
+        save(job)
+
+
+def run_array(jobid):
+    """Run the elements of an array job, at most ``throttle`` at a time."""
+    job = load(jobid)
+    waiting = [str(index) for index in job["array"]["indices"]]
+    limit = job["array"]["throttle"] or len(waiting)
+    running = {}
+    while waiting or running:
+        with Lock():
+            job = load(jobid)
+            for index, proc in list(running.items()):
+                if proc.poll() is None:
+                    continue
+                element = job["elements"][index]
+                if element["state"] == "RUNNING":
+                    element.update(state="COMPLETED" if proc.returncode == 0 else "FAILED", exit_code=proc.returncode)
+                del running[index]
+            if job["state"] == "CANCELLED":
+                waiting = []
+            while waiting and len(running) < limit:
+                index = waiting.pop(0)
+                proc = launch(job, index)
+                running[index] = proc
+                job["elements"][index].update(state="RUNNING", pgid=proc.pid)
+                if job["state"] == "PENDING":
+                    job.update(state="RUNNING", start_time=time.time())
+            save(job)
+        time.sleep(0.05)
+
+    with Lock():
+        job = load(jobid)
+        if job["state"] == "RUNNING":
+            failed = any(e["state"] != "COMPLETED" for e in job["elements"].values())
+            job["state"] = "FAILED" if failed else "COMPLETED"
+            job["exit_code"] = 1 if failed else 0
+        job["end_time"] = job["end_time"] or time.time()
+        save(job)
+
+
+def kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def cancel(jobids):
+    for jobid in jobids:
+        with Lock():
+            job = load(jobid)
+            if job is None or job["state"] not in ACTIVE:
+                continue
+            pgids = [job["pgid"]] if job["state"] == "RUNNING" else []
+            for element in (job["elements"] or {}).values():
+                if element["state"] in ACTIVE:
+                    if element["state"] == "RUNNING":
+                        pgids.append(element["pgid"])
+                    element.update(state="CANCELLED", exit_code=-11)
+            job.update(state="CANCELLED", end_time=time.time(), exit_code=-11)
+            save(job)
+        for pgid in pgids:
+            if pgid:
+                kill_group(pgid)
+
+
+# ---------------------------------------------------------------------------
+# SLURM commands
+# ---------------------------------------------------------------------------
+
+def seconds(value, bare_unit=1):
+    """[D-]HH:MM:SS, MM:SS or a bare number of ``bare_unit`` seconds; None if unset."""
+    if not value:
+        return None
+    days, _, value = value.rpartition("-")
+    parts = [float(part) for part in value.split(":")]
+    total = parts[0] * bare_unit if len(parts) == 1 else 0
+    if len(parts) > 1:
+        for part in parts:
+            total = total * 60 + part
+    return int(total + float(days or 0) * 86400)
+
+
+def megabytes(value, bare_unit):
+    """32G, 4000M, 1gb, 512mb; a bare number is in ``bare_unit`` ("" for bytes). None if unset."""
+    if not value:
+        return None
+    number = value.rstrip("bBkKmMgGtT")
+    unit = (value[len(number):].lower().rstrip("b") or bare_unit).lower()
+    return int(float(number) * {"": 1 / 1024 ** 2, "k": 1 / 1024, "m": 1, "g": 1024, "t": 1024 ** 2}[unit])
+
+
+def hms(total):
+    total = int(total)
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+
+def elapsed(job):
+    if not job["start_time"]:
+        return 0
+    return (job["end_time"] or time.time()) - job["start_time"]
+
+
+def option_value(args, short, long_):
+    """Return the value of -x VALUE / --long=VALUE / --long VALUE, or None."""
+    for i, arg in enumerate(args):
+        if long_ and arg.startswith(long_ + "="):
+            return arg.split("=", 1)[1]
+        if arg in (short, long_) and i + 1 < len(args):
+            return args[i + 1]
+    return None
+
+
+def sbatch(args):
+    script = args[-1]
+    directives = parse_directives(script, "#SBATCH")
+    options = {}
+    for item in directives + [a for a in args[:-1] if a.startswith("--")]:
+        key, _, value = item.lstrip("-").partition("=")
+        options[key] = value
+    chdir = options.get("chdir") or os.getcwd()
+    output = options.get("output") or os.path.join(chdir, "slurm-%j.out")
+    array = parse_array(options["array"]) if options.get("array") else None
+    resources = {
+        "cpus": int(options.get("cpus-per-task") or 1),
+        "cpus_per_task": bool(options.get("cpus-per-task")),
+        "mem_mb": megabytes(options.get("mem"), "m"),
+        "time_limit": seconds(options.get("time"), bare_unit=60),
+    }
+    jobid = submit("slurm", script, options.get("job-name", os.path.basename(script)), output, chdir, array, resources)
+    if jobid is None:
+        return 1
+    if "%j" in output:
+        update(jobid, output=output.replace("%j", str(jobid)))
+    print(jobid if "--parsable" in args else f"Submitted batch job {jobid}")
+    return 0
+
+
+def slurm_rows(job):
+    """squeue rows of a job: one per running array element plus the pending range."""
+    if not job["elements"]:
+        return [(str(job["id"]), job["state"])]
+    rows = [(f"{job['id']}_{index}", "RUNNING") for index, element in job["elements"].items()
+            if element["state"] == "RUNNING"]
+    waiting = [index for index, element in job["elements"].items() if element["state"] == "PENDING"]
+    if waiting:
+        rows.append((f"{job['id']}_[{waiting[0]}-{waiting[-1]}]", "PENDING"))
+    return rows
+
+
+def squeue(args):
+    fmt = option_value(args, "-o", "--format") or "%i %P %j %u %t %M %D %R"
+    ids = option_value(args, "-j", "--jobs")
+    ids = set(ids.split(",")) if ids else None
+    states = option_value(args, "-t", "--states")
+    user = option_value(args, "-u", "--user")
+    if "--me" in args:
+        user = USER
+
+    rows = []
+    for job in all_jobs():
+        if not visible(job) or (ids and str(job["id"]) not in ids):
+            continue
+        if user and job["user"] != user:
+            continue
+        for row_id, state in slurm_rows(job):
+            if states and state not in states.upper().split(","):
+                continue
+            rows.append(dict(job, id=row_id, state=state))
+    if states and "PENDING" in states.upper():
+        rows += [None] * int(os.environ.get("FAKESCHED_PENDING_JOBS", "0"))
+
+    fields = {
+        "%i": lambda j: str(j["id"]) if j else "0",
+        "%t": lambda j: SLURM_CODES[j["state"]] if j else "PD",
+        "%T": lambda j: j["state"] if j else "PENDING",
+        "%N": lambda j: HOST if j and j["state"] == "RUNNING" else "",
+        "%P": lambda j: "debug",
+        "%j": lambda j: j["name"] if j else "other",
+        "%u": lambda j: j["user"] if j else "other",
+        "%M": lambda j: "0:00",
+        "%D": lambda j: "1",
+        "%R": lambda j: HOST if j and j["state"] == "RUNNING" else "(Priority)",
+        "%S": lambda j: start_time(j) if j else "N/A",
+    }
+    headers = {"%i": "JOBID", "%t": "ST", "%T": "STATE", "%N": "NODELIST", "%P": "PARTITION",
+               "%j": "NAME", "%u": "USER", "%M": "TIME", "%D": "NODES", "%R": "NODELIST(REASON)"}
+    tokens = fmt.split()
+    if not ("-h" in args or "--noheader" in args):
+        print(" ".join(headers.get(t, t) for t in tokens))
+    for job in rows:
+        print(" ".join(fields[t](job) if t in fields else t for t in tokens))
+    return 0
+
+
+def start_time(job):
+    """squeue %S: the start time of a running job, the expected one while pending."""
+    start = job["start_time"] if job["state"] != "PENDING" else estimated_start(job)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(start)) if start else "N/A"
+
+
+def slurm_exit_code(exit_code):
+    """sacct ExitCode is ``<return code>:<signal>``; killed jobs report signal 15."""
+    if exit_code is None:
+        return "0:0"
+    return f"{exit_code}:0" if exit_code >= 0 else "0:15"
+
+
+def sacct(args):
+    ids = (option_value(args, "-j", "--jobs") or "").split(",")
+    fields = (option_value(args, "-o", "--format") or "JobID,JobName,State,ExitCode").lower().split(",")
+    parsable = "-P" in args or "--parsable2" in args
+    if "--noheader" not in args and "-n" not in args:
+        print(("|" if parsable else " ").join(f.capitalize() for f in fields))
+    if os.environ.get("FAKESCHED_NO_ACCOUNTING"):
+        ids = []
+    for jobid in ids:
+        job = load(jobid) if jobid else None
+        if job is None:
+            continue
+        if job["elements"] and ("--array" in args or "-a" in args):
+            rows = [(f"{jobid}_{index}", e["state"], e["exit_code"]) for index, e in job["elements"].items()]
+        else:
+            rows = [(str(job["id"]), job["state"], job["exit_code"])]
+            # Without -X the batch step follows the allocation, with the step's MaxRSS
+            if job["start_time"] and not job["elements"] and "-X" not in args and "--allocations" not in args:
+                rows.append((f"{job['id']}.batch", job["state"], job["exit_code"]))
+        requested, usage = job["resources"], job["usage"] or {}
+        cpu_s = usage.get("cpu_s", 0)
+        for row_id, state, exit_code in rows:
+            values = {
+                "jobid": row_id, "jobname": job["name"], "state": state, "exitcode": slurm_exit_code(exit_code),
+                "elapsed": hms(elapsed(job)),
+                "totalcpu": f"{int(cpu_s) // 60:02d}:{cpu_s % 60:06.3f}" if cpu_s < 3600 else hms(cpu_s),
+                "alloccpus": str(requested["cpus"]),
+                "reqmem": f"{requested['mem_mb']}M" if requested["mem_mb"] else "0",
+                "timelimit": hms(requested["time_limit"]) if requested["time_limit"] else "UNLIMITED",
+                "maxrss": f"{usage.get('max_rss_kb', 0)}K" if row_id.endswith(".batch") else "",
+            }
+            if parsable:
+                print("|".join(values.get(f, "") for f in fields))
+            else:
+                print(" ".join(f"{values.get(f, ''):>10}" for f in fields))
+    return 0
+
+
+def scancel(args):
+    cancel([a for a in args if not a.startswith("-")])
+    return 0
+
+
+def scontrol(args):
+    if args[:2] == ["show", "hostnames"]:
+        for name in args[2:]:
+            print(name)
+        return 0
+    return 1
+
+
+# ---------------------------------------------------------------------------
+# PBS commands
+# ---------------------------------------------------------------------------
+
+def pbs_state(job):
+    return {"PENDING": "Q", "RUNNING": "R"}.get(job["state"], "C")
+
+
+def qsub(args):
+    script = args[-1]
+    options = {}
+    for directive in parse_directives(script, "#PBS"):
+        flag, _, value = directive.partition(" ")
+        options[flag] = value.strip()
+    chdir = os.getcwd()
+    output = options.get("-o") or os.path.join(chdir, "pbs.out")
+    array = parse_array(options["-J"]) if options.get("-J") else None
+    limits = {}
+    for directive in parse_directives(script, "#PBS -l"):
+        key, _, value = directive.partition("=")
+        if key == "select":
+            # select=<chunks>:ncpus=N:mem=M
+            limits.update(item.partition("=")[::2] for item in value.split(":")[1:])
+        else:
+            limits[key] = value
+    resources = {
+        "cpus": int(limits.get("ncpus") or 1),
+        "mem_mb": megabytes(limits.get("mem"), ""),
+        "time_limit": seconds(limits.get("walltime")),
+    }
+    jobid = submit("pbs", script, options.get("-N", os.path.basename(script)), output, chdir, array, resources)
+    if jobid is None:
+        return 1
+    print(f"{jobid}{'[]' if array else ''}.fakeserver")
+    return 0
+
+
+def qstat(args):
+    ids = [a.split(".")[0].split("[")[0] for a in args if a[:1].isdigit()]
+    history = "-x" in args
+    jobs = [j for j in all_jobs() if (history or visible(j)) and (not ids or str(j["id"]) in ids)]
+
+    if "-Q" in args:
+        queued = sum(1 for j in all_jobs() if j["state"] == "PENDING")
+        queued += int(os.environ.get("FAKESCHED_PENDING_JOBS", "0"))
+        print("Queue: workq")
+        print(f"    state_count = Transit:0 Queued:{queued} Held:0 Waiting:0 Running:0 Exiting:0")
+        return 0
+
+    if "-f" in args and "-F" in args:
+        print(json.dumps({"Jobs": {
+            f"{j['id']}.fakeserver": {
+                "Job_Name": j["name"], "Job_Owner": f"{j['user']}@fakehost",
+                "job_state": pbs_state(j), "Exit_status": j["exit_code"],
+                **({"estimated": {"start_time": time.ctime(estimated_start(j))}} if estimated_start(j) else {}),
+            } for j in jobs
+        }}))
+        return 0
+
+    if ids and not jobs:
+        print(f"qstat: Unknown Job Id {ids[0]}.fakeserver", file=sys.stderr)
+        return 153
+
+    if "-f" in args:
+        for j in jobs:
+            if j["elements"]:
+                # Array parent (state B while any element is active), then with -t each subjob
+                print(f"Job Id: {j['id']}[].fakeserver")
+                print(f"    Job_Name = {j['name']}")
+                print(f"    job_state = {'B' if j['state'] in ACTIVE else 'F'}")
+                print("    array = True")
+                if "-t" not in args:
+                    continue
+                for index, element in j["elements"].items():
+                    print(f"Job Id: {j['id']}[{index}].fakeserver")
+                    print(f"    job_state = {pbs_state(element).replace('C', 'X')}")
+                    if element["exit_code"] is not None:
+                        print(f"    Exit_status = {element['exit_code']}")
+                continue
+            print(f"Job Id: {j['id']}.fakeserver")
+            print(f"    Job_Name = {j['name']}")
+            print(f"    Job_Owner = {j['user']}@fakehost")
+            print(f"    job_state = {pbs_state(j)}")
+            if j["state"] == "RUNNING":
+                print(f"    exec_host = {HOST}/0")
+            if j["exit_code"] is not None:
+                print(f"    Exit_status = {j['exit_code']}")
+            requested, usage = j["resources"], j["usage"]
+            print(f"    Resource_List.ncpus = {requested['cpus']}")
+            if requested["mem_mb"]:
+                print(f"    Resource_List.mem = {requested['mem_mb']}mb")
+            if requested["time_limit"]:
+                print(f"    Resource_List.walltime = {hms(requested['time_limit'])}")
+            if usage:
+                print(f"    resources_used.cput = {hms(usage['cpu_s'])}")
+                print(f"    resources_used.mem = {usage['max_rss_kb']}kb")
+                print(f"    resources_used.ncpus = {requested['cpus']}")
+                print(f"    resources_used.walltime = {hms(elapsed(j))}")
+            if estimated_start(j):
+                print(f"    estimated.start_time = {time.ctime(estimated_start(j))}")
+        return 0
+
+    user = option_value(args, "-u", None)
+    if user:
+        print("fakeserver:")
+        print("Job ID          Username Queue    Jobname    SessID NDS TSK Memory Time  S Time")
+        print("--------------- -------- -------- ---------- ------ --- --- ------ ----- - -----")
+        for j in jobs:
+            if j["user"] == user:
+                print(f"{j['id']}.fakeserver {j['user']} workq {j['name'][:10]} 0 1 1 -- 01:00 {pbs_state(j)} 00:00")
+        return 0
+
+    print("Job id            Name             User              Time Use S Queue")
+    print("----------------  ---------------- ----------------  -------- - -----")
+    for j in jobs:
+        print(f"{j['id']}.fakeserver  {j['name'][:16]:<16} {j['user']:<16}  00:00:00 {pbs_state(j)} workq")
+    return 0
+
+
+def qdel(args):
+    cancel([a.split(".")[0] for a in args if not a.startswith("-")])
+    return 0
+
+
+COMMANDS = {
+    "sbatch": sbatch, "squeue": squeue, "sacct": sacct, "scancel": scancel, "scontrol": scontrol,
+    "qsub": qsub, "qstat": qstat, "qdel": qdel,
+}
+
+
+def main(argv):
+    if argv[0] == "_run":
+        run_job(argv[1])
+        return 0
+    log_call(argv)
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,143 @@
+"""Stand-in ``ssh`` for executing the workflow scripts locally.
+
+Every host is the local machine: the remote command runs with ``bash -c`` in
+the caller's working directory. Connection setup is what is simulated:
+
+    FAKESSH_HANDSHAKE    seconds a new connection takes to authenticate (default 0)
+
+unless an OpenSSH ControlMaster for the host is up. ``-o ControlMaster=auto``
+(or ``yes``/``-M``) with ``-o ControlPath=...`` (or ``-S``; ``%C``, ``%h``,
+``%r``, ``%p`` and ``%%`` are expanded) and ``-o ControlPersist=<time>`` leaves
+the control file behind, and later connections through it skip the handshake
+until it has been idle for ``ControlPersist``. ``-O check`` and ``-O exit``
+work on it.
+
+Every connection is logged to ``$FAKESCHED_STATE/ssh.log``: epoch, tab,
+``handshake`` or ``reuse``, tab, host.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+
+STATE = pathlib.Path(os.environ.get("FAKESCHED_STATE", "/tmp/fakesched"))
+USER = os.environ.get("USER", "user")
+# Options that take an argument; every other option is a flag
+WITH_ARGUMENT = set("BbcDEeFIiJLlmOoPpQRSWw")
+
+
+def parse(argv):
+    options, flags, control = {}, set(), None
+    i = 0
+    while i < len(argv) and argv[i].startswith("-"):
+        arg = argv[i]
+        i += 1
+        for j, flag in enumerate(arg[1:], start=1):
+            if flag not in WITH_ARGUMENT:
+                flags.add(flag)
+                continue
+            value = arg[j + 1:]
+            if not value:
+                value = argv[i]
+                i += 1
+            if flag == "o":
+                key, _, option = value.partition("=")
+                options[key.lower()] = option
+            elif flag == "S":
+                options["controlpath"] = value
+            elif flag == "O":
+                control = value
+            break
+    if "M" in flags:
+        options.setdefault("controlmaster", "yes")
+    destination = argv[i]
+    return options, flags, control, destination, " ".join(argv[i + 1:])
+
+
+def seconds(value):
+    """ControlPersist: yes (forever), no/0 (not kept), or a time like 300, 10m, 1h."""
+    value = value.strip().lower()
+    if value in ("yes", "true"):
+        return float("inf")
+    if value in ("", "no", "false", "0"):
+        return 0
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def control_path(options, user, host, port):
+    path = options.get("controlpath", "")
+    if not path or path.lower() == "none":
+        return None
+    digest = hashlib.sha1(f"localhost{host}{port}{user}".encode()).hexdigest()
+    for token, value in (("%%", "\0"), ("%C", digest), ("%h", host), ("%r", user), ("%p", port)):
+        path = path.replace(token, value)
+    return pathlib.Path(os.path.expanduser(path.replace("\0", "%")))
+
+
+def alive(path):
+    try:
+        master = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return False
+    return master["expires"] is None or master["expires"] >= time.time()
+
+
+def keep(path, persist):
+    expires = None if persist == float("inf") else time.time() + persist
+    path.write_text(json.dumps({"pid": os.getpid(), "expires": expires}))
+
+
+def log(kind, host):
+    STATE.mkdir(parents=True, exist_ok=True)
+    with open(STATE / "ssh.log", "a") as handle:
+        handle.write(f"{time.time():.6f}\t{kind}\t{host}\n")
+
+
+def main(argv):
+    options, flags, control, destination, command = parse(argv)
+    user, _, host = destination.rpartition("@")
+    path = control_path(options, user or USER, host, options.get("port", "22"))
+    master = options.get("controlmaster", "no").lower()
+    persist = seconds(options.get("controlpersist", "no"))
+
+    if control is not None:
+        up = path is not None and alive(path)
+        if control == "check" and up:
+            print(f"Master running (pid={json.loads(path.read_text())['pid']})", file=sys.stderr)
+            return 0
+        if control == "exit" and up:
+            path.unlink()
+            print("Exit request sent.", file=sys.stderr)
+            return 0
+        print(f"Control socket connect({path}): No such file or directory", file=sys.stderr)
+        return 255
+
+    if path is not None and master in ("auto", "autoask", "no") and alive(path):
+        log("reuse", host)
+    else:
+        log("handshake", host)
+        time.sleep(float(os.environ.get("FAKESSH_HANDSHAKE", "0")))
+    if path is not None and master in ("auto", "autoask", "yes", "ask") and persist:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        keep(path, persist)
+
+    rc = 0
+    if command and "N" not in flags:
+        stdin = subprocess.DEVNULL if "n" in flags or "f" in flags else None
+        rc = subprocess.run(["bash", "-c", command], stdin=stdin, env=dict(os.environ, FAKESSH_HOST=host)).returncode
+    # ControlPersist counts from the end of the last session
+    if path is not None and persist and alive(path):
+        keep(path, persist)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
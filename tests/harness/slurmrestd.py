@@ -0,0 +1,86 @@
+"""Minimal slurmrestd stand-in backed by the fake scheduler's job records.
+
+Serves the two endpoints the scheduler backend uses, in the v0.0.40 shape:
+
+    GET    /slurm/v0.0.40/job/<id>   job_state list, nodes, start_time and exit_code.return_code
+    DELETE /slurm/v0.0.40/job/<id>   cancel the job
+
+    with SlurmRestd(state_dir) as restd:
+        env["SLURMRESTD_URL"] = restd.url
+        ...
+        assert restd.requests == [("GET", "/slurm/v0.0.40/job/1001")]
+"""
+
+import http.server
+import json
+import pathlib
+import re
+import threading
+
+from tests.harness import fakesched
+
+
+JOB_PATH = re.compile(r"^/slurm/v0\.0\.40/job/(\d+)$")
+
+
+class SlurmRestd:
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(("GET", self.path))
+                job = server.job(self.path)
+                if job is None:
+                    return self.reply(404, {"errors": [{"error": "Invalid job id specified"}]})
+                code = job["exit_code"] if job["exit_code"] is not None else 0
+                start = job["start_time"] or fakesched.estimated_start(job) or 0
+                self.reply(200, {"jobs": [{
+                    "job_id": job["id"],
+                    "job_state": [job["state"]],
+                    "nodes": fakesched.HOST if job["state"] == "RUNNING" else "",
+                    "start_time": {"set": True, "infinite": False, "number": int(start)},
+                    "exit_code": {
+                        "status": ["SUCCESS" if code == 0 else "ERROR"],
+                        "return_code": {"set": True, "infinite": False, "number": max(code, 0)},
+                    },
+                }]})
+
+            def do_DELETE(self):
+                server.requests.append(("DELETE", self.path))
+                job = server.job(self.path)
+                if job is None:
+                    return self.reply(404, {"errors": [{"error": "Invalid job id specified"}]})
+                fakesched.cancel([str(job["id"])])
+                self.reply(200, {"errors": []})
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def job(self, path):
+        match = JOB_PATH.match(path)
+        return fakesched.load(match.group(1)) if match else None
+
+    def __enter__(self):
+        # The stub runs in the test process and reads the execution's job records
+        self.saved_state, fakesched.STATE = fakesched.STATE, pathlib.Path(self.state_dir)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        fakesched.STATE = self.saved_state
@@ -1,3 +1,6 @@
+import subprocess
+
+
 def get_job(workflow_data, job_name):
     jobs = workflow_data.get("jobs", {})
     if job_name not in jobs:
@@ -20,9 +23,28 @@ def get_step_run(job, step_name):
     return run
 
 
+def sources(script, library):
+    """Whether ``script`` sources the copy of ``tools/<library>`` staged for the run."""
+    return f'source "${{WORKFLOW_LIB}}/{library}"' in script
+
+
 def get_step_cleanup(job, step_name):
     step = find_step(job, step_name)
     cleanup = step.get("cleanup")
     if cleanup is None:
         raise AssertionError(f"Expected step '{step_name}' to have a cleanup block")
     return cleanup
+
+
+def library_script(library, snippet, prelude=""):
+    """A bash script that runs ``prelude``, sources ``library`` and then runs ``snippet``."""
+    return f"{prelude}\nsource {library}\n{snippet}\n"
+
+
+def run_library(cwd, library, snippet, prelude="", check=True, timeout=30, env=None):
+    """Run ``snippet`` in ``cwd`` with one of the shared bash libraries sourced."""
+    result = subprocess.run(["bash", "-c", library_script(library, snippet, prelude)], cwd=cwd,
+                            capture_output=True, text=True, timeout=timeout, env=env)
+    if check:
+        assert result.returncode == 0, result.stderr
+    return result
@@ -0,0 +1,42 @@
+import pytest
+
+from tests.helpers import run_library
+from tools import sched_sync
+
+
+def run(tmp_path, snippet, scheduler="slurm", mode="suggest"):
+    prelude = f"SCHED_TYPE={scheduler}\nRIGHTSIZE_MODE={mode}"
+    return run_library(tmp_path, sched_sync.JOB_LIBRARY, snippet, prelude).stdout.strip()
+
+
+@pytest.mark.parametrize("scheduler, expected", [("pbs", "8gb 1536mb"), ("slurm", "8G 1536M")])
+def test_memory_is_formatted_for_the_scheduler(tmp_path, scheduler, expected):
+    assert run(tmp_path, 'echo "$(format_mem 8192) $(format_mem 1536)"', scheduler) == expected
+
+
+def test_history_recommends_from_completed_runs(tmp_path):
+    # <time> <jobid> <state> <elapsed> <cpu time> <cpus> <max rss> <req mem> <limit>
+    rows = ["1\t1\tCOMPLETED\t600\t1200\t8\t1000\t8192\t3600",
+            "2\t2\tCOMPLETED\t1000\t1500\t8\t1500\t8192\t3600",
+            "3\t3\tFAILED\t10\t10\t8\t10\t8192\t3600"]
+    (tmp_path / "history.tsv").write_text("\n".join(rows) + "\n")
+    assert run(tmp_path, "rightsize_history history.tsv") == "2 3 2048 1800"
+
+    rows.append("4\t4\tOUT_OF_MEMORY\t100\t100\t8\t8192\t8192\t3600")
+    (tmp_path / "history.tsv").write_text("\n".join(rows) + "\n")
+    assert run(tmp_path, "rightsize_history history.tsv") == "2 3 - 1800"
+
+
+@pytest.mark.parametrize("mode, applied", [("suggest", "8"), ("apply", "2")])
+def test_rightsize_applies_only_when_asked(tmp_path, mode, applied):
+    snippet = 'cpus=8; rightsize cpus 8 2 8 echo && cpus=${REPLY}; echo "${cpus}"'
+    lines = run(tmp_path, snippet, mode=mode).splitlines()
+    assert lines[-1] == applied
+    assert "Right-sizing cpus: 8 -> 2" in lines[0]
+    # Requests close to the recommendation are left alone
+    assert run(tmp_path, "rightsize cpus 3 3 3 echo || echo kept", mode="apply") == "kept"
+
+
+def test_time_and_memory_requests_are_parsed(tmp_path):
+    snippet = 'echo "$(to_seconds 1-02:00:00 60) $(to_seconds 90 60) $(to_mb 4gb "") $(to_mb 512 m)"'
+    assert run(tmp_path, snippet) == "93600 5400 4096 512"
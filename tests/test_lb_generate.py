@@ -0,0 +1,107 @@
+import json
+import subprocess
+
+import pytest
+import yaml
+
+from tests.conftest import WORKFLOW_V5_PATH
+from tests.harness import Execution
+from tools import lb_generate
+
+
+def site_scripts(workflow):
+    for job in workflow["jobs"].values():
+        for step in job["steps"]:
+            for kind in ("run", "cleanup"):
+                if kind in step:
+                    yield step[kind]
+
+
+def test_committed_workflow_is_up_to_date():
+    assert lb_generate.generate(lb_generate.DEFAULT_SITES) == WORKFLOW_V5_PATH.read_text(encoding="utf-8"), (
+        "v5.0.yaml differs from tools/lb_template; run python -m tools.lb_generate --output v5.0.yaml"
+    )
+
+
+@pytest.mark.parametrize("sites", [1, 32, 40])
+def test_generated_workflow_structure(sites):
+    workflow = yaml.safe_load(lb_generate.generate(sites))
+    site_jobs = [f"site_{i}" for i in range(sites)]
+
+    assert set(workflow["jobs"]) == {"initialize", "log", "cleanup", "collect", *site_jobs}
+    assert workflow["jobs"]["cleanup"]["needs"] == [*site_jobs, "log"]
+    for i, name in enumerate(site_jobs):
+        job = workflow["jobs"][name]
+        assert job["if"] == f"${{{{ inputs.sites_{i}.enabled == true }}}}"
+        assert job["working-directory"].endswith(f"lb_${{PW_JOB_ID}}/site_{i}")
+        assert job["steps"][0]["name"] == f"Submit Job to Site {i}"
+        assert f'SITE_ID="site_{i}"' in job["steps"][0]["run"]
+
+    inputs = workflow["on"]["execute"]["inputs"]
+    for i in range(sites):
+        items = inputs[f"sites_{i}"]["items"]
+        assert items["enabled"]["default"] is (i == 0)
+        assert items["priority"]["default"] == min(i + 1, 100)
+        assert items["name"]["default"] == f"Site-{i}"
+
+    initialize = workflow["jobs"]["initialize"]["steps"][0]["run"]
+    table = [line for line in initialize.splitlines() if line.startswith("site_")]
+    assert table == [
+        f"site_{i}|${{{{ inputs.sites_{i}.enabled }}}}|${{{{ inputs.sites_{i}.name }}}}|${{{{ inputs.sites_{i}.priority }}}}"
+        f"|${{{{ inputs.sites_{i}.cores }}}}"
+        for i in range(sites)
+    ]
+
+
+def test_generated_scripts_parse():
+    for script in site_scripts(yaml.safe_load(lb_generate.generate(32))):
+        result = subprocess.run(["bash", "-n"], input=script, text=True, capture_output=True)
+        assert result.returncode == 0, result.stderr
+
+
+def test_rejects_zero_sites():
+    with pytest.raises(ValueError):
+        lb_generate.generate(0)
+
+
+def test_check_reports_stale_output(tmp_path, capsys):
+    output = tmp_path / "v5.yaml"
+    assert lb_generate.main(["--sites", "3", "--output", str(output)]) == 0
+    assert lb_generate.main(["--sites", "3", "--output", str(output), "--check"]) == 0
+    assert lb_generate.main(["--sites", "4", "--output", str(output), "--check"]) == 1
+    assert "out of date" in capsys.readouterr().err
+
+
+def test_32_site_race_cancels_losers_with_one_call(tmp_path):
+    sites = 32
+    path = tmp_path / "v5_32.yaml"
+    path.write_text(lb_generate.generate(sites), encoding="utf-8")
+    inputs = {"execution_mode": "race", "script": "echo payload", "log_rate_limit": 0}
+    for i in range(sites):
+        inputs.update({
+            f"sites_{i}.enabled": True,
+            f"sites_{i}.scheduler": True,
+            f"sites_{i}.resource": {"ip": "clusterA", "schedulerType": "slurm"},
+        })
+    execution = Execution(path, tmp_path / "run", inputs)
+
+    assert execution.run("initialize").returncode == 0
+    log = execution.start("log")
+    # site_0 starts once every site has had time to submit, so all losers hold a jobid
+    processes = [
+        execution.start(f"site_{i}", env={"FAKESCHED_QUEUE_WAIT": "5" if i == 0 else "120"})
+        for i in range(sites)
+    ]
+    results = [execution.wait(process) for process in processes]
+    summary = execution.run("cleanup")
+    streamed = execution.wait(log)
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results if r.returncode]
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["total_sites"] == sites
+    assert report["winner"] == "site_0"
+    assert report["completed"] == 1 and report["cancelled"] == sites - 1
+    scancels = [args for _, command, args in execution.calls() if command == "scancel"]
+    assert len(scancels) == 1 and len(scancels[0]) == sites - 1
+    assert "[site_0] payload" in streamed.output
@@ -0,0 +1,56 @@
+from tests.helpers import run_library
+from tools import sched_sync
+
+
+def run(tmp_path, snippet, check=True):
+    return run_library(tmp_path, sched_sync.STATE_LIBRARY, snippet, "set -e\nSITE_ID=site_0", check=check)
+
+
+def test_last_value_of_a_key_wins(tmp_path):
+    result = run(tmp_path, "\n".join([
+        "state_set . jobid 1 name 'Site A'", "state_set . jobid 2", "state_set . final_state ''",
+        'state_get . jobid; echo "${REPLY}"', 'state_get . name; echo "${REPLY}"',
+        'state_get . final_state none; echo "${REPLY}"',
+    ]))
+
+    assert result.stdout.splitlines() == ["2", "Site A", "none"]
+    assert [line.split("\t")[1] for line in (tmp_path / "state.log").read_text().splitlines()] == \
+        ["jobid", "name", "jobid", "final_state"]
+
+
+def test_status_follows_the_state_machine(tmp_path):
+    run(tmp_path, "\n".join([
+        "state_set . status PENDING", "state_status SUBMITTING", "state_status SUBMITTED jobid 7",
+        "state_status SUBMITTED", "state_status RUNNING", "state_status FAILED final_state NODE_FAIL",
+        "state_status SUBMITTING", "state_status SUBMITTED jobid 8", "state_status COMPLETED",
+    ]))
+
+    statuses = [line.split("\t")[2] for line in (tmp_path / "state.log").read_text().splitlines()
+                if line.split("\t")[1] == "status"]
+    assert statuses == ["PENDING", "SUBMITTING", "SUBMITTED", "RUNNING", "FAILED", "SUBMITTING", "SUBMITTED",
+                        "COMPLETED"]
+
+
+def test_invalid_transition_is_refused(tmp_path):
+    result = run(tmp_path, "state_set . status PENDING\nstate_status COMPLETED\necho unreachable", check=False)
+
+    assert result.returncode == 1
+    assert "invalid status transition PENDING -> COMPLETED" in result.stderr
+    assert "unreachable" not in result.stdout
+    assert run(tmp_path, "state_status RUNNING || echo refused").stdout == "refused\n"
+    assert (tmp_path / "state.log").read_text().count("\tstatus\t") == 1
+
+
+def test_compacted_snapshot_holds_every_site(tmp_path):
+    for site in ("site_0", "site_1", "site_2"):
+        (tmp_path / site).mkdir()
+    result = run(tmp_path, "\n".join([
+        "state_set site_0 status PENDING name 'Site A'", "state_set site_0 status RUNNING",
+        "state_set site_1 status PENDING", "state_compact state.tsv site_*", "state_load state.tsv",
+        'echo "${STATE[site_0/status]} ${STATE[site_0/name]} ${STATE[site_1/status]} ${#STATE[@]}"',
+    ]))
+
+    assert result.stdout == "RUNNING Site A PENDING 3\n"
+    assert (tmp_path / "state.tsv").read_text().splitlines() == [
+        "site_0\tstatus\tRUNNING", "site_0\tname\tSite A", "site_1\tstatus\tPENDING",
+    ]
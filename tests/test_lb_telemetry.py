@@ -0,0 +1,95 @@
+import json
+
+from tests.helpers import get_job, get_step_run
+from tools import lb_telemetry, sched_sync
+
+
+def write_site_events(coord_dir, site, events):
+    site_dir = coord_dir / site
+    site_dir.mkdir(parents=True)
+    with open(site_dir / "events.jsonl", "w", encoding="utf-8") as handle:
+        for event, epoch in events:
+            handle.write(json.dumps({
+                "src": site, "name": "alpha", "resource": "cluster-a", "partition": "gpu",
+                "qos": "normal", "jobid": "1", "event": event, "epoch": epoch,
+            }) + "\n")
+        handle.write("not json\n")
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert lb_telemetry.percentile(values, 50) == 50
+    assert lb_telemetry.percentile(values, 95) == 95
+    assert lb_telemetry.percentile(values, 99) == 99
+    assert lb_telemetry.percentile([7], 99) == 7
+
+
+def test_ingest_is_idempotent(tmp_path):
+    coord_dir = tmp_path / "lb_42"
+    write_site_events(coord_dir, "site_0", [("submitted", 100.0), ("started", 130.0), ("ended", 190.0)])
+    db = lb_telemetry.connect(str(tmp_path / "lb_telemetry.db"))
+    assert lb_telemetry.ingest(db, str(coord_dir)) == 3
+    lb_telemetry.ingest(db, str(coord_dir))
+    assert db.execute("SELECT COUNT(*) FROM events WHERE execution_id = '42'").fetchone()[0] == 3
+
+
+def test_report_groups_queue_wait_and_runtime(tmp_path):
+    db = lb_telemetry.connect(str(tmp_path / "lb_telemetry.db"))
+    for n, wait in enumerate((10, 20, 30)):
+        coord_dir = tmp_path / f"lb_{n}"
+        write_site_events(coord_dir, "site_0", [("submitted", 0.0), ("started", wait), ("ended", wait + 60)])
+        lb_telemetry.ingest(db, str(coord_dir))
+
+    rows = lb_telemetry.report(db, by="qos")
+    assert len(rows) == 1
+    key, n_wait, n_run, stats = rows[0]
+    assert key == ("alpha", "gpu", "normal")
+    assert n_wait == n_run == 3
+    assert stats == [20, 30, 30, 60, 60, 60]
+
+
+def test_report_tolerates_jobs_that_never_started(tmp_path):
+    coord_dir = tmp_path / "lb_1"
+    write_site_events(coord_dir, "site_0", [("submitted", 0.0), ("cancelled", 5.0)])
+    db = lb_telemetry.connect(str(tmp_path / "lb_telemetry.db"))
+    lb_telemetry.ingest(db, str(coord_dir))
+    (_, n_wait, n_run, stats), = lb_telemetry.report(db)
+    assert n_wait == n_run == 0
+    assert stats == [None] * 6
+    assert "-" in lb_telemetry.format_report(lb_telemetry.report(db))
+
+
+def test_workflow_embeds_current_module(v5_workflow_data):
+    assert sched_sync.main(["--check"]) == 0
+    run = get_step_run(get_job(v5_workflow_data, "cleanup"), "Generate Summary Report")
+    assert sched_sync.TELEMETRY_BEGIN in run
+    assert "python3 - record ../lb_telemetry.db ." in run
+
+
+def test_record_merges_site_events_in_time_order(tmp_path):
+    coord_dir = tmp_path / "lb_7"
+    write_site_events(coord_dir, "site_0", [("submitted", 100.0), ("started", 130.0)])
+    write_site_events(coord_dir, "site_1", [("submitted", 110.0)])
+    db_path = tmp_path / "lb_telemetry.db"
+
+    assert lb_telemetry.main(["record", str(db_path), str(coord_dir)]) == 0
+    merged = [json.loads(line) for line in (coord_dir / "events.jsonl").read_text().splitlines()]
+    assert [(event["src"], event["epoch"]) for event in merged] == [
+        ("site_0", 100.0), ("site_1", 110.0), ("site_0", 130.0)]
+    db = lb_telemetry.connect(str(db_path))
+    assert db.execute("SELECT COUNT(*) FROM events WHERE execution_id = '7'").fetchone()[0] == 3
+
+
+def test_report_counts_each_attempt_of_a_retried_site(tmp_path):
+    coord_dir = tmp_path / "lb_1"
+    (coord_dir / "site_0").mkdir(parents=True)
+    with open(coord_dir / "site_0" / "events.jsonl", "w", encoding="utf-8") as handle:
+        for jobid, event, epoch in (("1", "submitted", 0.0), ("1", "started", 10.0), ("1", "ended", 20.0),
+                                    ("2", "submitted", 50.0), ("2", "started", 90.0), ("2", "ended", 150.0)):
+            handle.write(json.dumps({"src": "site_0", "name": "alpha", "jobid": jobid,
+                                     "event": event, "epoch": epoch}) + "\n")
+    db = lb_telemetry.connect(str(tmp_path / "lb_telemetry.db"))
+    lb_telemetry.ingest(db, str(coord_dir))
+    (_, n_wait, n_run, stats), = lb_telemetry.report(db)
+    assert n_wait == n_run == 2
+    assert stats == [10, 40, 40, 10, 60, 60]
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import time
+
+from tests.helpers import library_script
+from tools import sched_sync
+
+
+def wait(tmp_path, mode, timeout, *files, env=None):
+    script = library_script(sched_sync.MARKER_LIBRARY, f'echo "${{WATCH_MODE}}"\n'
+                            f'wait_for_markers {timeout} {" ".join(files)}', f"WATCH_MODE={mode}")
+    return subprocess.Popen(["bash", "-c", script], cwd=tmp_path, stdout=subprocess.PIPE, text=True, env=env)
+
+
+def fake_inotifywait(tmp_path, body):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "inotifywait").write_text(f"#!/bin/bash\n{body}\n")
+    (bin_dir / "inotifywait").chmod(0o755)
+    return {**os.environ, "PATH": f"{bin_dir}:{os.environ['PATH']}"}
+
+
+def test_returns_when_a_marker_appears(tmp_path):
+    started = time.monotonic()
+    process = wait(tmp_path, "poll", 30, "job.started", "sub/job.ended")
+    assert process.stdout.readline().strip() == "poll"
+    time.sleep(0.5)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "job.ended").touch()
+
+    assert process.wait(timeout=10) == 0
+    assert time.monotonic() - started < 5
+
+
+def test_marker_created_while_the_watch_starts_is_seen(tmp_path):
+    # The marker appears after the first check but before the watch is up,
+    # so no event is ever raised for it
+    env = fake_inotifywait(tmp_path, 'touch job.started\necho "Watches established." >&2\nexec sleep 60')
+    started = time.monotonic()
+    process = wait(tmp_path, "inotify", 30, "job.started", env=env)
+    assert process.stdout.readline().strip() == "inotify"
+
+    assert process.wait(timeout=10) == 0
+    assert time.monotonic() - started < 5
+
+
+def test_falls_back_to_polling_when_the_watch_ends(tmp_path):
+    env = fake_inotifywait(tmp_path, 'echo "Watches established." >&2')
+    started = time.monotonic()
+    process = wait(tmp_path, "inotify", 30, "job.started", env=env)
+    assert process.stdout.readline().strip() == "inotify"
+    time.sleep(1)
+    (tmp_path / "job.started").touch()
+
+    assert process.wait(timeout=10) == 0
+    assert time.monotonic() - started < 5
+
+
+def test_returns_after_the_timeout(tmp_path):
+    started = time.monotonic()
+    process = wait(tmp_path, "auto", 2, "job.started")
+    assert process.stdout.readline().strip() in ("inotify", "poll")
+
+    # The deadline is kept in whole seconds, so the wait ends within the last one
+    assert process.wait(timeout=10) == 0
+    assert 1 <= time.monotonic() - started < 6
+    assert not os.path.exists(tmp_path / "job.started")
@@ -0,0 +1,59 @@
+import gzip
+import os
+import signal
+import subprocess
+import time
+
+from tests.helpers import library_script
+from tools import sched_sync
+
+
+def start(tmp_path, body, interval=30, compress="false"):
+    (tmp_path / "buffer").mkdir(exist_ok=True)
+    script = tmp_path / "job.sh"
+    script.write_text(library_script(sched_sync.BUFFER_LIBRARY, f"OUT_BUFFER_INTERVAL={interval}\n"
+                                     f"out_buffer_start {tmp_path / 'run.out'} {compress}\n{body}"))
+    with open(tmp_path / "run.out", "wb") as out:
+        return subprocess.Popen(["bash", str(script)], cwd=tmp_path, stdout=out, stderr=subprocess.STDOUT,
+                                env=dict(os.environ, OUT_BUFFER_DIR=str(tmp_path / "buffer")), start_new_session=True)
+
+
+def test_output_is_complete_and_exit_code_kept(tmp_path):
+    job = start(tmp_path, 'for i in $(seq 1000); do echo "line ${i}"; done; echo oops >&2; exit 3')
+
+    assert job.wait(timeout=30) == 3
+    assert (tmp_path / "run.out").read_text().splitlines() == [f"line {i}" for i in range(1, 1001)] + ["oops"]
+    assert list((tmp_path / "buffer").iterdir()) == []
+
+
+def test_output_is_flushed_on_the_interval(tmp_path):
+    job = start(tmp_path, "echo first; sleep 4; echo second", interval=1)
+    time.sleep(0.3)
+    # Still in the node-local buffer
+    assert (tmp_path / "run.out").read_text() == ""
+    time.sleep(2)
+    assert (tmp_path / "run.out").read_text() == "first\n"
+
+    assert job.wait(timeout=30) == 0
+    assert (tmp_path / "run.out").read_text() == "first\nsecond\n"
+
+
+def test_termination_flushes_the_buffer(tmp_path):
+    job = start(tmp_path, "echo before; sleep 60; echo never")
+    time.sleep(0.5)
+    os.killpg(job.pid, signal.SIGTERM)
+
+    assert job.wait(timeout=30) == 143
+    assert (tmp_path / "run.out").read_text().startswith("before\n")
+    assert "never" not in (tmp_path / "run.out").read_text()
+    assert list((tmp_path / "buffer").iterdir()) == []
+
+
+def test_compressed_archive_holds_the_whole_log(tmp_path):
+    job = start(tmp_path, "echo first; sleep 2; seq 5000", interval=1, compress="true")
+
+    assert job.wait(timeout=30) == 0
+    output = (tmp_path / "run.out").read_bytes()
+    assert output == b"first\n" + "".join(f"{i}\n" for i in range(1, 5001)).encode()
+    # One gzip member per flush
+    assert gzip.decompress((tmp_path / "run.out.gz").read_bytes()) == output
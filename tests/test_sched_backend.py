@@ -0,0 +1,263 @@
+import json
+import os
+import subprocess
+import time
+
+import pytest
+
+from tests.harness import install_fake_scheduler
+from tests.harness.slurmrestd import SlurmRestd
+from tools import sched_sync
+
+
+class Backend:
+    """Run bash snippets with tools/sched_backend.sh sourced and a fake scheduler."""
+
+    def __init__(self, tmp_path, scheduler):
+        self.scheduler = scheduler
+        self.state_dir = tmp_path / "fakesched"
+        self.workdir = tmp_path / "work"
+        self.workdir.mkdir()
+        install_fake_scheduler(tmp_path / "bin")
+        self.env = dict(
+            os.environ,
+            PATH=f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}",
+            FAKESCHED_STATE=str(self.state_dir),
+            FAKESCHED_QUEUE_WAIT="1",
+            USER=os.environ.get("USER", "harness"),
+        )
+        self.env.pop("SLURMRESTD_URL", None)
+
+    def run(self, snippet, **env):
+        script = f"SCHED_TYPE={self.scheduler}\nsource {sched_sync.LIBRARY}\n{snippet}"
+        result = subprocess.run(["bash", "-c", script], cwd=self.workdir, env=dict(self.env, **env),
+                                capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        return result.stdout.strip()
+
+    def submit(self, payload, **env):
+        (self.workdir / "job.sh").write_text(f"#!/bin/bash\n{payload}\n")
+        return self.run('sched_submit job.sh && echo "${SCHED_JOBID}"', **env)
+
+    def state(self, jobid, **env):
+        return self.run(f'sched_job_state {jobid}; echo "${{SCHED_STATE}} ${{SCHED_EXIT}}"', **env)
+
+    def job(self, jobid):
+        return json.loads((self.state_dir / "jobs" / f"{jobid}.json").read_text())
+
+    def calls(self):
+        log = self.state_dir / "calls.log"
+        return [line.split("\t", 1)[1] for line in log.read_text().splitlines()] if log.exists() else []
+
+
+def wait_for(backend, jobid, final, timeout=30, **env):
+    seen = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = backend.state(jobid, **env)
+        if not seen or seen[-1] != state:
+            seen.append(state)
+        if state.split()[0] == final:
+            return seen
+        time.sleep(0.2)
+    raise AssertionError(f"job {jobid} never reached {final}: {seen}")
+
+
+def test_workflows_embed_current_libraries():
+    assert sched_sync.main(["--check"]) == 0
+
+
+@pytest.mark.parametrize("library, targets, begin", [library[:3] for library in sched_sync.LIBRARIES],
+                         ids=[library[0].name for library in sched_sync.LIBRARIES])
+def test_every_target_has_the_library_block(library, targets, begin):
+    for name in targets:
+        assert begin in (sched_sync.ROOT / name).read_text(encoding="utf-8"), f"{name} has no {library.name} block"
+
+
+@pytest.mark.parametrize("scheduler, state, exit_status, expected", [
+    ("slurm", "PD", "", "PENDING"),
+    ("slurm", "CONFIGURING", "", "PENDING"),
+    ("slurm", "R", "", "RUNNING"),
+    ("slurm", "CG", "", "COMPLETING"),
+    ("slurm", "COMPLETED", "0", "COMPLETED"),
+    ("slurm", "CANCELLED by 1000", "0", "CANCELLED"),
+    ("slurm", "TO", "", "TIMEOUT"),
+    ("slurm", "OUT_OF_MEMORY", "0", "OUT_OF_MEMORY"),
+    ("slurm", "F", "", "FAILED"),
+    ("slurm", "", "", "UNKNOWN"),
+    ("pbs", "Q", "", "PENDING"),
+    ("pbs", "R", "", "RUNNING"),
+    ("pbs", "E", "", "COMPLETING"),
+    ("pbs", "F", "0", "COMPLETED"),
+    ("pbs", "F", "2", "FAILED"),
+    ("pbs", "C", "271", "TIMEOUT"),
+    ("pbs", "C", "-11", "CANCELLED"),
+    ("pbs", "X", "", "CANCELLED"),
+    ("pbs", "", "", "UNKNOWN"),
+])
+def test_states_are_normalized(tmp_path, scheduler, state, exit_status, expected):
+    backend = Backend(tmp_path, scheduler)
+    assert backend.run(f'sched_normalize "{state}" "{exit_status}"; echo "${{REPLY}}"') == expected
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_job_state_follows_job_with_targeted_queries(tmp_path, scheduler):
+    backend = Backend(tmp_path, scheduler)
+    jobid = backend.submit("sleep 1")
+    assert jobid == "1001"
+    assert wait_for(backend, jobid, "COMPLETED") == ["PENDING", "RUNNING", "COMPLETED 0"]
+
+    failed = backend.submit("exit 3")
+    assert wait_for(backend, failed, "FAILED")[-1] == "FAILED 3"
+    # Every status query names the job; nothing lists the whole queue
+    for call in backend.calls():
+        if '"squeue"' in call or '"qstat"' in call:
+            assert '"-j"' in call or f'"{jobid}"' in call or f'"{failed}"' in call, call
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_user_states_and_cancel(tmp_path, scheduler):
+    backend = Backend(tmp_path, scheduler)
+    jobid = backend.submit("sleep 60")
+    wait_for(backend, jobid, "RUNNING")
+    assert f"{jobid} RUNNING" in backend.run("sched_user_states").splitlines()
+
+    backend.run(f"sched_cancel {jobid}")
+    assert wait_for(backend, jobid, "CANCELLED")[-1].startswith("CANCELLED")
+
+
+@pytest.mark.parametrize("scheduler, target", [("slurm", "debug"), ("pbs", "workq"), ("slurm", "undefined")])
+def test_queue_depth_counts_pending_jobs(tmp_path, scheduler, target):
+    backend = Backend(tmp_path, scheduler)
+    snippet = f'sched_queue_depth {target}; echo "${{REPLY}} ${{SCHED_CALLS}}"'
+    assert backend.run(snippet, FAKESCHED_PENDING_JOBS="3") == "3 1"
+    assert backend.run(snippet) == "0 1"
+
+
+def test_rest_backend_replaces_cli_queries(tmp_path):
+    backend = Backend(tmp_path, "slurm")
+    jobid = backend.submit("sleep 60")
+    with SlurmRestd(backend.state_dir) as restd:
+        wait_for(backend, jobid, "RUNNING", SLURMRESTD_URL=restd.url)
+        backend.run(f"sched_cancel {jobid}", SLURMRESTD_URL=restd.url)
+        assert wait_for(backend, jobid, "CANCELLED", SLURMRESTD_URL=restd.url)[-1] == "CANCELLED 0"
+
+    assert ("DELETE", f"/slurm/v0.0.40/job/{jobid}") in restd.requests
+    assert [call for call in backend.calls() if '"sbatch"' not in call] == []
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_job_nodes_are_listed_once_the_job_runs(tmp_path, scheduler):
+    backend = Backend(tmp_path, scheduler)
+    jobid = backend.submit("sleep 60", FAKESCHED_QUEUE_WAIT="2")
+    snippet = f'sched_job_nodes {jobid}; echo "${{SCHED_CALLS}} ${{SCHED_NODES[*]}}"'
+    try:
+        assert backend.run(snippet) == "1"
+        wait_for(backend, jobid, "RUNNING")
+        # squeue, then scontrol show hostnames to expand the node list
+        assert backend.run(snippet) == ("2 fakenode01" if scheduler == "slurm" else "1 fakenode01")
+        if scheduler == "slurm":
+            with SlurmRestd(backend.state_dir) as restd:
+                assert backend.run(snippet, SLURMRESTD_URL=restd.url) == "2 fakenode01"
+            assert restd.requests == [("GET", f"/slurm/v0.0.40/job/{jobid}")]
+    finally:
+        backend.run(f"sched_cancel {jobid}")
+
+
+def test_rest_backend_falls_back_to_cli(tmp_path):
+    backend = Backend(tmp_path, "slurm")
+    jobid = backend.submit("true")
+    # Nothing listens on port 9; every request fails and the CLI answers instead
+    assert wait_for(backend, jobid, "COMPLETED", SLURMRESTD_URL="http://127.0.0.1:9")[-1] == "COMPLETED 0"
+    assert any('"squeue"' in call for call in backend.calls())
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_pending_job_reports_start_estimate(tmp_path, scheduler):
+    backend = Backend(tmp_path, scheduler)
+    jobid = backend.submit("true", FAKESCHED_QUEUE_WAIT="300")
+    expected = backend.job(jobid)["submit_time"] + 300
+    try:
+        state, start, calls = backend.run(
+            f'sched_job_state {jobid}; echo "${{SCHED_STATE}} ${{SCHED_START}} ${{SCHED_CALLS}}"').split()
+        assert state == "PENDING"
+        assert abs(int(start) - expected) <= 1
+        assert calls == "1"
+
+        listed = backend.run("sched_user_states").split()
+        assert listed[:2] == [jobid, "PENDING"] and abs(int(listed[2]) - expected) <= 1
+    finally:
+        backend.run(f"sched_cancel {jobid}")
+
+
+def test_rest_backend_reports_start_estimate(tmp_path):
+    backend = Backend(tmp_path, "slurm")
+    jobid = backend.submit("true", FAKESCHED_QUEUE_WAIT="300")
+    expected = backend.job(jobid)["submit_time"] + 300
+    try:
+        with SlurmRestd(backend.state_dir) as restd:
+            start = backend.run(f'sched_job_state {jobid}; echo "${{SCHED_START}}"', SLURMRESTD_URL=restd.url)
+        assert abs(int(start) - expected) <= 1
+    finally:
+        backend.run(f"sched_cancel {jobid}")
+
+
+def test_no_start_estimate_without_one_from_the_scheduler(tmp_path):
+    backend = Backend(tmp_path, "slurm")
+    jobid = backend.submit("true", FAKESCHED_QUEUE_WAIT="300", FAKESCHED_START_ESTIMATE="none")
+    try:
+        assert backend.state(jobid) == "PENDING"
+        assert backend.run(f'sched_job_state {jobid}; echo "[${{SCHED_START}}]"') == "[]"
+    finally:
+        backend.run(f"sched_cancel {jobid}")
+
+
+@pytest.mark.parametrize("state, previous, poll, start_in, expected", [
+    ("PENDING", "", 120, None, 15),           # first sight of the job
+    ("PENDING", "PENDING", 15, None, 30),     # doubles while queued
+    ("PENDING", "PENDING", 480, None, 600),   # up to SCHED_POLL_MAX
+    ("PENDING", "PENDING", 120, 101, 50),     # half the time left to the estimate
+    ("PENDING", "PENDING", 120, 10, 15),      # never below SCHED_POLL_MIN
+    ("PENDING", "PENDING", 120, -60, 15),     # estimate passed
+    ("RUNNING", "PENDING", 600, None, 15),    # state change
+    ("RUNNING", "RUNNING", 15, None, 15),
+])
+def test_next_poll_backs_off_while_queued(tmp_path, state, previous, poll, start_in, expected):
+    backend = Backend(tmp_path, "slurm")
+    start = "" if start_in is None else f"$(( $(date +%s) + {start_in} ))"
+    snippet = f'SCHED_POLL={poll}; SCHED_START={start}; sched_next_poll "{state}" "{previous}"; echo "${{SCHED_POLL}}"'
+    assert backend.run(snippet, SCHED_POLL_MIN="15", SCHED_POLL_MAX="600") == str(expected)
+
+
+def test_calls_are_counted(tmp_path):
+    backend = Backend(tmp_path, "slurm")
+    (backend.workdir / "job.sh").write_text("#!/bin/bash\ntrue\n")
+    snippet = """
+    sched_submit job.sh
+    until sched_job_state "${SCHED_JOBID}"; [[ "${SCHED_STATE}" == COMPLETED ]]; do sleep 0.2; done
+    sched_cancel "${SCHED_JOBID}"
+    echo "${SCHED_CALLS}"
+    """
+    assert int(backend.run(snippet)) == len(backend.calls())
+
+
+@pytest.mark.parametrize("scheduler, directives", [
+    ("slurm", "#SBATCH --cpus-per-task=2\n#SBATCH --mem=1G\n#SBATCH --time=01:00:00"),
+    ("pbs", "#PBS -l select=1:ncpus=2:mem=1gb\n#PBS -l walltime=01:00:00"),
+])
+def test_job_usage_reports_accounting(tmp_path, scheduler, directives):
+    backend = Backend(tmp_path, scheduler)
+    jobid = backend.submit(f"{directives}\nend=$((SECONDS + 3)); while [ $SECONDS -lt $end ]; do :; done")
+    wait_for(backend, jobid, "COMPLETED")
+    usage = backend.run(
+        f'sched_job_usage {jobid}; echo "${{SCHED_ELAPSED}} ${{SCHED_CPU_TIME}} ${{SCHED_ALLOC_CPUS}} '
+        f'${{SCHED_MAX_RSS_MB}} ${{SCHED_REQ_MEM_MB}} ${{SCHED_TIME_LIMIT}}"')
+    elapsed, cpu, cpus, rss, mem, limit = map(int, usage.split())
+    assert (cpus, mem, limit) == (2, 1024, 3600)
+    assert elapsed >= 1 and 0 < cpu <= elapsed * cpus
+    assert 0 < rss < mem
+
+
+def test_job_usage_is_empty_for_unknown_job(tmp_path):
+    backend = Backend(tmp_path, "slurm")
+    assert backend.run('sched_job_usage 4242; echo "[${SCHED_ELAPSED}${SCHED_ALLOC_CPUS}${SCHED_MAX_RSS_MB}]"') == "[]"
@@ -0,0 +1,41 @@
+import os
+
+from tests.harness import install_fake_ssh
+from tests.helpers import run_library
+from tools import sched_sync
+
+
+def fanout(tmp_path, nodes, rounds=1, **env):
+    install_fake_ssh(tmp_path / "bin")
+    (tmp_path / "work").mkdir(exist_ok=True)
+    snippet = "\n".join(
+        [f'node_fanout 10 "touch ran.\\${{FAKESSH_HOST}}; [ \\${{FAKESSH_HOST}} != bad ]" {nodes}', 'echo "${REPLY}"'] * rounds
+    )
+    result = run_library(tmp_path / "work", sched_sync.MUX_LIBRARY, snippet, timeout=60,
+                         env=dict(os.environ, PATH=f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}",
+                                  FAKESCHED_STATE=str(tmp_path / "state"),
+                                  SSH_MUX_DIR=str(tmp_path / "mux"), **env))
+    log = tmp_path / "state" / "ssh.log"
+    connections = [line.split("\t")[1:] for line in log.read_text().splitlines()] if log.exists() else []
+    return result.stdout.split(), connections
+
+
+def test_fanout_reports_every_node_in_order(tmp_path):
+    replies, _ = fanout(tmp_path, "node1 bad node2")
+
+    assert replies == ["node1:0,bad:1,node2:0"]
+    assert {path.name for path in (tmp_path / "work").iterdir()} == {"ran.node1", "ran.bad", "ran.node2"}
+
+
+def test_connections_to_a_node_are_reused(tmp_path):
+    _, connections = fanout(tmp_path, "node1 node2", rounds=3)
+
+    assert sorted(host for kind, host in connections if kind == "handshake") == ["node1", "node2"]
+    assert sorted(host for kind, host in connections if kind == "reuse") == ["node1", "node1", "node2", "node2"]
+
+
+def test_reuse_can_be_turned_off(tmp_path):
+    _, connections = fanout(tmp_path, "node1 node2", rounds=2, SSH_MUX_PERSIST="0")
+
+    assert [kind for kind, _ in connections] == ["handshake"] * 4
+    assert not (tmp_path / "mux").exists()
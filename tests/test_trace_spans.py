@@ -0,0 +1,65 @@
+import json
+
+from tests.helpers import run_library
+from tools import sched_sync
+
+
+def run(tmp_path, snippet):
+    prelude = 'TRACE_FILE="${PWD}/trace.tsv" TRACE_JOB=job TRACE_STEP="Some Step"'
+    return run_library(tmp_path, sched_sync.TRACE_LIBRARY, snippet, prelude)
+
+
+def spans(tmp_path):
+    lines = (tmp_path / "trace.tsv").read_text().splitlines()
+    return [line.split("\t") for line in lines]
+
+
+def test_open_spans_end_on_exit(tmp_path):
+    run(tmp_path, "span_begin outer\nspan_begin inner\nsleep 0.1\nspan_end inner\nspan_end missing")
+
+    recorded = {span[4]: span for span in spans(tmp_path)}
+    assert set(recorded) == {"inner", "outer", "Some Step"}
+    assert all(span[2:4] == ["job", "Some Step"] for span in recorded.values())
+    assert int(recorded["inner"][1]) >= 100000
+    assert int(recorded["outer"][1]) >= int(recorded["inner"][1])
+
+
+def test_job_start_splits_queue_wait_and_detection_lag(tmp_path):
+    run(tmp_path, "\n".join([
+        "span_begin submit", "span_end submit", "TRACE_SUBMITTED=${REPLY}",
+        "sleep 0.2", "touch job.started", "sleep 0.2",
+        "trace_started job.started", "trace_started job.started", "sleep 0.1", "span_end run",
+    ]))
+
+    recorded = {span[4]: int(span[1]) for span in spans(tmp_path)}
+    assert 150000 <= recorded["queue_wait"] < 400000
+    assert 150000 <= recorded["start_detect_lag"] < 400000
+    assert recorded["run"] >= 100000
+    assert [span[4] for span in spans(tmp_path)].count("run") == 1
+
+
+def test_export_merges_span_files(tmp_path):
+    (tmp_path / "site").mkdir()
+    (tmp_path / "site" / "trace.tsv").write_text(
+        "1000000\t500000\tsite_0\tSubmit Job\tsubmit\n"
+        "1500000\t2000000\tsite_0\tSubmit Job\trun\n"
+        "4000000\t250000\tsite_0\tSubmit Job\tsubmit\n"
+    )
+    (tmp_path / "trace.tsv").write_text("900000\t100000\tinitialize\tSetup\tSetup\n")
+    snippet = "trace_export out.json out.prom trace.tsv site/trace.tsv missing.tsv"
+    run_library(tmp_path, sched_sync.TRACE_LIBRARY, snippet, env={"PATH": "/usr/bin:/bin", "TRACE_STEP": "export"})
+
+    events = json.loads((tmp_path / "out.json").read_text())["traceEvents"]
+    complete = [event for event in events if event["ph"] == "X"]
+    assert [event["name"] for event in complete] == ["Setup", "submit", "run", "submit"]
+    assert complete[1] == {"name": "submit", "cat": "site_0", "ph": "X", "ts": 1000000, "dur": 500000,
+                           "pid": 2, "tid": 2}
+    names = {(event["name"], event["args"]["name"]) for event in events if event["ph"] == "M"}
+    assert ("process_name", "site_0") in names and ("thread_name", "Submit Job") in names
+
+    metrics = (tmp_path / "out.prom").read_text().splitlines()
+    assert metrics[-1] == "# EOF"
+    assert 'job_runner_span_seconds_sum{job="site_0",step="Submit Job",span="submit"} 0.750000' in metrics
+    assert 'job_runner_span_seconds_count{job="site_0",step="Submit Job",span="submit"} 2' in metrics
+    assert "job_runner_time_to_script_seconds 0.600000" in metrics
+    assert not list(tmp_path.glob("*.tmp"))
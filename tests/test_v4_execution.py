@@ -0,0 +1,441 @@
+import gzip
+import hashlib
+import json
+import time
+
+import pytest
+
+from tests.harness import Execution
+
+
+JOBS = {"ssh": "ssh_job", "slurm": "slurm_job", "pbs": "pbs_job"}
+
+
+def make_execution(tmp_path, scheduler, script, **inputs):
+    return Execution("v4.0.yaml", tmp_path, {
+        "resource": {"ip": "localhost", "schedulerType": "" if scheduler == "ssh" else scheduler},
+        "scheduler": scheduler != "ssh",
+        "script": script,
+        **inputs,
+    })
+
+
+def run_workflow(execution, env=None):
+    assert execution.run("create_script_template").returncode == 0
+    job = next(name for name in JOBS.values() if execution.enabled(name))
+    result = execution.run(job, env=env)
+    assert execution.run("cleanup").returncode == 0
+    return result
+
+
+@pytest.mark.parametrize("scheduler", ["ssh", "slurm", "pbs"])
+def test_job_runs_to_completion(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, 'echo "payload ran in ${PWD}"')
+    result = run_workflow(execution)
+
+    assert result.job == JOBS[scheduler]
+    assert result.returncode == 0, result.output
+    output = (execution.rundir / "run.00001.out").read_text()
+    assert f"payload ran in {execution.rundir}" in output
+    assert (execution.rundir / "job.started").exists()
+    assert (execution.rundir / "job.ended").exists()
+
+
+@pytest.mark.parametrize("scheduler", ["ssh", "slurm", "pbs"])
+def test_failing_script_fails_the_job(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "exit 3")
+    result = run_workflow(execution)
+
+    assert result.returncode != 0, result.output
+    assert (execution.rundir / "job.ended").exists()
+
+
+@pytest.mark.parametrize("scheduler", ["ssh", "slurm", "pbs"])
+def test_steps_are_traced(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "sleep 1")
+    result = run_workflow(execution, env={"FAKESCHED_QUEUE_WAIT": "1.5"})
+
+    assert result.returncode == 0, result.output
+    events = json.loads((execution.rundir / "trace.00001.json").read_text())["traceEvents"]
+    spans = {(event["cat"], event["name"]): event["dur"] for event in events if event["ph"] == "X"}
+    assert ("create_script_template", "stage_scripts") in spans
+    assert ("cleanup", "Cleanup") in spans
+    assert spans[(JOBS[scheduler], "run")] >= 1_000_000
+    if scheduler != "ssh":
+        assert (JOBS[scheduler], "submit") in spans and (JOBS[scheduler], "sed_cleanup") in spans
+        assert spans[(JOBS[scheduler], "queue_wait")] >= 1_000_000
+        assert (JOBS[scheduler], "start_detect_lag") in spans
+    metrics = (execution.rundir / "metrics.00001.prom").read_text()
+    assert f'job_runner_span_seconds_count{{job="{JOBS[scheduler]}",' in metrics
+    assert "job_runner_time_to_script_seconds " in metrics
+    assert metrics.endswith("# EOF\n")
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_queue_wait_is_observed_by_monitor(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "true")
+    result = run_workflow(execution, env={"FAKESCHED_QUEUE_WAIT": "2.5"})
+
+    assert result.returncode == 0, result.output
+    assert "pending" in result.output.lower() or "state: Q" in result.output
+    job = execution.jobs()[0]
+    assert job["start_time"] - job["submit_time"] >= 2.5
+
+
+def test_rejected_submission_fails_the_job(tmp_path):
+    execution = make_execution(tmp_path, "slurm", "true")
+    result = run_workflow(execution, env={"FAKESCHED_SUBMIT_FAIL": "1"})
+
+    assert result.returncode != 0
+    assert "submission rejected" in result.output
+    assert execution.jobs() == []
+
+
+def test_preempted_job_is_reported(tmp_path):
+    execution = make_execution(tmp_path, "slurm", "sleep 30")
+    result = run_workflow(execution, env={"FAKESCHED_PREEMPT_AFTER": "1"})
+
+    assert "final state: PREEMPTED" in result.output
+    assert execution.jobs()[0]["state"] == "PREEMPTED"
+    assert result.seconds < 20
+
+
+def test_step_cleanup_cancels_running_job(tmp_path):
+    execution = make_execution(tmp_path, "slurm", "sleep 60")
+    assert execution.run("create_script_template").returncode == 0
+    job = execution.start("slurm_job")
+    deadline = time.monotonic() + 10
+    while not (execution.rundir / "job.started").exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    cleanup = execution.run("slurm_job", kind="cleanup")
+    execution.wait(job, timeout=30)
+
+    assert cleanup.returncode == 0, cleanup.output
+    assert execution.jobs()[0]["state"] == "CANCELLED"
+    assert "cancelled=1001" in (execution.rundir / "teardown.log").read_text()
+
+
+@pytest.mark.parametrize("scheduler", ["ssh", "slurm", "pbs"])
+def test_buffered_output_reaches_the_output_file(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, 'seq 2000; echo "payload ran in ${PWD}"',
+                               output_buffer=True, output_buffer_compress=True)
+    result = run_workflow(execution)
+
+    assert result.returncode == 0, result.output
+    assert "out_buffer_start" in (execution.rundir / "run-template.sh").read_text()
+    output = (execution.rundir / "run.00001.out").read_text()
+    assert output.count("\n") >= 2001 and f"payload ran in {execution.rundir}" in output
+    assert gzip.decompress((execution.rundir / "run.00001.out.gz").read_bytes()).decode() in output
+
+
+def test_buffered_runs_share_the_staged_script(tmp_path):
+    for job_id in ("00001", "00002"):
+        execution = Execution("v4.0.yaml", tmp_path, {
+            "resource": {"ip": "localhost", "schedulerType": "slurm"},
+            "scheduler": True,
+            "script": "echo payload",
+            "output_buffer": True,
+            "output_buffer_compress": True,
+        }, job_id=job_id)
+        assert run_workflow(execution).returncode == 0
+        assert "payload" in (execution.rundir / f"run.{job_id}.out").read_text()
+        assert (execution.rundir / f"run.{job_id}.out.gz").exists()
+
+    assert len(list((execution.rundir / ".job_script_cache").iterdir())) == 1
+    history = list((execution.rundir / ".job_efficiency").glob("*.tsv"))
+    assert len(history) == 1
+    assert [line.split("\t")[1] for line in history[0].read_text().splitlines()] == ["1001", "1002"]
+
+
+def test_cancelled_job_flushes_buffered_output(tmp_path):
+    execution = make_execution(tmp_path, "slurm", "echo before-cancel; sleep 60", output_buffer=True)
+    assert execution.run("create_script_template").returncode == 0
+    job = execution.start("slurm_job")
+    deadline = time.monotonic() + 10
+    while not (execution.rundir / "job.started").exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    execution.run("slurm_job", kind="cleanup")
+    execution.wait(job, timeout=30)
+
+    deadline = time.monotonic() + 10
+    while "before-cancel" not in (execution.rundir / "run.00001.out").read_text() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert "before-cancel" in (execution.rundir / "run.00001.out").read_text()
+
+
+@pytest.mark.parametrize("scheduler", ["ssh", "slurm"])
+def test_packed_tasks_get_their_manifest_words_literally(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, 'printf "%s|" "${TASK_ID}" "$#" "$@"', **{
+        "packing.enabled": True, "packing.manifest": "manifest.txt", "packing.workers": 2})
+    (execution.rundir / "tasks").mkdir()
+    (execution.rundir / "tasks" / "precious.txt").write_text("keep")
+    (execution.rundir / "manifest.txt").write_text("# sweep\nalpha beta\n\nit's $(touch pwned);x\n")
+    result = run_workflow(execution)
+
+    assert result.returncode == 0, result.output
+    tasks = execution.rundir / ".pack.00001" / "tasks"
+    assert (tasks / "1.out").read_text() == "1|2|alpha|beta|"
+    assert (tasks / "2.out").read_text() == "2|3|it's|$(touch|pwned);x|"
+    assert (tasks / "progress").read_text().split() == ["2", "2", "0"]
+    assert not (execution.rundir / "pwned").exists()
+    # A directory of the user's that happens to be called tasks/ is left alone
+    assert (execution.rundir / "tasks" / "precious.txt").read_text() == "keep"
+
+
+def pilots(execution):
+    return [job for job in execution.jobs() if job["name"].startswith("pilot_")]
+
+
+def stop_pilots(execution):
+    for pilot_dir in (execution.rundir / ".pilot").iterdir():
+        (pilot_dir / "STOP").touch()
+    deadline = time.monotonic() + 30
+    while any(job["state"] in ("PENDING", "RUNNING") for job in pilots(execution)) and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_array_job_bypasses_the_pilot(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "true", **{
+        "pilot.enabled": True, "pilot.idle_timeout": 0, f"{scheduler}.array": "1-3", "poll_interval": 1})
+    result = run_workflow(execution)
+
+    assert result.returncode == 0, result.output
+    assert "Array jobs are not run in the pilot" in result.output
+    assert "3 completed, 0 failed" in result.output
+    assert pilots(execution) == []
+
+
+def run_pilot_job(tmp_path, job_id, walltime, pilot_walltime):
+    execution = Execution("v4.0.yaml", tmp_path, {
+        "resource": {"ip": "localhost", "schedulerType": "pbs"},
+        "scheduler": True,
+        "script": "echo pilot-task",
+        "pilot.enabled": True,
+        "pilot.idle_timeout": 60,
+        "pilot.walltime": pilot_walltime,
+        "pbs.walltime": walltime,
+    }, job_id=job_id)
+    result = run_workflow(execution)
+    assert result.returncode == 0, result.output
+    assert "pilot-task" in (execution.rundir / f"run.{job_id}.out").read_text()
+    return execution, result
+
+
+def test_pilot_is_only_shared_by_runs_with_the_same_resources(tmp_path):
+    pilot_dirs = []
+    for job_id, pilot_walltime in (("00001", "03:00:00"), ("00002", "04:00:00"), ("00003", "03:00:00")):
+        execution, result = run_pilot_job(tmp_path, job_id, "01:00:00", pilot_walltime)
+        assert "Job completed in pilot" in result.output
+        pilot_dirs.append({path.name for path in (execution.rundir / ".pilot").iterdir()})
+
+    try:
+        # The four-hour pilot is a pilot of its own; the third run reused the first pilot
+        assert [len(dirs) for dirs in pilot_dirs] == [1, 2, 2]
+        assert [job["resources"]["time_limit"] for job in pilots(execution)] == [10800, 14400]
+        assert "Using running pilot 1001" in result.output
+    finally:
+        stop_pilots(execution)
+
+
+def test_run_longer_than_the_pilot_has_left_is_submitted_directly(tmp_path):
+    execution, result = run_pilot_job(tmp_path, "00001", "00:30:00", "01:00:00")
+    assert "Job completed in pilot" in result.output
+
+    try:
+        # The pilot has been running, so a full hour no longer fits
+        execution, result = run_pilot_job(tmp_path, "00002", "01:00:00", "01:00:00")
+        assert "Using running pilot 1001" in result.output
+        assert "less than this job's 3600s walltime, submitting directly" in result.output
+        assert "Job completed in pilot" not in result.output
+        assert [job["name"].startswith("pilot_") for job in execution.jobs()] == [True, False]
+
+        # A spooled run that stopped fitting while it waited is handed back, not run
+        pilot_dir = next((execution.rundir / ".pilot").iterdir())
+        (pilot_dir / "spool" / "late.sh").write_text("# walltime: 3600\ntouch ran\n")
+        deadline = time.monotonic() + 10
+        while not (pilot_dir / "returned" / "late.sh").exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert (pilot_dir / "returned" / "late.sh").exists()
+        assert not (pilot_dir / "ran").exists()
+    finally:
+        stop_pilots(execution)
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_step_cleanup_runs_cancel_sh_on_the_job_nodes(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "sleep 60")
+    (execution.rundir / "cancel.sh").write_text('touch "cancelled.${FAKESSH_HOST}"\n')
+    assert execution.run("create_script_template").returncode == 0
+    job = execution.start(JOBS[scheduler])
+    deadline = time.monotonic() + 10
+    while not (execution.rundir / "job.started").exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    env = {"SSH_MUX_DIR": str(tmp_path / "mux")}
+    cleanup = execution.run(JOBS[scheduler], kind="cleanup", env=env)
+    execution.wait(job, timeout=30)
+
+    assert cleanup.returncode == 0, cleanup.output
+    assert (execution.rundir / "cancelled.fakenode01").exists()
+    assert "cancel_sh=fakenode01:0" in (execution.rundir / "teardown.log").read_text()
+    # The connection to the node stays up for the next run's teardown
+    assert [kind for _, kind, _ in execution.ssh_connections()] == ["handshake"]
+    assert list((tmp_path / "mux").iterdir())
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_array_job_reports_every_element(tmp_path, scheduler):
+    index = "${SLURM_ARRAY_TASK_ID}" if scheduler == "slurm" else "${PBS_ARRAY_INDEX}"
+    execution = make_execution(tmp_path, scheduler, f"[ $(( {index} % 4 )) -ne 3 ]",
+                               **{f"{scheduler}.array": "0-7", "poll_interval": 1})
+    (execution.rundir / "array_status.tsv").write_text("user data\n")
+    result = run_workflow(execution)
+
+    assert result.returncode != 0
+    assert "2 failed" in result.output
+    # Files of the user's under the old generic names are left alone
+    assert (execution.rundir / "array_status.tsv").read_text() == "user data\n"
+    rows = (execution.rundir / ".job_array.00001" / "status.tsv").read_text().splitlines()
+    assert rows[0] == "element\tstate\texit_code"
+    assert [row.split("\t") for row in rows[1:]] == [
+        [str(i), "FAILED" if i % 4 == 3 else "COMPLETED", "1" if i % 4 == 3 else "0"] for i in range(8)
+    ]
+    # One bulk status query per tick, never one per element
+    queries = [args for _, command, args in execution.calls() if command in ("sacct", "qstat")]
+    assert all("-X" in args or "-t" in args for args in queries)
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_array_job_succeeds_when_all_elements_complete(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "true", **{f"{scheduler}.array": "1-5", "poll_interval": 1})
+    result = run_workflow(execution)
+
+    assert result.returncode == 0, result.output
+    assert "5 completed, 0 failed" in result.output
+    assert len((execution.rundir / ".job_array.00001" / "status.tsv").read_text().splitlines()) == 6
+
+
+def test_array_job_fails_fast_past_threshold(tmp_path):
+    script = '[ "${SLURM_ARRAY_TASK_ID}" -ge 2 ] && sleep 60; exit 1'
+    execution = make_execution(tmp_path, "slurm", script,
+                               **{"slurm.array": "0-9", "array_max_failures": 2, "poll_interval": 1})
+    result = run_workflow(execution)
+
+    assert result.returncode != 0
+    assert "threshold 2" in result.output
+    assert result.seconds < 30
+    assert execution.jobs()[0]["state"] == "CANCELLED"
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_monitor_never_lists_the_whole_queue(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "sleep 3")
+    result = run_workflow(execution)
+
+    assert result.returncode == 0, result.output
+    queries = [args for _, command, args in execution.calls() if command in ("squeue", "qstat")]
+    assert queries
+    assert all("1001" in args for args in queries), queries
+
+
+@pytest.mark.parametrize("scheduler", ["slurm", "pbs"])
+def test_monitor_backs_off_while_queued(tmp_path, scheduler):
+    execution = make_execution(tmp_path, scheduler, "sleep 2", poll_max_interval=8)
+    result = run_workflow(execution, env={"FAKESCHED_QUEUE_WAIT": "12", "FAKESCHED_START_ESTIMATE": "none"})
+
+    assert result.returncode == 0, result.output
+    job = execution.jobs()[0]
+    queries = [epoch for epoch, command, _ in execution.calls() if command in ("squeue", "qstat", "sacct")]
+    # Waits of 1, 2, 4 and 8 seconds instead of one query per second in the queue
+    assert len([epoch for epoch in queries if epoch < job["start_time"]]) <= 5, queries
+    # job.started still wakes the monitor right away
+    assert min(epoch for epoch in queries if epoch > job["start_time"]) - job["start_time"] < 2
+    assert f"sched_calls={len(execution.calls())}" in (execution.base / "outputs").read_text()
+
+
+@pytest.mark.parametrize("scheduler, resources", [
+    ("slurm", {"slurm.cpus_per_task": 2, "slurm.mem": "1G", "slurm.time": "01:00:00"}),
+    ("pbs", {"pbs.select": "1:ncpus=2:mem=1gb", "pbs.walltime": "01:00:00"}),
+])
+def test_efficiency_is_recorded(tmp_path, scheduler, resources):
+    script = "end=$((SECONDS + 3)); while [ $SECONDS -lt $end ]; do :; done"
+    execution = make_execution(tmp_path, scheduler, script, **resources)
+    (execution.rundir / "efficiency.json").write_text("user data\n")
+    result = run_workflow(execution)
+
+    assert result.returncode == 0, result.output
+    efficiency = json.loads((execution.rundir / ".job_efficiency" / "00001.json").read_text())
+    assert efficiency["state"] == "COMPLETED"
+    assert (efficiency["alloc_cpus"], efficiency["req_mem_mb"], efficiency["time_limit_s"]) == (2, 1024, 3600)
+    assert 0 < efficiency["cpu_efficiency"] <= 1 and 0 < efficiency["mem_efficiency"] < 1
+    assert "Efficiency: CPU" in result.output
+    assert f"cpu_efficiency={efficiency['cpu_efficiency']:.3f}" in (execution.base / "outputs").read_text()
+    history = list((execution.rundir / ".job_efficiency").glob("*.tsv"))
+    assert len(history) == 1
+    assert history[0].read_text().split("\t")[1:3] == ["1001", "COMPLETED"]
+    # A file of the user's called efficiency.json is left alone
+    assert (execution.rundir / "efficiency.json").read_text() == "user data\n"
+
+
+def test_efficiency_is_skipped_when_rightsizing_is_off(tmp_path):
+    execution = make_execution(tmp_path, "slurm", "true", rightsizing="off")
+    assert run_workflow(execution).returncode == 0
+    assert not (execution.rundir / ".job_efficiency" / "00001.json").exists()
+    assert not (execution.rundir / ".job_efficiency").exists()
+
+
+def seed_history(execution, *states):
+    """Record past runs of the current script that used one core, 1000 MB and ten minutes."""
+    assert execution.run("create_script_template").returncode == 0
+    digest = hashlib.sha256((execution.rundir / "run-template.sh").read_bytes()).hexdigest()
+    history = execution.rundir / ".job_efficiency" / f"{digest}.tsv"
+    history.parent.mkdir()
+    history.write_text("".join(f"{1700000000 + n}\t{n}\t{state}\t600\t600\t8\t1000\t32768\t14400\n"
+                               for n, state in enumerate(states)))
+
+
+@pytest.mark.parametrize("mode", ["suggest", "apply"])
+def test_slurm_requests_are_right_sized_from_history(tmp_path, mode):
+    execution = make_execution(tmp_path, "slurm", "true", rightsizing=mode, **{
+        "slurm.cpus_per_task": 8, "slurm.mem": "32G", "slurm.time": "04:00:00"})
+    seed_history(execution, "COMPLETED", "COMPLETED", "COMPLETED")
+    result = execution.run("slurm_job", step="Create SLURM Script")
+
+    assert result.returncode == 0, result.output
+    assert "Right-sizing --cpus-per-task: 8 -> 2" in result.output
+    assert "Right-sizing --mem: 32G -> 1280M" in result.output
+    assert "Right-sizing --time: 04:00:00 -> 00:15:00" in result.output
+    directives = (execution.rundir / "run.sh").read_text()
+    if mode == "apply":
+        assert all(line in directives for line in ("--cpus-per-task=2", "--mem=1280M", "--time=00:15:00"))
+    else:
+        assert all(line in directives for line in ("--cpus-per-task=8", "--mem=32G", "--time=04:00:00"))
+
+
+def test_right_sizing_needs_clean_history(tmp_path):
+    execution = make_execution(tmp_path, "slurm", "true", rightsizing="apply", **{
+        "slurm.cpus_per_task": 8, "slurm.mem": "32G", "slurm.time": "04:00:00"})
+    seed_history(execution, "COMPLETED", "COMPLETED", "OUT_OF_MEMORY", "TIMEOUT")
+    result = execution.run("slurm_job", step="Create SLURM Script")
+
+    assert result.returncode == 0, result.output
+    directives = (execution.rundir / "run.sh").read_text()
+    # Only the two completed runs count, which is not enough history yet
+    assert "Right-sizing" not in result.output
+    assert "--cpus-per-task=8" in directives
+
+
+def test_pbs_select_is_right_sized_from_history(tmp_path):
+    execution = make_execution(tmp_path, "pbs", "true", rightsizing="apply", **{
+        "pbs.select": "2:ncpus=8:mem=32gb", "pbs.walltime": "04:00:00"})
+    seed_history(execution, "COMPLETED", "COMPLETED", "COMPLETED")
+    result = execution.run("pbs_job", step="Create PBS Script")
+
+    assert result.returncode == 0, result.output
+    directives = (execution.rundir / "run.sh").read_text()
+    # History covers the whole job; each of the two chunks gets half
+    assert "#PBS -l select=2:ncpus=1:mem=640mb" in directives
+    assert "#PBS -l walltime=00:15:00" in directives
@@ -11,6 +11,40 @@ def test_core_input_defaults(workflow_data):
     assert inputs["poll_interval"]["default"] == 15
 
 
+def test_watch_mode_input(workflow_data):
+    watch_mode = workflow_data["on"]["execute"]["inputs"]["watch_mode"]
+    assert watch_mode["type"] == "dropdown"
+    assert watch_mode["default"] == "auto"
+    options = [opt["value"] for opt in watch_mode["options"]]
+    assert options == ["auto", "inotify", "poll"]
+
+
+def test_output_buffer_inputs(workflow_data):
+    inputs = workflow_data["on"]["execute"]["inputs"]
+    assert inputs["output_buffer"]["default"] is False
+    assert inputs["output_buffer_interval"]["default"] == 30
+    assert inputs["output_buffer_compress"]["default"] is False
+    for name in ("output_buffer_interval", "output_buffer_compress"):
+        assert inputs[name]["hidden"] == "${{ inputs.output_buffer == false }}"
+
+
+def test_packing_inputs(workflow_data):
+    packing = workflow_data["on"]["execute"]["inputs"]["packing"]
+    assert packing["type"] == "group"
+    items = packing["items"]
+    assert items["enabled"]["default"] is False
+    assert items["workers"]["default"] == 0
+    assert "packing.enabled == false" in items["manifest"]["hidden"]
+
+
+def test_pilot_inputs(workflow_data):
+    pilot = workflow_data["on"]["execute"]["inputs"]["pilot"]
+    assert "inputs.scheduler == false" in pilot["hidden"]
+    assert pilot["items"]["enabled"]["default"] is False
+    assert pilot["items"]["idle_timeout"]["default"] == 600
+    assert pilot["items"]["walltime"]["default"] == ""
+
+
 def test_script_inputs_visibility(workflow_data):
     inputs = workflow_data["on"]["execute"]["inputs"]
     script = inputs["script"]
@@ -1,4 +1,5 @@
-from tests.helpers import get_job, get_step_run, get_step_cleanup
+from tests.helpers import get_job, get_step_run, get_step_cleanup, sources
+from tools import sched_sync
 
 
 def test_log_job_script_contains_markers(workflow_data):
@@ -32,6 +33,16 @@ def test_create_script_template_injection(workflow_data):
     assert "HOSTNAME" in run
 
 
+def test_create_script_template_stages_through_cache(workflow_data):
+    job = get_job(workflow_data, "create_script_template")
+    run = get_step_run(job, "Create Script Template")
+    assert ".job_script_cache" in run
+    assert "sha256sum" in run
+    assert 'stage_file run-template.sh' in run
+    assert 'cp "${{ inputs.script_path }}"' not in run
+    assert "bytes written" in run
+
+
 def test_ssh_job_execution_contract(workflow_data):
     """SSH job is now consolidated into single Execute SSH Job step"""
     job = get_job(workflow_data, "ssh_job")
@@ -50,15 +61,16 @@ def test_pbs_submission_and_cleanup(workflow_data):
     """PBS submit and monitor are now consolidated into single step"""
     job = get_job(workflow_data, "pbs_job")
     run = get_step_run(job, "Submit and Monitor PBS Job")
-    assert "qsub run.sh" in run
-    assert "grep -oE '^[0-9]+'" in run
+    assert "SCHED_TYPE=pbs" in run
+    assert "sched_submit run.sh" in run
     assert "jobid" in run
     # Monitor functionality is now in the same step
-    assert "sleep ${{ inputs.poll_interval }}" in run
-    assert "job_status" in run
+    assert "wait_for_markers ${{ inputs.poll_interval }}" in run
+    assert 'sched_job_state "${jobid}"' in run
 
     cleanup = get_step_cleanup(job, "Submit and Monitor PBS Job")
-    assert "qdel" in cleanup
+    assert sources(cleanup, "sched_backend.sh")
+    assert 'sched_cancel "${jobid}"' in cleanup
     assert "job.ended" in cleanup
 
 
@@ -66,18 +78,34 @@ def test_slurm_submission_and_cleanup(workflow_data):
     """SLURM submit and monitor are now consolidated into single step"""
     job = get_job(workflow_data, "slurm_job")
     run = get_step_run(job, "Submit and Monitor SLURM Job")
-    assert "sbatch run.sh" in run
-    assert "grep -oE '[0-9]+$'" in run
+    assert "SCHED_TYPE=slurm" in run
+    assert "sched_submit run.sh" in run
     assert "jobid" in run
     # Monitor functionality is now in the same step
-    assert "sleep ${{ inputs.poll_interval }}" in run
-    assert "job_status" in run
+    assert "wait_for_markers ${{ inputs.poll_interval }}" in run
+    assert 'sched_job_state "${jobid}"' in run
 
     cleanup = get_step_cleanup(job, "Submit and Monitor SLURM Job")
-    assert "scancel" in cleanup
+    assert sources(cleanup, "sched_backend.sh")
+    assert 'sched_cancel "${jobid}"' in cleanup
     assert "job.ended" in cleanup
 
 
+def test_scheduler_cleanup_runs_cancel_sh_on_all_nodes(workflow_data):
+    for job_name, step_name in (
+        ("slurm_job", "Submit and Monitor SLURM Job"),
+        ("pbs_job", "Submit and Monitor PBS Job"),
+    ):
+        cleanup = get_step_cleanup(get_job(workflow_data, job_name), step_name)
+        assert sources(cleanup, "ssh_mux.sh")
+        assert 'node_fanout 20 "export PATH' in cleanup and '"${SCHED_NODES[@]}"' in cleanup
+        assert "teardown.log" in cleanup
+        # Node lookup goes through the backend, never straight to the scheduler
+        body = cleanup.split('source "${WORKFLOW_LIB}/sched_backend.sh"', 1)[1]
+        assert 'sched_job_nodes "${jobid}"' in body
+        assert "squeue" not in body and "qstat" not in body
+
+
 def test_monitors_use_poll_interval(workflow_data):
     """Monitors are now consolidated into submit steps"""
     for job_name, step_name in (
@@ -86,7 +114,56 @@ def test_monitors_use_poll_interval(workflow_data):
     ):
         job = get_job(workflow_data, job_name)
         run = get_step_run(job, step_name)
-        assert "sleep ${{ inputs.poll_interval }}" in run
+        assert "wait_for_markers ${{ inputs.poll_interval }}" in run
+        assert "SCHED_POLL_MIN=${{ inputs.poll_interval }}" in run
+        assert "SCHED_POLL_MAX=${{ inputs.poll_max_interval }}" in run
+        assert 'sched_next_poll "${SCHED_STATE}" "${last_state}"' in run
+        assert 'wait_for_markers "${SCHED_POLL}" job.started' in run
+
+
+def test_marker_waits_are_event_driven(workflow_data):
+    for job_name, step_name in (
+        ("log", "Job Output"),
+        ("pbs_job", "Submit and Monitor PBS Job"),
+        ("slurm_job", "Submit and Monitor SLURM Job"),
+    ):
+        job = get_job(workflow_data, job_name)
+        run = get_step_run(job, step_name)
+        assert sources(run, "marker_watch.sh")
+        assert 'WATCH_MODE="${{ inputs.watch_mode }}"' in run
+
+
+def test_monitors_support_pilot_mode(workflow_data):
+    for job_name, step_name in (
+        ("slurm_job", "Submit and Monitor SLURM Job"),
+        ("pbs_job", "Submit and Monitor PBS Job"),
+    ):
+        job = get_job(workflow_data, job_name)
+        run = get_step_run(job, step_name)
+        assert "inputs.pilot.enabled" in run
+        assert "inputs.pilot.idle_timeout" in run
+        assert "${PILOT_DIR}/spool" in run
+        assert 'sched_submit "${PILOT_DIR}/pilot.sh"' in run
+        assert "run.${PW_JOB_ID}.out" in run
+        # The pilot is shared, so cancellation only targets this run's task
+        # One pilot per set of resources
+        assert 'PILOT_DIR="${PWD}/.pilot/$(' in run
+        # The pilot is shared, so cancellation only targets this run's task
+        assert '"${pilot_dir}/cancel/${task}"' in get_step_cleanup(job, step_name)
+
+
+def test_scheduler_jobs_record_efficiency_and_right_size(workflow_data):
+    for job_name, create_step, monitor_step in (
+        ("slurm_job", "Create SLURM Script", "Submit and Monitor SLURM Job"),
+        ("pbs_job", "Create PBS Script", "Submit and Monitor PBS Job"),
+    ):
+        job = get_job(workflow_data, job_name)
+        monitor = get_step_run(job, monitor_step)
+        assert sources(monitor, "job_tracking.sh")
+        assert 'record_efficiency "${jobid}"' in monitor
+        create = get_step_run(job, create_step)
+        assert "rightsize_history" in create
+        assert "inputs.rightsizing" in create
 
 
 def test_cleanup_job_contract(workflow_data):
@@ -101,3 +178,36 @@ def test_cleanup_job_contract(workflow_data):
     assert "CANCEL_STREAMING" in cleanup
     assert "Job was cancelled" in cleanup
     assert "cancel.sh" in cleanup
+
+
+def test_steps_record_trace_spans(workflow_data):
+    for job_name, step_name, has_cleanup in (
+        ("create_script_template", "Create Script Template", False),
+        ("ssh_job", "Execute SSH Job", True),
+        ("pbs_job", "Create PBS Script", False),
+        ("pbs_job", "Submit and Monitor PBS Job", True),
+        ("slurm_job", "Create SLURM Script", False),
+        ("slurm_job", "Submit and Monitor SLURM Job", True),
+        ("cleanup", "Cleanup", True),
+    ):
+        job = get_job(workflow_data, job_name)
+        run = get_step_run(job, step_name)
+        assert sources(run, "trace_spans.sh")
+        assert f'TRACE_STEP="{step_name}"' in run
+        if has_cleanup:
+            assert f'TRACE_STEP="{step_name} (cleanup)"' in get_step_cleanup(job, step_name)
+
+    cleanup = get_job(workflow_data, "cleanup")
+    for script in (get_step_run(cleanup, "Cleanup"), get_step_cleanup(cleanup, "Cleanup")):
+        assert 'trace_export "trace.${PW_JOB_ID}.json" "metrics.${PW_JOB_ID}.prom"' in script
+
+
+def test_libraries_are_staged_once_per_run(workflow_data, workflow_text):
+    create = get_step_run(get_job(workflow_data, "create_script_template"), "Create Script Template")
+    for library, targets, begin, _ in sched_sync.LIBRARIES:
+        # The output buffer goes into the job script instead
+        if "v4.0.yaml" not in targets or library == sched_sync.BUFFER_LIBRARY:
+            continue
+        assert workflow_text.count(begin) == 1
+        assert f"stage_library {library.name} <<'LIBRARY_EOF'\n{begin}\n" in create
+
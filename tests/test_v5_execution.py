@@ -0,0 +1,480 @@
+import gzip
+import hashlib
+import json
+import sqlite3
+import subprocess
+import time
+
+import pytest
+
+from tests.harness import Execution
+from tests.helpers import get_job, get_step_run
+
+
+def site(index, scheduler, cluster="clusterA"):
+    return {
+        f"sites_{index}.enabled": True,
+        f"sites_{index}.name": f"site{index}",
+        f"sites_{index}.scheduler": scheduler != "ssh",
+        f"sites_{index}.resource": {"ip": cluster, "schedulerType": "" if scheduler == "ssh" else scheduler},
+    }
+
+
+def make_execution(tmp_path, sites, **inputs):
+    # Only site 0 is enabled by default
+    merged = {"sites_0.enabled": False}
+    for index, (scheduler, cluster) in enumerate(sites):
+        merged.update(site(index, scheduler, cluster))
+    merged.update(inputs)
+    return Execution("v5.0.yaml", tmp_path, merged)
+
+
+def run_sites(execution, site_env):
+    assert execution.run("initialize").returncode == 0
+    log = execution.start("log")
+    processes = [execution.start(f"site_{i}", env=env) for i, env in enumerate(site_env)]
+    results = [execution.wait(process) for process in processes]
+    summary = execution.run("cleanup")
+    execution.wait(log)
+    return results, summary
+
+
+def test_race_first_started_site_wins_and_loser_is_cancelled(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("slurm", "clusterA")],
+                               execution_mode="race", script='echo "payload"')
+    results, summary = run_sites(execution, [{"FAKESCHED_QUEUE_WAIT": "0.2"}, {"FAKESCHED_QUEUE_WAIT": "60"}])
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["winner"] == "site_0"
+    assert report["completed"] == 1 and report["cancelled"] == 1
+    assert report["race_cancel_latency_ms"] is not None
+    states = {job["name"]: job["state"] for job in execution.jobs()}
+    assert states == {"lb_00001_site_0": "COMPLETED", "lb_00001_site_1": "CANCELLED"}
+    # The loser never reached the head of the queue, so it must not have run
+    assert not (execution.workdir("site_1") / "job.started").exists()
+
+
+def test_parallel_mode_runs_every_site(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("pbs", "clusterB"), ("ssh", "clusterC")],
+                               execution_mode="parallel", script='echo "payload on ${PWD##*/}"')
+    results, summary = run_sites(execution, [{}, {}, {}])
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["completed"] == 3
+    for index in range(3):
+        assert f"payload on site_{index}" in (execution.workdir(f"site_{index}") / "run.out").read_text()
+    # Scheduler sites report their calls; the SSH site makes none
+    assert report["sites"]["site_0"]["sched_calls"] >= 2
+    assert report["sites"]["site_1"]["sched_calls"] >= 2
+    assert report["sites"]["site_2"]["sched_calls"] is None
+
+
+def test_buffered_output_reaches_run_out(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("ssh", "clusterB")], execution_mode="parallel",
+                               script='seq 1000; echo "payload on ${PWD##*/}"', output_buffer=True,
+                               output_buffer_compress=True)
+    results, summary = run_sites(execution, [{}, {}])
+
+    assert summary.returncode == 0, summary.output
+    for index in range(2):
+        site_dir = execution.workdir(f"site_{index}")
+        assert "out_buffer_start" in (site_dir / "run.sh").read_text()
+        output = (site_dir / "run.out").read_text()
+        assert f"payload on site_{index}" in output and "1000\n" in output
+        assert gzip.decompress((site_dir / "run.out.gz").read_bytes()).decode() in output
+
+
+def test_site_state_is_one_log_per_site(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("ssh", "clusterB")],
+                               execution_mode="parallel", script="true")
+    results, summary = run_sites(execution, [{}, {}])
+
+    assert summary.returncode == 0, summary.output
+    for index in range(2):
+        names = {path.name for path in execution.workdir(f"site_{index}").iterdir()}
+        assert "state.log" in names
+        assert not names & {"status", "name", "priority", "cores", "jobid", "submitted_at", "final_state"}
+        assert execution.site_state(f"site_{index}")["status"] == "COMPLETED"
+    snapshot = (execution.workdir("cleanup") / "state.tsv").read_text().splitlines()
+    assert {"site_0\tstatus\tCOMPLETED", "site_0\tname\tsite0", "site_1\tstatus\tCOMPLETED"} <= set(snapshot)
+
+
+def test_sites_and_coordinator_are_traced(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("ssh", "clusterB")],
+                               execution_mode="parallel", script="sleep 1")
+    results, summary = run_sites(execution, [{"FAKESCHED_QUEUE_WAIT": "1"}, {}])
+
+    assert summary.returncode == 0, summary.output
+    coord = execution.workdir("cleanup")
+    events = json.loads((coord / "trace.json").read_text())["traceEvents"]
+    spans = {(event["cat"], event["name"]) for event in events if event["ph"] == "X"}
+    assert {("initialize", "Setup Coordination Directory"), ("cleanup", "Generate Summary Report"),
+            ("cleanup", "telemetry")} <= spans
+    assert {("site_0", name) for name in ("stage_scripts", "submit", "queue_wait", "start_detect_lag", "run")} <= spans
+    assert ("site_1", "run") in spans and ("site_1", "submit") not in spans
+    metrics = (coord / "metrics.prom").read_text()
+    assert 'job_runner_span_seconds_sum{job="site_0",step="Submit Job to Site 0",span="queue_wait"}' in metrics
+    assert metrics.endswith("# EOF\n")
+    db = sqlite3.connect(execution.rundir / "lb_telemetry.db")
+    sites = db.execute("SELECT DISTINCT site FROM events WHERE execution_id = '00001'").fetchall()
+    assert sorted(sites) == [("site_0",), ("site_1",)]
+    assert '"event":"started"' in (coord / "events.jsonl").read_text()
+
+
+def test_cleanup_tears_down_all_sites_on_a_cluster_with_one_call(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("slurm", "clusterA")],
+                               execution_mode="parallel", script="sleep 60")
+    assert execution.run("initialize").returncode == 0
+    processes = [execution.start(f"site_{i}") for i in range(2)]
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if all((execution.workdir(f"site_{i}") / "job.started").exists() for i in range(2)):
+            break
+        time.sleep(0.1)
+
+    cleanups = [execution.start(f"site_{i}", kind="cleanup") for i in range(2)]
+    for process in cleanups + processes:
+        execution.wait(process, timeout=60)
+
+    assert [job["state"] for job in execution.jobs()] == ["CANCELLED", "CANCELLED"]
+    scancels = [args for _, command, args in execution.calls() if command == "scancel"]
+    assert len(scancels) == 1 and sorted(scancels[0]) == ["1001", "1002"]
+
+
+def site_events(execution, index, event):
+    path = execution.workdir(f"site_{index}") / "events.jsonl"
+    return [entry for entry in map(json.loads, path.read_text().splitlines()) if entry["event"] == event]
+
+
+def test_failed_winner_fails_over_to_next_site(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("slurm", "clusterA")],
+                               execution_mode="race", poll_interval=1, script="sleep 3; echo payload")
+    results, summary = run_sites(execution, [
+        {"FAKESCHED_QUEUE_WAIT": "0.2", "FAKESCHED_PREEMPT_AFTER": "2"},
+        {"FAKESCHED_QUEUE_WAIT": "3"},
+    ])
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["winner"] == "site_1"
+    assert report["retries"] == 1
+    assert report["sites"]["site_0"]["status"] == "FAILED"
+    assert report["sites"]["site_0"]["final_state"] == "PREEMPTED"
+    assert report["sites"]["site_1"]["status"] == "COMPLETED"
+    states = [(job["name"], job["state"]) for job in sorted(execution.jobs(), key=lambda job: (job["name"], job["id"]))]
+    assert states == [("lb_00001_site_0", "PREEMPTED"), ("lb_00001_site_1", "CANCELLED"),
+                      ("lb_00001_site_1", "COMPLETED")]
+    retry, = site_events(execution, 0, "retry")
+    assert (retry["sched_state"], retry["target"], retry["attempt"]) == ("PREEMPTED", "site_1", 1)
+    assert site_events(execution, 1, "takeover")[0]["from"] == "site_0"
+    assert "payload" in (execution.workdir("site_1") / "run.out").read_text()
+
+
+def test_failed_winner_without_retry_budget_fails_the_race(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("slurm", "clusterA")],
+                               execution_mode="race", max_retries=0, poll_interval=1, script="sleep 3")
+    results, summary = run_sites(execution, [
+        {"FAKESCHED_QUEUE_WAIT": "0.2", "FAKESCHED_PREEMPT_AFTER": "1"},
+        {"FAKESCHED_QUEUE_WAIT": "3"},
+    ])
+
+    assert summary.returncode != 0
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["retries"] == 0
+    assert sorted(job["state"] for job in execution.jobs()) == ["CANCELLED", "PREEMPTED"]
+    # With nothing to fail over to, the loser does not stand by for the winner
+    assert "Standing by" not in results[1].output
+
+
+@pytest.mark.parametrize("mode", ["race", "parallel"])
+def test_preempted_job_is_resubmitted_on_the_same_site(tmp_path, mode):
+    execution = make_execution(tmp_path, [("slurm", "clusterA")], execution_mode=mode, failover="same_site",
+                               retry_delay=2, poll_interval=1, script="sleep 2")
+    results, summary = run_sites(execution, [{"FAKESCHED_PREEMPT_AFTER": "0.5", "FAKESCHED_PREEMPT_COUNT": "1"}])
+
+    assert results[0].returncode == 0, results[0].output
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["sites"]["site_0"]["status"] == "COMPLETED"
+    assert report["sites"]["site_0"]["retries"] == 1
+    assert [job["state"] for job in execution.jobs()] == ["PREEMPTED", "COMPLETED"]
+    retry, = site_events(execution, 0, "retry")
+    assert retry["delay_s"] == 2
+    resubmitted = site_events(execution, 0, "submitted")[1]
+    assert resubmitted["epoch"] - retry["epoch"] >= 1
+
+
+def test_rejected_submissions_are_retried_until_the_site_is_down(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("pbs", "clusterB")],
+                               execution_mode="parallel", max_retries=5, retry_delay=0, script="true")
+    results, summary = run_sites(execution, [{"FAKESCHED_SUBMIT_FAILURES": "1"}, {"FAKESCHED_SUBMIT_FAIL": "1"}])
+
+    assert results[0].returncode == 0, results[0].output
+    assert results[1].returncode != 0
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["sites"]["site_0"]["status"] == "COMPLETED"
+    assert report["sites"]["site_1"]["status"] == "FAILED"
+    # Two rejections in a row mark a site down; it stops spending the shared budget
+    assert report["retries"] == 2
+    assert (execution.workdir("site_1") / "down").exists()
+    assert [event["sched_state"] for event in site_events(execution, 1, "retry")] == ["submit_error"]
+
+
+def test_failing_ssh_script_is_recorded(tmp_path):
+    execution = make_execution(tmp_path, [("ssh", "clusterA")], execution_mode="parallel", script="exit 3")
+    results, summary = run_sites(execution, [{}])
+
+    assert results[0].returncode == 0, results[0].output
+    assert execution.site_state("site_0")["exit_code"] == "3"
+    assert json.loads((execution.workdir("cleanup") / "summary.json").read_text())["failed"] == 1
+
+
+def test_job_leaving_the_queue_unstarted_ends_the_site(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA")], execution_mode="parallel", script="true")
+    assert execution.run("initialize").returncode == 0
+    process = execution.start("site_0", env={"FAKESCHED_QUEUE_WAIT": "60"})
+    deadline = time.monotonic() + 15
+    while not execution.site_state("site_0").get("jobid") and time.monotonic() < deadline:
+        time.sleep(0.1)
+    # An administrator cancels the queued job
+    subprocess.run(["scancel", execution.site_state("site_0")["jobid"]], env=execution.env(), check=True)
+    result = execution.wait(process, timeout=30)
+
+    assert result.returncode == 0, result.output
+    state = execution.site_state("site_0")
+    assert (state["status"], state["final_state"]) == ("FAILED", "CANCELLED")
+
+
+def test_job_vanishing_while_pending_without_accounting_fails(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA")], execution_mode="parallel", script="true")
+    assert execution.run("initialize").returncode == 0
+    env = {"FAKESCHED_QUEUE_WAIT": "60", "FAKESCHED_NO_ACCOUNTING": "1"}
+    process = execution.start("site_0", env=env)
+    deadline = time.monotonic() + 15
+    while execution.site_state("site_0").get("status") != "SUBMITTED" and time.monotonic() < deadline:
+        time.sleep(0.1)
+    # Let the site see the job queued
+    time.sleep(3)
+    # Deleted out-of-band; sacct has no record, so the cached PENDING is all there is
+    subprocess.run(["scancel", execution.site_state("site_0")["jobid"]], env=execution.env(), check=True)
+    result = execution.wait(process, timeout=30)
+
+    assert result.returncode == 0, result.output
+    state = execution.site_state("site_0")
+    assert (state["status"], state["final_state"]) == ("FAILED", "CANCELLED")
+
+
+def sharded_execution(tmp_path, sites, tasks, **inputs):
+    execution = make_execution(tmp_path, sites, execution_mode="sharded", task_manifest="tasks.txt", **inputs)
+    lines = ["# one task per line"] + [f"input_{index:02d}.dat" for index in range(tasks)] + [""]
+    (execution.rundir / "tasks.txt").write_text("\n".join(lines))
+    return execution
+
+
+def task_log(execution):
+    return sorted((execution.rundir / "ran.log").read_text().split())
+
+
+def test_sharded_mode_splits_tasks_in_proportion_to_cores(tmp_path):
+    execution = sharded_execution(tmp_path, [("slurm", "clusterA"), ("ssh", "clusterB")], 16,
+                                  chunk_size=2, **{"sites_0.cores": 3, "sites_1.cores": 1},
+                                  script='echo "${LB_TASK_INDEX}:${LB_TASK}" >> ../../ran.log')
+    results, summary = run_sites(execution, [{}, {}])
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    assert summary.returncode == 0, summary.output
+    coord = execution.workdir("cleanup")
+    assert (coord / "site_0" / "share").read_text().split() == ["0", "5"]
+    assert (coord / "site_1" / "share").read_text().split() == ["6", "7"]
+    # Every task ran exactly once; the index is the manifest line number
+    assert task_log(execution) == sorted(f"{index + 2}:input_{index:02d}.dat" for index in range(16))
+    report = json.loads((coord / "summary.json").read_text())
+    assert report["tasks"] == {"total": 16, "done": 16, "failed": 0, "not_run": 0}
+    assert report["makespan_s"] is not None
+    assert sum(site["tasks_done"] for site in report["sites"].values()) == 16
+    # The job asks the scheduler for the site's cores and runs that many workers
+    assert "#SBATCH --cpus-per-task=3" in (execution.workdir("site_0") / "submit.sh").read_text()
+    assert "3 worker(s)" in (execution.workdir("site_0") / "run.out").read_text()
+
+
+def test_idle_site_steals_the_share_of_a_queued_site(tmp_path):
+    execution = sharded_execution(tmp_path, [("slurm", "clusterA"), ("slurm", "clusterA")], 8, chunk_size=1,
+                                  script='echo "${LB_TASK_INDEX}" >> ../../ran.log; sleep 0.2')
+    results, summary = run_sites(execution, [{"FAKESCHED_QUEUE_WAIT": "0.2"}, {"FAKESCHED_QUEUE_WAIT": "60"}])
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["sites"]["site_0"]["tasks_done"] == 8
+    assert report["sites"]["site_0"]["chunks_stolen"] == 4
+    assert report["sites"]["site_1"]["status"] == "CANCELLED"
+    assert len(task_log(execution)) == 8
+    # The queued job had nothing left to do once every chunk was claimed
+    assert sorted(job["state"] for job in execution.jobs()) == ["CANCELLED", "COMPLETED"]
+
+
+def test_preempted_sharded_job_resumes_its_claimed_chunks(tmp_path):
+    execution = sharded_execution(tmp_path, [("slurm", "clusterA")], 4, chunk_size=2, retry_delay=0,
+                                  script='sleep 1; echo "${LB_TASK_INDEX}" >> ../../ran.log')
+    results, summary = run_sites(execution, [{"FAKESCHED_PREEMPT_AFTER": "1.5", "FAKESCHED_PREEMPT_COUNT": "1"}])
+
+    assert results[0].returncode == 0, results[0].output
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["tasks"]["done"] == 4
+    assert report["sites"]["site_0"]["retries"] == 1
+    assert "Resuming chunk 000000" in (execution.workdir("site_0") / "run.out").read_text()
+
+
+def test_failed_tasks_fail_a_sharded_execution(tmp_path):
+    execution = sharded_execution(tmp_path, [("ssh", "clusterA")], 4, chunk_size=3,
+                                  script='[[ "${LB_TASK}" != input_01.dat ]]')
+    results, summary = run_sites(execution, [{}])
+
+    assert results[0].returncode == 0, results[0].output
+    assert summary.returncode != 0
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["tasks"] == {"total": 4, "done": 3, "failed": 1, "not_run": 0}
+    assert (execution.workdir("cleanup") / "claims" / "000000" / "failed").read_text().split() == ["3", "1"]
+
+
+def test_quorum_cancels_the_remaining_sites_once_met(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("ssh", "clusterB"), ("slurm", "clusterA")],
+                               execution_mode="quorum", quorum_size=2, script="sleep 1")
+    results, summary = run_sites(execution, [{"FAKESCHED_QUEUE_WAIT": "0.2"}, {}, {"FAKESCHED_QUEUE_WAIT": "60"}])
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    assert summary.returncode == 0, summary.output
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["quorum"]["met"] is True
+    assert sorted(report["quorum"]["members"]) == ["site_0", "site_1"]
+    assert report["quorum"]["time_saved_s"] >= 0
+    assert report["completed"] == 2 and report["cancelled"] == 1
+    states = {job["name"]: job["state"] for job in execution.jobs()}
+    assert states == {"lb_00001_site_0": "COMPLETED", "lb_00001_site_2": "CANCELLED"}
+
+
+def test_quorum_stops_a_running_ssh_site(tmp_path):
+    execution = make_execution(tmp_path, [("ssh", "clusterA"), ("ssh", "clusterB")], execution_mode="quorum",
+                               quorum_size=1, script='[ "${PWD##*/}" = site_0 ] || sleep 60')
+    start = time.monotonic()
+    results, summary = run_sites(execution, [{}, {}])
+
+    assert time.monotonic() - start < 30
+    assert summary.returncode == 0, summary.output
+    assert execution.site_state("site_0")["status"] == "COMPLETED"
+    assert execution.site_state("site_1")["status"] == "CANCELLED"
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["quorum"]["members"] == ["site_0"]
+
+
+def test_quorum_deadline_cancels_every_site(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("pbs", "clusterB")], execution_mode="quorum",
+                               quorum_size=1, quorum_deadline=3, script="true")
+    results, summary = run_sites(execution, [{"FAKESCHED_QUEUE_WAIT": "60"}] * 2)
+
+    assert all(result.returncode == 0 for result in results), [r.output for r in results]
+    assert summary.returncode == 1
+    report = json.loads((execution.workdir("cleanup") / "summary.json").read_text())
+    assert report["quorum"] == {"size": 1, "met": False, "members": [], "met_after_s": None, "deadline_s": 3,
+                                "time_saved_s": None}
+    assert report["cancelled"] == 2
+    assert {job["state"] for job in execution.jobs()} == {"CANCELLED"}
+
+
+def manifest(execution):
+    lines = (execution.workdir("collect") / "results" / "manifest.tsv").read_text().splitlines()
+    return {(site, path): (int(size), sha256) for site, path, size, _, sha256 in (line.split("\t") for line in lines)}
+
+
+def test_collect_pulls_declared_outputs_from_every_site(tmp_path):
+    script = 'mkdir -p out/deep; echo "a ${PWD##*/}" > out/a.csv; echo b > out/deep/b.csv; echo skip > out/c.log'
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("ssh", "clusterB")], execution_mode="parallel",
+                               script=script, collect_outputs="*.csv", collect_compress=True,
+                               **{"sites_1.collect_bwlimit": 64})
+    run_sites(execution, [{}, {}])
+    result = execution.run("collect")
+
+    assert result.returncode == 0, result.output
+    results = execution.workdir("collect") / "results"
+    assert (results / "site_0" / "out" / "a.csv").read_text() == "a site_0\n"
+    assert not (results / "site_1" / "out" / "c.log").exists()
+    expected = {(f"site_{i}", path): (len(text), hashlib.sha256(text.encode()).hexdigest())
+                for i in range(2) for path, text in (("out/a.csv", f"a site_{i}\n"), ("out/deep/b.csv", "b\n"))}
+    assert manifest(execution) == expected
+    report = json.loads((results / "collect.json").read_text())
+    assert {site: entry["status"] for site, entry in report["sites"].items()} == {"site_0": "ok", "site_1": "ok"}
+    assert report["sites"]["site_1"]["files"] == 2 and report["compress"] is True
+    runs = {args[-1]: args for _, args, _, _ in execution.rsync_runs()}
+    assert "--bwlimit=64" in runs["results/site_1/"] and "--bwlimit=64" not in runs["results/site_0/"]
+    assert "-z" in runs["results/site_0/"] and "--include=*.csv" in runs["results/site_0/"]
+    assert runs["results/site_0/"][-2] == f"clusterA:{execution.workdir('site_0')}/"
+
+
+def test_collect_is_incremental_and_resumes_interrupted_transfers(tmp_path):
+    execution = make_execution(tmp_path, [("ssh", "clusterA")], execution_mode="parallel",
+                               script="head -c 4096 /dev/urandom > big.dat; echo 1 > small.dat",
+                               collect_outputs="*.dat")
+    run_sites(execution, [{}])
+    first = execution.run("collect", env={"FAKERSYNC_FAILURES": "1"})
+
+    assert first.returncode == 0, first.output
+    assert "resuming (attempt 2)" in first.output
+    (_, _, rc, half), (_, _, retry_rc, rest) = execution.rsync_runs()
+    assert (rc, retry_rc) == (12, 0)
+    # The retry only received what the interrupted run had not
+    assert half + rest == 4096 + 2
+    report = json.loads((execution.workdir("collect") / "results" / "collect.json").read_text())
+    assert report["sites"]["site_0"]["attempts"] == 2
+    assert report["sites"]["site_0"]["bytes_received"] == 4096 + 2
+
+    (execution.workdir("site_0") / "small.dat").write_text("22\n")
+    second = execution.run("collect")
+
+    assert second.returncode == 0, second.output
+    assert execution.rsync_runs()[-1][3] == 3
+    assert manifest(execution)[("site_0", "small.dat")][0] == 3
+    assert manifest(execution)[("site_0", "big.dat")][0] == 4096
+
+
+def test_collect_skips_sites_that_never_started(tmp_path):
+    execution = make_execution(tmp_path, [("slurm", "clusterA"), ("slurm", "clusterA")],
+                               execution_mode="race", script="echo done > result.txt", collect_outputs="result.txt")
+    run_sites(execution, [{"FAKESCHED_QUEUE_WAIT": "0.2"}, {"FAKESCHED_QUEUE_WAIT": "60"}])
+    result = execution.run("collect")
+
+    assert result.returncode == 0, result.output
+    assert "site_1: job never started, nothing to collect" in result.output
+    assert list(manifest(execution)) == [("site_0", "result.txt")]
+
+
+def test_collect_without_declared_outputs_does_nothing(tmp_path):
+    execution = make_execution(tmp_path, [("ssh", "clusterA")], execution_mode="parallel", script="true")
+    run_sites(execution, [{}])
+    result = execution.run("collect")
+
+    assert result.returncode == 0, result.output
+    assert execution.rsync_runs() == []
+    assert not (execution.workdir("collect") / "results").exists()
+
+
+def test_streamer_drops_the_partial_line_of_a_truncated_log(tmp_path, v5_workflow_data):
+    run = get_step_run(get_job(v5_workflow_data, "log"), "Stream Aggregated Output")
+    streamer = run.split("<<'STREAMER_EOF'\n", 1)[1].split("\nSTREAMER_EOF", 1)[0]
+    log = tmp_path / "site_1" / "run.out"
+    log.parent.mkdir()
+    log.write_text("first line\nunfinished")
+    process = subprocess.Popen(["python3", "-c", streamer, "0", "site_1/run.out"], cwd=tmp_path,
+                               stdout=subprocess.PIPE, text=True)
+    assert process.stdout.readline() == "[site_1] first line\n"
+
+    # A resubmitted job starts the file over, mid-line
+    log.write_text("new line\n")
+    time.sleep(1)
+    (tmp_path / "STOP_STREAMING").touch()
+    output, _ = process.communicate(timeout=30)
+    assert output == "[site_1] new line\n"
@@ -6,6 +6,8 @@ def test_execution_mode_input(v5_workflow_data):
     options = [opt["value"] for opt in execution_mode["options"]]
     assert "race" in options
     assert "parallel" in options
+    assert "sharded" in options
+    assert "quorum" in options
 
 
 def test_core_input_defaults(v5_workflow_data):
@@ -15,6 +17,55 @@ def test_core_input_defaults(v5_workflow_data):
     assert inputs["use_existing_script"]["default"] is False
 
 
+def test_site_selection_inputs(v5_workflow_data):
+    inputs = v5_workflow_data["on"]["execute"]["inputs"]
+    site_selection = inputs["site_selection"]
+    assert site_selection["type"] == "dropdown"
+    assert site_selection["default"] == "all"
+    options = [opt["value"] for opt in site_selection["options"]]
+    assert options == ["all", "staggered", "limited"]
+    assert "execution_mode != 'race'" in site_selection["hidden"]
+    assert inputs["max_sites"]["default"] == 2
+    assert "site_selection != 'limited'" in inputs["max_sites"]["hidden"]
+    assert inputs["stagger_delay"]["default"] == 60
+    assert "site_selection != 'staggered'" in inputs["stagger_delay"]["hidden"]
+
+
+def test_sharded_mode_inputs(v5_workflow_data, v5_sites):
+    inputs = v5_workflow_data["on"]["execute"]["inputs"]
+    assert "execution_mode != 'sharded'" in inputs["task_manifest"]["hidden"]
+    assert inputs["chunk_size"]["default"] == 10
+    assert inputs["chunk_size"]["min"] == 1
+    for i in v5_sites:
+        cores = inputs[f"sites_{i}"]["items"]["cores"]
+        assert cores["default"] == 1
+        assert "execution_mode != 'sharded'" in cores["hidden"]
+
+
+def test_quorum_mode_inputs(v5_workflow_data):
+    inputs = v5_workflow_data["on"]["execute"]["inputs"]
+    assert inputs["quorum_size"]["default"] == 2
+    assert inputs["quorum_size"]["min"] == 1
+    assert inputs["quorum_deadline"]["default"] == 0
+    for name in ("quorum_size", "quorum_deadline"):
+        assert "execution_mode != 'quorum'" in inputs[name]["hidden"]
+
+
+def test_log_rate_limit_input(v5_workflow_data):
+    log_rate_limit = v5_workflow_data["on"]["execute"]["inputs"]["log_rate_limit"]
+    assert log_rate_limit["type"] == "number"
+    assert log_rate_limit["default"] == 256
+    assert log_rate_limit["min"] == 0
+
+
+def test_watch_mode_input(v5_workflow_data):
+    watch_mode = v5_workflow_data["on"]["execute"]["inputs"]["watch_mode"]
+    assert watch_mode["type"] == "dropdown"
+    assert watch_mode["default"] == "auto"
+    options = [opt["value"] for opt in watch_mode["options"]]
+    assert options == ["auto", "inotify", "poll"]
+
+
 def test_script_inputs_visibility(v5_workflow_data):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
     script = inputs["script"]
@@ -23,9 +74,9 @@ def test_script_inputs_visibility(v5_workflow_data):
     assert "use_existing_script == false" in script_path["hidden"]
 
 
-def test_all_site_groups_exist(v5_workflow_data):
+def test_all_site_groups_exist(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site_key = f"sites_{i}"
         assert site_key in inputs, f"Missing {site_key}"
         assert inputs[site_key]["type"] == "group"
@@ -37,16 +88,16 @@ def test_site_0_enabled_by_default(v5_workflow_data):
     assert site_0["enabled"]["default"] is True
 
 
-def test_sites_1_through_4_disabled_by_default(v5_workflow_data):
+def test_sites_1_through_4_disabled_by_default(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(1, 5):
+    for i in v5_sites[1:]:
         site = inputs[f"sites_{i}"]["items"]
         assert site["enabled"]["default"] is False, f"sites_{i} should be disabled"
 
 
-def test_site_configuration_fields(v5_workflow_data):
+def test_site_configuration_fields(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site = inputs[f"sites_{i}"]["items"]
         assert "enabled" in site
         assert "name" in site
@@ -57,62 +108,82 @@ def test_site_configuration_fields(v5_workflow_data):
         assert "pbs" in site
 
 
-def test_site_priorities_increase(v5_workflow_data):
+def test_site_priorities_increase(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site = inputs[f"sites_{i}"]["items"]
         assert site["priority"]["default"] == i + 1
 
 
-def test_site_names_default(v5_workflow_data):
+def test_site_names_default(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site = inputs[f"sites_{i}"]["items"]
         assert site["name"]["default"] == f"Site-{i}"
 
 
-def test_site_scheduler_defaults_to_false(v5_workflow_data):
+def test_site_scheduler_defaults_to_false(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site = inputs[f"sites_{i}"]["items"]
         assert site["scheduler"]["default"] is False
 
 
-def test_site_slurm_config_hidden_conditions(v5_workflow_data):
+def test_site_slurm_config_hidden_conditions(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site = inputs[f"sites_{i}"]["items"]
         slurm = site["slurm"]
         assert f"sites_{i}.resource.schedulerType != 'slurm'" in slurm["hidden"]
         assert f"sites_{i}.scheduler == false" in slurm["hidden"]
 
 
-def test_site_pbs_config_hidden_conditions(v5_workflow_data):
+def test_site_pbs_config_hidden_conditions(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         site = inputs[f"sites_{i}"]["items"]
         pbs = site["pbs"]
         assert f"sites_{i}.resource.schedulerType != 'pbs'" in pbs["hidden"]
         assert f"sites_{i}.scheduler == false" in pbs["hidden"]
 
 
-def test_slurm_has_required_fields(v5_workflow_data):
+def test_slurm_has_required_fields(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         slurm = inputs[f"sites_{i}"]["items"]["slurm"]["items"]
         assert "account" in slurm
         assert "partition" in slurm
+        assert slurm["qos"]["type"] == "slurm-qos"
         assert "time" in slurm
         assert "nodes" in slurm
         assert slurm["time"]["default"] == "04:00:00"
         assert slurm["nodes"]["default"] == 1
 
 
-def test_pbs_has_required_fields(v5_workflow_data):
+def test_pbs_has_required_fields(v5_workflow_data, v5_sites):
     inputs = v5_workflow_data["on"]["execute"]["inputs"]
-    for i in range(5):
+    for i in v5_sites:
         pbs = inputs[f"sites_{i}"]["items"]["pbs"]["items"]
         assert "account" in pbs
         assert "queue" in pbs
         assert "walltime" in pbs
         assert pbs["walltime"]["default"] == "04:00:00"
+
+
+def test_collect_inputs(v5_workflow_data, v5_sites):
+    inputs = v5_workflow_data["on"]["execute"]["inputs"]
+    assert inputs["collect_outputs"]["default"] == ""
+    assert inputs["collect_compress"]["default"] is False
+    for i in v5_sites:
+        bwlimit = inputs[f"sites_{i}"]["items"]["collect_bwlimit"]
+        assert bwlimit["default"] == 0 and bwlimit["min"] == 0
+        assert bwlimit["hidden"] == "${{ inputs.collect_outputs == '' }}"
+
+
+def test_output_buffer_inputs(v5_workflow_data):
+    inputs = v5_workflow_data["on"]["execute"]["inputs"]
+    assert inputs["output_buffer"]["default"] is False
+    assert inputs["output_buffer_interval"]["default"] == 30
+    assert inputs["output_buffer_compress"]["default"] is False
+    for name in ("output_buffer_interval", "output_buffer_compress"):
+        assert inputs[name]["hidden"] == "${{ inputs.output_buffer == false }}"
@@ -1,4 +1,4 @@
-from tests.helpers import get_job, get_step_run, get_step_cleanup
+from tests.helpers import get_job, get_step_run, get_step_cleanup, sources
 
 
 def test_initialize_creates_coordination_directory(v5_workflow_data):
@@ -16,10 +16,10 @@ def test_initialize_validates_enabled_sites(v5_workflow_data):
     assert "No sites enabled" in run
 
 
-def test_initialize_creates_site_directories(v5_workflow_data):
+def test_initialize_creates_site_directories(v5_workflow_data, v5_sites):
     job = get_job(v5_workflow_data, "initialize")
     run = get_step_run(job, "Setup Coordination Directory")
-    for i in range(5):
+    for i in v5_sites:
         assert f"site_{i}" in run
 
 
@@ -29,15 +29,84 @@ def test_initialize_writes_event_log(v5_workflow_data):
     assert "events.jsonl" in run
 
 
-def test_site_jobs_check_for_winner(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_check_for_winner(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "../WINNER" in run
 
 
-def test_site_jobs_create_script(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_claim_winner_atomically(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert 'mkdir "../WINNER.claim"' in run
+        assert 'mv -f "../WINNER.${SITE_ID}.tmp" "../WINNER"' in run
+        assert 'echo "${SITE_ID}" > "../WINNER"' not in run
+
+
+def test_site_jobs_retry_and_fail_over(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "MAX_RETRIES=${{ inputs.max_retries }}" in run
+        assert 'mkdir "../retries/${n}"' in run
+        assert 'RETRYABLE_STATES="NODE_FAIL PREEMPTED OUT_OF_MEMORY"' in run
+        assert 'echo "${SITE_ID}" > "../${best}/TAKEOVER"' in run
+        assert ": > ../RACE_DONE" in run
+        assert "emit_event retry" in run
+        # A failing script must not end the step before its status is written
+        assert "./run.sh > run.out 2>&1 || exit_code=$?" in run
+
+def test_site_jobs_shard_tasks_with_work_stealing(v5_workflow_data, v5_sites):
+    init = get_step_run(get_job(v5_workflow_data, "initialize"), "Setup Coordination Directory")
+    assert "tasks/total" in init
+    assert "/share" in init
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert 'mkdir "../claims/${REPLY}"' in run
+        assert "next_chunk()" in run
+        assert "LB_TASK_INDEX=" in run
+        assert "../tasks/all_claimed" in run
+        assert "#SBATCH --cpus-per-task=" in run
+        assert "#PBS -l ncpus=" in run
+
+
+def test_site_jobs_cancel_race_losers_in_bulk(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "cancel_race_losers" in run
+        assert ': > "${site_dir}/CANCEL_REQUESTED"' in run
+        assert 'SCHED_TYPE=slurm sched_cancel "${loser_slurm_ids[@]}"' in run
+        assert 'SCHED_TYPE=pbs sched_cancel "${loser_pbs_ids[@]}"' in run
+        assert "cancelled_ms" in run
+
+
+def test_site_jobs_rank_for_site_selection(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "inputs.site_selection" in run
+        assert f"inputs.sites_{i}.priority" in run
+        assert f'sched_queue_depth "${{{{ inputs.sites_{i}.slurm.partition }}}}"' in run
+        assert "../../lb_history.tsv" in run
+        assert "state_status SKIPPED" in run
+        assert "inputs.stagger_delay" in run
+
+
+def test_site_jobs_record_timestamps(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "submitted_at" in run
+        assert "started_at" in run
+        assert "ended_at" in run
+
+
+def test_site_jobs_create_script(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "use_existing_script" in run
@@ -45,16 +114,16 @@ def test_site_jobs_create_script(v5_workflow_data):
         assert "run.sh" in run
 
 
-def test_site_jobs_inject_markers(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_inject_markers(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "job.started" in run
         assert "HOSTNAME" in run
 
 
-def test_site_jobs_support_slurm(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_support_slurm(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "sbatch" in run
@@ -62,8 +131,8 @@ def test_site_jobs_support_slurm(v5_workflow_data):
         assert f"sites_{i}.slurm" in run
 
 
-def test_site_jobs_support_pbs(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_support_pbs(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "qsub" in run
@@ -71,15 +140,15 @@ def test_site_jobs_support_pbs(v5_workflow_data):
         assert f"sites_{i}.pbs" in run
 
 
-def test_site_jobs_support_ssh_direct(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_support_ssh_direct(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "./run.sh > run.out 2>&1" in run
 
 
-def test_site_jobs_handle_race_mode(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_handle_race_mode(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "execution_mode" in run
@@ -87,8 +156,8 @@ def test_site_jobs_handle_race_mode(v5_workflow_data):
         assert "WINNER" in run
 
 
-def test_site_jobs_track_status(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_track_status(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
         assert "status" in run
@@ -97,27 +166,62 @@ def test_site_jobs_track_status(v5_workflow_data):
         assert "COMPLETED" in run
 
 
-def test_site_jobs_have_cleanup(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_have_cleanup(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         cleanup = get_step_cleanup(job, f"Submit Job to Site {i}")
         assert "Cleanup triggered" in cleanup
         assert "job.ended" in cleanup
 
 
-def test_site_cleanup_cancels_scheduler_jobs(v5_workflow_data):
-    for i in range(5):
+def test_site_cleanup_cancels_scheduler_jobs(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         cleanup = get_step_cleanup(job, f"Submit Job to Site {i}")
-        assert "scancel" in cleanup
-        assert "qdel" in cleanup
+        assert sources(cleanup, "sched_backend.sh")
+        assert "sched_cancel" in cleanup
+
+
+def test_site_cleanup_tears_down_cluster_in_bulk(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        cleanup = get_step_cleanup(job, f"Submit Job to Site {i}")
+        assert sources(cleanup, "sched_backend.sh")
+        assert 'sched_cancel "${jobids[@]}"' in cleanup
+        assert "sched_user_states" in cleanup
+        assert 'mkdir "${TEARDOWN_DIR}"' in cleanup
+        assert "../teardown.log" in cleanup
+
+
+def test_site_jobs_use_poll_interval(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "SCHED_POLL_MIN=${{ inputs.poll_interval }}" in run
+        assert "SCHED_POLL_MAX=${{ inputs.poll_max_interval }}" in run
+        assert 'sched_next_poll "${job_state}"' in run
+        assert 'wait_for_markers "${SCHED_POLL}"' in run
 
 
-def test_site_jobs_use_poll_interval(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_wake_on_markers(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job = get_job(v5_workflow_data, f"site_{i}")
         run = get_step_run(job, f"Submit Job to Site {i}")
-        assert "sleep ${{ inputs.poll_interval }}" in run
+        assert "wait_for_markers() {" in run
+        assert "inotifywait" in run
+        assert "job.started job.ended CANCEL_REQUESTED ../WINNER" in run
+
+
+def test_site_jobs_read_shared_scheduler_cache(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert ".lb_sched_cache" in run
+        assert f"inputs.sites_{i}.resource.ip" in run
+        assert 'sched_user_states > "${tmp}"' in run
+        # Polling reads the cache; only a job that left the queue is looked up, once
+        assert run.count('sched_job_state "${jobid}"') == 1
+        assert "final_job_state() {" in run
 
 
 def test_log_job_streams_output(v5_workflow_data):
@@ -133,6 +237,33 @@ def test_log_job_uses_poll_interval(v5_workflow_data):
     assert "STOP_STREAMING" in run
 
 
+def test_log_job_uses_multiplexed_streamer(v5_workflow_data):
+    job = get_job(v5_workflow_data, "log")
+    run = get_step_run(job, "Stream Aggregated Output")
+    assert "STREAMER_EOF" in run
+    assert "os.read(self.fd, size)" in run
+    assert "CHUNK = 1 << 20" in run
+    # Site prefix is applied to whole chunks, not per line in bash
+    assert 'replace(b"\\n", b"\\n" + self.prefix)' in run
+    assert "stat -c%s" not in run
+    assert "while IFS= read -r line" not in run
+
+
+def test_log_job_rate_limits_sites(v5_workflow_data):
+    job = get_job(v5_workflow_data, "log")
+    run = get_step_run(job, "Stream Aggregated Output")
+    assert "inputs.log_rate_limit" in run
+    assert "bytes not streamed" in run
+
+
+def test_log_job_has_fallback_without_python(v5_workflow_data):
+    job = get_job(v5_workflow_data, "log")
+    run = get_step_run(job, "Stream Aggregated Output")
+    assert "command -v python3" in run
+    assert "tail -n +1 -F" in run
+    assert "wait_for_markers 60 STOP_STREAMING" in run
+
+
 def test_log_job_has_cleanup(v5_workflow_data):
     job = get_job(v5_workflow_data, "log")
     cleanup = get_step_cleanup(job, "Stream Aggregated Output")
@@ -162,7 +293,89 @@ def test_cleanup_handles_race_mode_winner(v5_workflow_data):
     assert "winner" in run
 
 
+def test_cleanup_reports_race_cancel_latency(v5_workflow_data):
+    job = get_job(v5_workflow_data, "cleanup")
+    run = get_step_run(job, "Generate Summary Report")
+    assert "race_start_ms" in run
+    assert '"race_cancel_latency_ms": ${race_cancel_latency_ms}' in run
+
+
+def test_cleanup_records_site_history(v5_workflow_data):
+    job = get_job(v5_workflow_data, "cleanup")
+    run = get_step_run(job, "Generate Summary Report")
+    assert "../lb_history.tsv" in run
+    assert "queue_wait_s" in run
+    assert "runtime_s" in run
+    assert '"skipped": ${skipped}' in run
+
+
+def test_site_jobs_stage_scripts_through_cache(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "../../.lb_script_cache" in run
+        assert "sha256sum" in run
+        for name in ("run-script.sh", "run.sh", "submit.sh"):
+            assert f"stage_file {name}" in run
+        assert "sed -i" not in run
+        assert ">> submit.sh" not in run
+
+
+def test_site_jobs_emit_timing_events(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert "emit_event()" in run
+        for event in ("submitted", "pending", "started", "ended", "cancelled"):
+            assert f"emit_event {event}" in run
+        assert f'"#SBATCH --qos=" "${{{{ inputs.sites_{i}.slurm.qos }}}}"' in run
+
+
+def test_cleanup_ingests_telemetry_store(v5_workflow_data):
+    job = get_job(v5_workflow_data, "cleanup")
+    run = get_step_run(job, "Generate Summary Report")
+    assert "../lb_telemetry.db" in run
+    assert "site_*/events.jsonl" in run
+    # The store is written by the embedded tools/lb_telemetry.py
+    assert "def record(db, coord_dir):" in run
+
+
 def test_cleanup_has_cleanup_handler(v5_workflow_data):
     job = get_job(v5_workflow_data, "cleanup")
     cleanup = get_step_cleanup(job, "Generate Summary Report")
     assert "STOP_STREAMING" in cleanup
+
+
+def test_steps_record_trace_spans(v5_workflow_data, v5_sites):
+    for i in v5_sites:
+        job = get_job(v5_workflow_data, f"site_{i}")
+        run = get_step_run(job, f"Submit Job to Site {i}")
+        assert sources(run, "trace_spans.sh")
+        assert 'TRACE_FILE="${PWD}/trace.tsv"' in run
+        for span in ("span_begin submit", "trace_started job.started", "span_end run"):
+            assert span in run
+        assert f'TRACE_STEP="Submit Job to Site {i} (cleanup)"' in get_step_cleanup(job, f"Submit Job to Site {i}")
+
+    initialize = get_step_run(get_job(v5_workflow_data, "initialize"), "Setup Coordination Directory")
+    assert 'TRACE_FILE="${COORD_DIR}/trace.tsv"' in initialize
+    job = get_job(v5_workflow_data, "cleanup")
+    for script in (get_step_run(job, "Generate Summary Report"), get_step_cleanup(job, "Generate Summary Report")):
+        assert "trace_export trace.json metrics.prom trace.tsv site_*/trace.tsv" in script
+
+
+def test_libraries_are_staged_once_per_run_and_site(v5_workflow_data, v5_sites):
+    initialize = get_step_run(get_job(v5_workflow_data, "initialize"), "Setup Coordination Directory")
+    for library in ("trace_spans.sh", "lb_state.sh", "marker_watch.sh", "ssh_mux.sh"):
+        assert f"stage_library {library} <<'LIBRARY_EOF'" in initialize
+    for i in v5_sites:
+        run = get_step_run(get_job(v5_workflow_data, f"site_{i}"), f"Submit Job to Site {i}")
+        for library in ("trace_spans.sh", "lb_state.sh", "sched_backend.sh", "marker_watch.sh"):
+            assert f"stage_library {library} <<'LIBRARY_EOF'" in run
+        assert "# >>> " not in get_step_cleanup(get_job(v5_workflow_data, f"site_{i}"), f"Submit Job to Site {i}")
+    # The coordinator steps after initialize only source them
+    for job_name in ("log", "cleanup", "collect"):
+        for step in get_job(v5_workflow_data, job_name)["steps"]:
+            for script in (step.get("run", ""), step.get("cleanup", "")):
+                assert "stage_library" not in script
+                assert all(line.startswith("# >>> telemetry store") for line in script.splitlines()
+                           if line.startswith("# >>> "))
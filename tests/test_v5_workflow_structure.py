@@ -8,36 +8,28 @@ def test_top_level_sections(v5_workflow_data):
     assert "inputs" in v5_workflow_data["on"]["execute"]
 
 
-def test_required_jobs_exist(v5_workflow_data):
-    expected_jobs = {
-        "initialize",
-        "site_0",
-        "site_1",
-        "site_2",
-        "site_3",
-        "site_4",
-        "log",
-        "cleanup",
-    }
+def test_required_jobs_exist(v5_workflow_data, v5_sites):
+    expected_jobs = {"initialize", "log", "cleanup", "collect"} | {f"site_{i}" for i in v5_sites}
     assert expected_jobs == set(v5_workflow_data["jobs"].keys())
+    assert v5_sites == list(range(5))
 
 
-def test_site_jobs_depend_on_initialize(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_depend_on_initialize(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job_name = f"site_{i}"
         job = get_job(v5_workflow_data, job_name)
         assert "initialize" in job.get("needs", [])
 
 
-def test_site_jobs_have_conditional_execution(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_have_conditional_execution(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job_name = f"site_{i}"
         job = get_job(v5_workflow_data, job_name)
         assert f"inputs.sites_{i}.enabled" in job.get("if", "")
 
 
-def test_site_jobs_use_site_specific_resources(v5_workflow_data):
-    for i in range(5):
+def test_site_jobs_use_site_specific_resources(v5_workflow_data, v5_sites):
+    for i in v5_sites:
         job_name = f"site_{i}"
         job = get_job(v5_workflow_data, job_name)
         assert f"inputs.sites_{i}.resource.ip" in job.get("ssh", {}).get(
@@ -56,13 +48,20 @@ def test_cleanup_job_always_runs(v5_workflow_data):
     assert job.get("if") == "${{ always }}"
 
 
-def test_cleanup_job_depends_on_all_sites_and_log(v5_workflow_data):
+def test_cleanup_job_depends_on_all_sites_and_log(v5_workflow_data, v5_sites):
     job = get_job(v5_workflow_data, "cleanup")
     needs = set(job.get("needs", []))
-    expected = {"site_0", "site_1", "site_2", "site_3", "site_4", "log"}
+    expected = {f"site_{i}" for i in v5_sites} | {"log"}
     assert expected == needs
 
 
+def test_collect_job_runs_after_cleanup(v5_workflow_data):
+    job = get_job(v5_workflow_data, "collect")
+    assert job.get("if") == "${{ always }}"
+    assert job.get("needs") == ["cleanup"]
+    assert job.get("working-directory") == get_job(v5_workflow_data, "cleanup").get("working-directory")
+
+
 def test_initialize_has_no_dependencies(v5_workflow_data):
     job = get_job(v5_workflow_data, "initialize")
     assert "needs" not in job or job.get("needs") is None
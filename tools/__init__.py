@@ -0,0 +1 @@
+# Helper tooling for the job_runner workflows (not used at workflow runtime).
@@ -0,0 +1,234 @@
+# Job tracking shared by the v4.0 PBS and SLURM jobs: array job monitoring,
+# efficiency capture after a job ends and right-sizing of the next request from
+# it. The caller sets SCHED_TYPE (slurm or pbs), which picks the memory format
+# of format_mem, and RIGHTSIZE_MODE (rightsizing input: off, suggest or apply).
+# record_efficiency and monitor_array need the scheduler backend; monitor_array
+# also needs the trace spans and marker watch libraries.
+#
+# Right-sizing: .job_efficiency/<sha256 of run-template.sh>.tsv holds the
+# accounting of recent runs of this script, written by record_efficiency. Once
+# RIGHTSIZE_MIN_RUNS runs completed, requests well above what they used
+# (peak + 25% CPU and memory, + 50% walltime) are reported, and replaced
+# with rightsizing: apply. A resource a recent run ran out of is left alone.
+RIGHTSIZE_MODE=${RIGHTSIZE_MODE:-suggest}
+RIGHTSIZE_MIN_RUNS=3
+
+# rightsize_file: the history file of run-template.sh
+rightsize_file() {
+  echo ".job_efficiency/$(sha256sum run-template.sh | cut -d' ' -f1).tsv"
+}
+
+# rightsize_history <file>: "<completed runs> <CPUs> <memory MB> <walltime s>"
+# for the whole job, - where no recommendation can be made
+rightsize_history() {
+  awk -F'\t' '
+    $3 == "OUT_OF_MEMORY" { oom = 1 }
+    $3 == "TIMEOUT" { timeout = 1 }
+    $3 != "COMPLETED" || $4 <= 0 { next }
+    {
+      runs++
+      if ($5 != "" && $5 / $4 > cores) cores = $5 / $4
+      if ($7 != "" && $7 > rss) { rss = $7; has_rss = 1 }
+      if ($4 > elapsed) elapsed = $4
+    }
+    END {
+      cpus = cores * 1.25; cpus = (cpus > int(cpus)) ? int(cpus) + 1 : int(cpus)
+      if (cpus < 1) cpus = 1
+      mem = int((rss * 1.25 + 255) / 256) * 256
+      walltime = int((elapsed * 1.5 + 899) / 900) * 900
+      print runs + 0, cpus, (oom || !has_rss) ? "-" : mem, timeout ? "-" : walltime
+    }' "$1" 2>/dev/null || true
+}
+
+# to_mb <memory> <unit of a bare number>: 32G, 4000M, 8gb, 512mb -> MB
+to_mb() {
+  local value=${1,,} unit
+  [[ "${value}" =~ ^([0-9]+)([kmgt]?)b?$ ]] || return 1
+  unit=${BASH_REMATCH[2]:-$2}
+  case "${unit}" in
+    k) echo $(( BASH_REMATCH[1] / 1024 )) ;;
+    m) echo "${BASH_REMATCH[1]}" ;;
+    g) echo $(( BASH_REMATCH[1] * 1024 )) ;;
+    t) echo $(( BASH_REMATCH[1] * 1048576 )) ;;
+    *) echo $(( BASH_REMATCH[1] / 1048576 )) ;;
+  esac
+}
+
+# to_seconds <time> <seconds per unit of a bare number>: [D-]HH:MM:SS -> seconds
+to_seconds() {
+  local days=0 value=$1 total=0 part parts
+  [[ "${value}" =~ ^[0-9:-]+$ ]] || return 1
+  if [[ "${value}" == *-* ]]; then
+    days=${value%%-*}
+    value=${value#*-}
+  fi
+  if [[ "${value}" != *:* ]]; then
+    echo $(( 10#${days} * 86400 + 10#${value} * $2 ))
+    return 0
+  fi
+  IFS=: read -ra parts <<< "${value}"
+  for part in "${parts[@]}"; do
+    total=$(( total * 60 + 10#${part} ))
+  done
+  echo $(( 10#${days} * 86400 + total ))
+}
+
+# Directive formatters, passed to rightsize: walltime as HH:MM:SS, memory in
+# MB as the SCHED_TYPE directives write it (8gb/512mb for PBS, 8G/512M for SLURM)
+format_seconds() {
+  printf '%02d:%02d:%02d\n' $(( $1 / 3600 )) $(( $1 % 3600 / 60 )) $(( $1 % 60 ))
+}
+
+format_mem() {
+  if [[ "${SCHED_TYPE}" == "pbs" ]]; then
+    (( $1 % 1024 == 0 )) && echo "$(( $1 / 1024 ))gb" || echo "$1mb"
+  else
+    (( $1 % 1024 == 0 )) && echo "$(( $1 / 1024 ))G" || echo "$1M"
+  fi
+}
+
+# rightsize <name> <current> <recommended> <current as requested> <formatter>:
+# report a request at least 20% above the recommendation. Succeeds, with the
+# new value in REPLY, when it is to be applied.
+rightsize() {
+  [[ "$2" =~ ^[0-9]+$ && "$3" =~ ^[0-9]+$ ]] || return 1
+  (( $3 * 10 <= $2 * 8 )) || return 1
+  REPLY=$($5 "$3")
+  if [[ "${RIGHTSIZE_MODE}" == "apply" ]]; then
+    echo "$(date) Right-sizing $1: $4 -> ${REPLY} (applied)"
+    return 0
+  fi
+  echo "$(date) Right-sizing $1: $4 -> ${REPLY} (set rightsizing: apply to use it)"
+  return 1
+}
+
+# record_efficiency <jobid>: the finished job's accounting goes to EFFICIENCY_FILE
+# (CPU, memory and walltime used against requested), to the step outputs and to
+# the rolling history of this script in .job_efficiency/, read by right-sizing
+EFFICIENCY_FILE=".job_efficiency/${PW_JOB_ID}.json"
+record_efficiency() {
+  local jobid=$1 history cpu_eff mem_eff summary
+  rm -f "${EFFICIENCY_FILE}"
+  [[ "${RIGHTSIZE_MODE}" != "off" ]] || return 0
+  sched_job_usage "${jobid}"
+  if [[ -z "${SCHED_ELAPSED}" ]]; then
+    echo "$(date) No accounting data for job ${jobid}"
+    return 0
+  fi
+  mkdir -p .job_efficiency
+  { read -r cpu_eff mem_eff; read -r summary; } < <(awk -v out="${EFFICIENCY_FILE}" -v jobid="${jobid}" -v state="${SCHED_STATE}" -v elapsed="${SCHED_ELAPSED}" \
+    -v cpu="${SCHED_CPU_TIME}" -v cpus="${SCHED_ALLOC_CPUS}" -v rss="${SCHED_MAX_RSS_MB}" \
+    -v req="${SCHED_REQ_MEM_MB}" -v limit="${SCHED_TIME_LIMIT}" '
+    function value(v) { return v == "" ? "null" : v }
+    function ratio(a, b) { return (a == "" || b == "" || b == 0) ? "null" : sprintf("%.3f", a / b) }
+    function percent(r) { return r == "null" ? "n/a" : sprintf("%d%%", r * 100 + 0.5) }
+    BEGIN {
+      cpu_eff = ratio(cpu, cpus == "" ? "" : elapsed * cpus)
+      mem_eff = ratio(rss, req)
+      time_eff = ratio(elapsed, limit)
+      printf "{\"jobid\": \"%s\", \"state\": \"%s\", \"elapsed_s\": %s, \"time_limit_s\": %s, \"time_efficiency\": %s, ", jobid, state, elapsed, value(limit), time_eff > out
+      printf "\"cpu_time_s\": %s, \"alloc_cpus\": %s, \"cpu_efficiency\": %s, ", value(cpu), value(cpus), cpu_eff > out
+      printf "\"max_rss_mb\": %s, \"req_mem_mb\": %s, \"mem_efficiency\": %s}\n", value(rss), value(req), mem_eff > out
+      print cpu_eff, mem_eff
+      printf "CPU %s of %s CPUs, memory %s of %s MB (%s), walltime %ss of %ss (%s)\n", percent(cpu_eff), value(cpus), value(rss), value(req), percent(mem_eff), elapsed, value(limit), percent(time_eff)
+    }')
+  echo "$(date) Efficiency: ${summary}"
+  echo "cpu_efficiency=${cpu_eff}" >> $OUTPUTS
+  echo "mem_efficiency=${mem_eff}" >> $OUTPUTS
+
+  history=$(rightsize_file)
+  printf '%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n' "$(date +%s)" "${jobid}" "${SCHED_STATE}" \
+    "${SCHED_ELAPSED}" "${SCHED_CPU_TIME}" "${SCHED_ALLOC_CPUS}" "${SCHED_MAX_RSS_MB}" "${SCHED_REQ_MEM_MB}" \
+    "${SCHED_TIME_LIMIT}" >> "${history}"
+  tail -n 20 "${history}" > "${history}.$$" && mv -f "${history}.$$" "${history}"
+}
+
+# Array jobs: one sched_array_states query per tick covers every element
+# ("element|STATE|exit_code" lines in ${ARRAY_DIR}/elements). The running tally
+# is logged when it changes; ${ARRAY_DIR}/status.tsv holds the per-element
+# result. ARRAY_DIR, .job_array.<job id> in the working directory, belongs to
+# this run. Polling backs off while the whole array waits in the queue. The
+# caller sets ARRAY_MAX_FAILURES (array_max_failures input, 0 for no limit).
+ARRAY_DIR=".job_array.${PW_JOB_ID}"
+ARRAY_MAX_FAILURES=${ARRAY_MAX_FAILURES:-0}
+[[ "${ARRAY_MAX_FAILURES}" =~ ^[0-9]+$ ]] || ARRAY_MAX_FAILURES=0
+
+array_tally() {
+  awk -F'|' '
+    $2 == "PENDING" { pending++; next }
+    $2 == "RUNNING" || $2 == "COMPLETING" { running++; next }
+    $2 == "COMPLETED" { completed++; next }
+    $2 == "CANCELLED" || $2 == "TIMEOUT" || $2 == "PREEMPTED" { stopped++; next }
+    { failed++ }
+    END { printf "%d %d %d %d %d %d\n", NR, pending, running, completed, failed, stopped }
+  ' "${ARRAY_DIR}/elements"
+}
+
+report_array() {
+  {
+    printf 'element\tstate\texit_code\n'
+    sort -t'|' -k1,1n "${ARRAY_DIR}/elements" | tr '|' '\t'
+  } > "${ARRAY_DIR}/status.tsv"
+  echo "$(date) Array job ${jobid}: ${completed} completed, ${failed} failed, ${stopped} cancelled or timed out of ${total} (${ARRAY_DIR}/status.tsv)"
+  sort -t'|' -k1,1n "${ARRAY_DIR}/elements" | awk -F'|' '
+    $2 ~ /^(FAILED|NODE_FAIL|OUT_OF_MEMORY|UNKNOWN)$/ {
+      if (++n <= 20) print "  element " $1 ": " $2 " (exit code " $3 ")"
+    }
+    END { if (n > 20) print "  ... and " n - 20 " more failed elements" }'
+  {
+    echo "array_completed=${completed}"
+    echo "array_failed=${failed}"
+  } >> $OUTPUTS
+}
+
+# monitor_array <jobid>: follow the array until every element ended and exit
+# the step, 1 when an element failed
+monitor_array() {
+  local jobid=$1 tally last_tally="" empty_ticks=0
+  rm -rf "${ARRAY_DIR}"
+  mkdir -p "${ARRAY_DIR}"
+  while true; do
+    sched_array_states "${jobid}" > "${ARRAY_DIR}/elements"
+    read -r total pending running completed failed stopped < <(array_tally)
+    if [[ ${running} -gt 0 || -f job.started ]]; then
+      trace_started job.started
+    fi
+    tally="${pending} ${running} ${completed} ${failed} ${stopped}"
+    if [[ ${running} -eq 0 && ${pending} -gt 0 && "${tally}" == "${last_tally}" ]]; then
+      sched_next_poll PENDING PENDING
+    else
+      sched_next_poll RUNNING
+    fi
+
+    if [[ ${total} -eq 0 ]]; then
+      # Accounting can lag behind submission
+      empty_ticks=$(( empty_ticks + 1 ))
+      if [[ ${empty_ticks} -ge 10 ]]; then
+        echo "$(date) ERROR: No elements found for array job ${jobid}"
+        touch job.ended
+        exit 1
+      fi
+    elif [[ "${tally}" != "${last_tally}" ]]; then
+      last_tally=${tally}
+      echo "$(date) Array job ${jobid}: ${pending} pending, ${running} running, ${completed} completed, ${failed} failed, ${stopped} cancelled/timeout"
+    fi
+
+    if [[ ${ARRAY_MAX_FAILURES} -gt 0 && ${failed} -ge ${ARRAY_MAX_FAILURES} ]]; then
+      echo "$(date) ERROR: ${failed} array elements failed (threshold ${ARRAY_MAX_FAILURES}), cancelling the remaining elements"
+      sched_cancel "${jobid}" 2>/dev/null || true
+      report_array
+      touch job.ended
+      exit 1
+    fi
+
+    if [[ ${total} -gt 0 && $(( pending + running )) -eq 0 ]]; then
+      span_end run
+      report_array
+      touch job.ended
+      [[ ${failed} -eq 0 ]] && exit 0
+      exit 1
+    fi
+
+    wait_for_markers "${SCHED_POLL}" job.started
+  done
+}
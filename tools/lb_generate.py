@@ -0,0 +1,86 @@
+"""Generate the v5.0 load balancer workflow for any number of sites.
+
+v5.0.yaml is rendered from the templates in ``tools/lb_template``:
+
+- ``workflow.yaml``: the coordinator, log streamer, summary and common inputs.
+  ``@@SITE_JOBS@@`` and ``@@SITE_INPUTS@@`` mark where the per-site blocks
+  go, lines containing ``@N@`` are repeated once per site, ``@SITE_NEEDS@``
+  expands to the list of site jobs and ``@SITES@`` to the site count.
+- ``site_job.yaml`` / ``site_inputs.yaml``: one site's job and input group,
+  with ``@N@`` for the site index. Site 0 is enabled by default and site N
+  defaults to priority N + 1.
+
+    python -m tools.lb_generate --sites 5 --output v5.0.yaml
+    python -m tools.lb_generate --sites 5 --output v5.0.yaml --check
+"""
+
+import argparse
+import pathlib
+import sys
+
+
+TEMPLATE_DIR = pathlib.Path(__file__).resolve().parent / "lb_template"
+DEFAULT_SITES = 5
+# The priority input accepts 1-100
+MAX_PRIORITY = 100
+
+
+def render_site(template, index):
+    return (
+        template.replace("@N@", str(index))
+        .replace("@ENABLED@", "true" if index == 0 else "false")
+        .replace("@PRIORITY@", str(min(index + 1, MAX_PRIORITY)))
+    )
+
+
+def generate(sites, template_dir=TEMPLATE_DIR, site_job=None, workflow=None):
+    """Render the workflow; ``site_job``/``workflow`` override the template texts."""
+    if sites < 1:
+        raise ValueError("at least one site is required")
+    template_dir = pathlib.Path(template_dir)
+    if workflow is None:
+        workflow = (template_dir / "workflow.yaml").read_text(encoding="utf-8")
+    if site_job is None:
+        site_job = (template_dir / "site_job.yaml").read_text(encoding="utf-8")
+    site_inputs = (template_dir / "site_inputs.yaml").read_text(encoding="utf-8")
+    needs = ", ".join(f"site_{index}" for index in range(sites))
+
+    out = []
+    for line in workflow.splitlines(keepends=True):
+        if line.strip() == "@@SITE_JOBS@@":
+            out.extend(render_site(site_job, index) for index in range(sites))
+        elif line.strip() == "@@SITE_INPUTS@@":
+            out.append("\n".join(render_site(site_inputs, index) for index in range(sites)))
+        elif "@N@" in line:
+            out.extend(render_site(line, index) for index in range(sites))
+        else:
+            out.append(line.replace("@SITE_NEEDS@", needs).replace("@SITES@", str(sites)))
+    return "".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the v5.0 load balancer workflow")
+    parser.add_argument("--sites", type=int, default=DEFAULT_SITES, help="number of sites (default: 5)")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    parser.add_argument("--check", action="store_true", help="exit 1 if --output is not up to date")
+    args = parser.parse_args(argv)
+
+    text = generate(args.sites)
+    if args.check:
+        if not args.output:
+            parser.error("--check requires --output")
+        current = pathlib.Path(args.output).read_text(encoding="utf-8")
+        if current != text:
+            print(f"{args.output} is out of date; run python -m tools.lb_generate "
+                  f"--sites {args.sites} --output {args.output}", file=sys.stderr)
+            return 1
+        return 0
+    if args.output:
+        pathlib.Path(args.output).write_text(text, encoding="utf-8")
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# Coordination state of the v5.0 sites. Each site directory keeps one append-only
+# log, state.log, with a line
+#   <epoch> <key> <value>   (tab-separated)
+# per change instead of one file per value: a change is a single O_APPEND write,
+# the last line of a key holds its value, and all of a site's state is read with
+# one open. The coordinator seeds the log before the site job starts and the site
+# is its only writer from then on, so appends never interleave across hosts.
+# Marker files (job.started, CANCEL_REQUESTED, WINNER, ...) stay files: their
+# creation is what wakes the watchers. The summary compacts every log into one
+# snapshot with state_compact.
+declare -A STATE=()
+
+# Status transitions a site may make; COMPLETED and SKIPPED are final. FAILED and
+# CANCELLED lead back to SUBMITTING on a retry or a race takeover.
+declare -A STATE_NEXT=(
+  [-]="PENDING CANCELLED"
+  [PENDING]="SUBMITTING SKIPPED FAILED CANCELLED"
+  [SUBMITTING]="SUBMITTED RUNNING FAILED CANCELLED"
+  [SUBMITTED]="RUNNING COMPLETED FAILED CANCELLED"
+  [RUNNING]="COMPLETED FAILED CANCELLED"
+  [FAILED]="SUBMITTING SKIPPED CANCELLED"
+  [CANCELLED]="SUBMITTING"
+)
+
+# state_set <dir> <key> <value> [<key> <value>...]: append the values to
+# <dir>/state.log in one write
+state_set() {
+  local dir=$1 now lines=""
+  shift
+  printf -v now '%(%s)T' -1
+  while [[ $# -ge 2 ]]; do
+    lines+="${now}"$'\t'"$1"$'\t'"$2"$'\n'
+    shift 2
+  done
+  printf '%s' "${lines}" >> "${dir}/state.log"
+}
+
+# state_read <dir>: STATE is the current state of the site in <dir>, read with
+# builtins so scans over every site fork no process
+state_read() {
+  local epoch key value
+  STATE=()
+  [ -f "$1/state.log" ] || return 0
+  while IFS=$'\t' read -r epoch key value; do
+    [[ -n "${key}" ]] && STATE[${key}]=${value}
+  done < "$1/state.log"
+}
+
+# state_get <dir> <key> [default]: REPLY is one value of the site in <dir>
+state_get() {
+  state_read "$1"
+  REPLY=${STATE[$2]:-${3:-}}
+}
+
+# state_status <status> [<key> <value>...]: move this site (the current directory)
+# to <status>, with the other values in the same write. A transition the state
+# machine does not allow is refused with status 1; repeating the status is a no-op.
+state_status() {
+  local next=$1
+  shift
+  if [[ -z "${STATE_STATUS+set}" ]]; then
+    state_read .
+    STATE_STATUS=${STATE[status]:-}
+  fi
+  if [[ "${next}" == "${STATE_STATUS}" ]]; then
+    [[ $# -eq 0 ]] || state_set . "$@"
+    return 0
+  fi
+  if [[ " ${STATE_NEXT[${STATE_STATUS:--}]:-} " != *" ${next} "* ]]; then
+    echo "$(date) [${SITE_ID:-${PWD##*/}}] ERROR: invalid status transition ${STATE_STATUS:-none} -> ${next}" >&2
+    return 1
+  fi
+  state_set . status "${next}" "$@"
+  STATE_STATUS=${next}
+}
+
+# state_compact <snapshot> <dir>...: write the current state of every site to
+# <snapshot>, one "<site dir> <key> <value>" line (tab-separated) per value, with
+# a rename so readers never see it half written
+state_compact() {
+  local snapshot=$1 dir logs=()
+  shift
+  for dir in "$@"; do
+    [ -f "${dir}/state.log" ] && logs+=("${dir}/state.log")
+  done
+  if [[ ${#logs[@]} -eq 0 ]]; then
+    : > "${snapshot}"
+    return 0
+  fi
+  awk -F'\t' '
+    {
+      site = FILENAME
+      sub(/\/state\.log$/, "", site)
+      value = $0
+      sub(/^[^\t]*\t[^\t]*\t/, "", value)
+      key = site "\t" $2
+      if (!(key in values)) order[n++] = key
+      values[key] = value
+    }
+    END { for (i = 0; i < n; i++) print order[i] "\t" values[order[i]] }
+  ' "${logs[@]}" > "${snapshot}.tmp" && mv -f "${snapshot}.tmp" "${snapshot}"
+}
+
+# state_load <snapshot>: STATE["<site dir>/<key>"] for every value in the snapshot
+state_load() {
+  local site key value
+  STATE=()
+  [ -f "$1" ] || return 0
+  while IFS=$'\t' read -r site key value; do
+    STATE[${site}/${key}]=${value}
+  done < "$1"
+}
@@ -0,0 +1,206 @@
+"""Queue-wait and runtime telemetry for the v5.0 load balancer.
+
+The ``cleanup`` job of every v5.0 execution merges the per-site
+``site_N/events.jsonl`` files into ``${rundir}/lb_telemetry.db``, an
+append-only SQLite store shared by all executions in that run directory.
+It runs this module (``record``), embedded into the step by
+``python -m tools.sched_sync``; the same module reads the store:
+
+    python -m tools.lb_telemetry report ${rundir}/lb_telemetry.db --by site
+    python -m tools.lb_telemetry ingest ${rundir}/lb_telemetry.db ${rundir}/lb_*
+
+``ingest`` backfills executions whose cleanup could not write the store.
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import sqlite3
+import sys
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    execution_id TEXT NOT NULL,
+    site TEXT NOT NULL,
+    site_name TEXT,
+    resource TEXT,
+    partition TEXT,
+    qos TEXT,
+    jobid TEXT,
+    event TEXT NOT NULL,
+    sched_state TEXT,
+    epoch REAL NOT NULL,
+    UNIQUE (execution_id, site, event, epoch)
+);
+CREATE INDEX IF NOT EXISTS events_by_site ON events (site_name, partition, qos);
+CREATE INDEX IF NOT EXISTS events_by_execution ON events (execution_id, site);
+"""
+
+INSERT = (
+    "INSERT OR IGNORE INTO events (execution_id, site, site_name, resource, "
+    "partition, qos, jobid, event, sched_state, epoch) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+GROUPS = {
+    "site": ("site_name", "resource"),
+    "partition": ("site_name", "partition"),
+    "qos": ("site_name", "partition", "qos"),
+}
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=30)
+    db.executescript(SCHEMA)
+    return db
+
+
+def event_row(execution_id, event):
+    return (
+        execution_id,
+        event.get("src", ""),
+        event.get("name", ""),
+        event.get("resource", ""),
+        event.get("partition", ""),
+        event.get("qos", ""),
+        event.get("jobid", ""),
+        event["event"],
+        event.get("sched_state", ""),
+        float(event["epoch"]),
+    )
+
+
+def read_events(coord_dir):
+    """Return the site events of one lb_${PW_JOB_ID} directory."""
+    events = []
+    for path in sorted(glob.glob(os.path.join(coord_dir, "site_*", "events.jsonl"))):
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if "event" in event and "epoch" in event:
+                    events.append(event)
+    return events
+
+
+def ingest(db, coord_dir, events=None):
+    execution_id = os.path.basename(os.path.abspath(coord_dir))
+    if execution_id.startswith("lb_"):
+        execution_id = execution_id[3:]
+    if events is None:
+        events = read_events(coord_dir)
+    rows = [event_row(execution_id, event) for event in events]
+    db.executemany(INSERT, rows)
+    db.commit()
+    return len(rows)
+
+
+def record(db, coord_dir):
+    """Append the site events of one execution to its events.jsonl in time order and store them."""
+    events = sorted(read_events(coord_dir), key=lambda event: event["epoch"])
+    with open(os.path.join(coord_dir, "events.jsonl"), "a", encoding="utf-8") as log:
+        for event in events:
+            log.write(json.dumps(event, separators=(",", ":")) + "\n")
+    return ingest(db, coord_dir, events)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def job_durations(db):
+    """Yield (site_name, resource, partition, qos, queue_wait, runtime) per job.
+
+    A site that was retried has one job per attempt, told apart by the jobid.
+    """
+    query = """
+        SELECT MAX(site_name), MAX(resource), MAX(partition), MAX(qos),
+               MIN(CASE WHEN event = 'submitted' THEN epoch END),
+               MIN(CASE WHEN event = 'started' THEN epoch END),
+               MAX(CASE WHEN event = 'ended' THEN epoch END)
+        FROM events
+        GROUP BY execution_id, site, jobid
+    """
+    for name, resource, partition, qos, submitted, started, ended in db.execute(query):
+        wait = started - submitted if submitted is not None and started is not None else None
+        runtime = ended - started if started is not None and ended is not None else None
+        yield name, resource, partition, qos, wait, runtime
+
+
+def report(db, by="site"):
+    """Return report rows: group key, job count and p50/p95/p99 of wait and runtime."""
+    columns = ("site_name", "resource", "partition", "qos")
+    keys = [columns.index(column) for column in GROUPS[by]]
+    groups = {}
+    for row in job_durations(db):
+        key = tuple(row[i] or "" for i in keys)
+        waits, runtimes = groups.setdefault(key, ([], []))
+        if row[4] is not None:
+            waits.append(row[4])
+        if row[5] is not None:
+            runtimes.append(row[5])
+
+    rows = []
+    for key in sorted(groups):
+        waits, runtimes = groups[key]
+        stats = []
+        for values in (waits, runtimes):
+            stats += [percentile(values, pct) if values else None for pct in (50, 95, 99)]
+        rows.append((key, len(waits), len(runtimes), stats))
+    return rows
+
+
+def format_report(rows, by="site"):
+    header = " / ".join(GROUPS[by])
+    lines = [
+        f"{header:<40}{'jobs':>6}{'wait p50':>10}{'p95':>8}{'p99':>8}"
+        f"{'run p50':>10}{'p95':>8}{'p99':>8}"
+    ]
+    for key, n_wait, n_run, stats in rows:
+        cells = ["-" if value is None else f"{value:.0f}" for value in stats]
+        lines.append(
+            f"{' / '.join(key):<40}{max(n_wait, n_run):>6}"
+            f"{cells[0]:>10}{cells[1]:>8}{cells[2]:>8}"
+            f"{cells[3]:>10}{cells[4]:>8}{cells[5]:>8}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load balancer queue-wait and runtime telemetry")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = commands.add_parser("report", help="p50/p95/p99 queue wait and runtime (seconds)")
+    report_parser.add_argument("db")
+    report_parser.add_argument("--by", choices=sorted(GROUPS), default="site")
+
+    ingest_parser = commands.add_parser("ingest", help="add lb_<id> directories to the store")
+    ingest_parser.add_argument("db")
+    ingest_parser.add_argument("coord_dirs", nargs="+")
+
+    record_parser = commands.add_parser("record", help="merge and store the events of a finished execution")
+    record_parser.add_argument("db")
+    record_parser.add_argument("coord_dir")
+
+    args = parser.parse_args(argv)
+    db = connect(args.db)
+    if args.command == "ingest":
+        for coord_dir in args.coord_dirs:
+            print(f"{coord_dir}: {ingest(db, coord_dir)} events")
+    elif args.command == "record":
+        print(f"Recorded {record(db, args.coord_dir)} site events in {args.db}")
+    else:
+        print(format_report(report(db, args.by), args.by))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
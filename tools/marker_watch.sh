@@ -0,0 +1,67 @@
+# Event-driven marker detection shared by v4.0 and v5.0: wait_for_markers
+# <timeout> <file>... returns as soon as one of the files appears, or after
+# <timeout> seconds. inotify delivers the event within milliseconds on local
+# filesystems; on network filesystems, where writes from other hosts raise no
+# events, the files are stat-polled every 0.5 seconds instead. The caller sets
+# WATCH_MODE (watch_mode input: auto, inotify or poll); it is resolved here to
+# inotify or poll for the working directory.
+WATCH_MODE=${WATCH_MODE:-auto}
+if [[ "${WATCH_MODE}" != "poll" ]]; then
+  fs_type=$(stat -f -c %T . 2>/dev/null || echo unknown)
+  if ! command -v inotifywait >/dev/null 2>&1; then
+    WATCH_MODE="poll"
+  elif [[ "${WATCH_MODE}" != "inotify" && "${fs_type}" =~ ^(nfs|lustre|gpfs|ceph|cifs|smb|fuse|beegfs|panfs|unknown) ]]; then
+    WATCH_MODE="poll"
+  else
+    WATCH_MODE="inotify"
+  fi
+fi
+
+wait_for_markers() {
+  local timeout=$1
+  shift
+  local deadline=$(( $(date +%s) + timeout ))
+  local missing=() dirs=() f fd pid line rc remaining
+  for f in "$@"; do
+    [ -e "${f}" ] || missing+=("${f}")
+  done
+  if [[ ${#missing[@]} -eq 0 ]]; then
+    sleep "${timeout}"
+    return 0
+  fi
+  mapfile -t dirs < <(for f in "${missing[@]}"; do dirname "${f}"; done | sort -u)
+
+  if [[ "${WATCH_MODE}" == "inotify" ]]; then
+    # Watch first, then check the files: a marker created in between still
+    # raises an event. Every event in the directories triggers a new check.
+    coproc MARKER_WATCH { exec inotifywait -m -e create -e moved_to "${dirs[@]}" 2>&1; }
+    fd=${MARKER_WATCH[0]}
+    pid=${MARKER_WATCH_PID}
+    rc=1
+    while IFS= read -r -t 5 -u "${fd}" line; do
+      [[ "${line}" == "Watches established." ]] && rc=0 && break
+    done
+    while [[ ${rc} -eq 0 ]]; do
+      for f in "${missing[@]}"; do
+        [ -e "${f}" ] && break 2
+      done
+      remaining=$(( deadline - $(date +%s) ))
+      [[ ${remaining} -gt 0 ]] || break
+      IFS= read -r -t "${remaining}" -u "${fd}" line || rc=$?
+      # rc above 128 is the timeout; any other failure means the watch ended
+      [[ ${rc} -gt 128 ]] && break
+    done
+    kill "${pid}" 2>/dev/null || true
+    wait "${pid}" 2>/dev/null || true
+    [[ ${rc} -eq 0 || ${rc} -gt 128 ]] && return 0
+  fi
+
+  # Polling, also when the watch could not be set up or ended early
+  while true; do
+    for f in "${missing[@]}"; do
+      [ -e "${f}" ] && return 0
+    done
+    [[ $(date +%s) -lt ${deadline} ]] || return 0
+    sleep 0.5
+  done
+}
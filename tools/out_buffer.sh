@@ -0,0 +1,98 @@
+# Node-local output buffering for the job scripts of v4.0 and v5.0 (output_buffer
+# input). Placed at the top of run.sh/submit.sh, out_buffer_start moves the
+# script's stdout and stderr to a file on node-local storage, and a background
+# flusher appends what accumulates there to the original output (run.out, the
+# scheduler's --output) every OUT_BUFFER_INTERVAL seconds, in writes of up to
+# 4 MiB: the shared filesystem sees a few large writes instead of one per line.
+# TERM, INT and HUP (scancel, qdel, walltime limit) flush at once, and the EXIT
+# trap flushes the rest before the script ends.
+#
+# Loss on crash: output reaches the shared file at most OUT_BUFFER_INTERVAL
+# seconds after it was written. What was written since the last flush is lost if
+# the job is killed without running its traps: SIGKILL after the scheduler's
+# grace period, the OOM killer or a node failure. A script that sets its own EXIT
+# trap must call out_buffer_stop from it.
+OUT_BUFFER_INTERVAL=${OUT_BUFFER_INTERVAL:-30}
+
+# out_buffer_dir: REPLY is the directory for the buffer, the first writable of
+# OUT_BUFFER_DIR, the job's TMPDIR, /dev/shm and /tmp
+out_buffer_dir() {
+  local dir
+  for dir in "${OUT_BUFFER_DIR:-}" "${TMPDIR:-}" /dev/shm /tmp; do
+    if [[ -n "${dir}" && -d "${dir}" && -w "${dir}" ]]; then
+      REPLY=${dir}
+      return 0
+    fi
+  done
+  return 1
+}
+
+# out_buffer_flush: append what the buffer gained since the last flush to the
+# output (and as one gzip member to the archive), then free the flushed part of
+# the buffer by punching a hole into it, which keeps the offsets valid
+out_buffer_flush() {
+  local size count
+  size=$(stat -c %s "${OUT_BUFFER_FILE}" 2>/dev/null) || return 0
+  [[ ${size} -gt ${OUT_BUFFER_OFFSET} ]] || return 0
+  count=$(( size - OUT_BUFFER_OFFSET ))
+  dd if="${OUT_BUFFER_FILE}" bs=4M iflag=skip_bytes,count_bytes,fullblock skip="${OUT_BUFFER_OFFSET}" \
+    count="${count}" status=none >&"${OUT_BUFFER_SINK}" 2>/dev/null || return 1
+  if [[ -n "${OUT_BUFFER_ARCHIVE}" ]]; then
+    dd if="${OUT_BUFFER_FILE}" bs=4M iflag=skip_bytes,count_bytes,fullblock skip="${OUT_BUFFER_OFFSET}" \
+      count="${count}" status=none 2>/dev/null | gzip -c >> "${OUT_BUFFER_ARCHIVE}" 2>/dev/null || true
+  fi
+  OUT_BUFFER_OFFSET=${size}
+  fallocate -p -o 0 -l $(( size / 4096 * 4096 )) "${OUT_BUFFER_FILE}" 2>/dev/null || true
+}
+
+# out_buffer_flusher <pid>: flush every OUT_BUFFER_INTERVAL seconds until <pid>
+# exits or USR1 asks for the final flush. TERM, INT and HUP, which the scheduler
+# sends every process of the job, flush at once and keep the flusher alive for
+# the final flush.
+out_buffer_flusher() {
+  local parent=$1 stop=0 flush=0 elapsed=0
+  trap 'flush=1' TERM INT HUP
+  trap 'stop=1' USR1
+  while [[ ${stop} -eq 0 ]] && kill -0 "${parent}" 2>/dev/null; do
+    sleep 1 &
+    wait $! 2>/dev/null || true
+    elapsed=$(( elapsed + 1 ))
+    if [[ ${flush} -eq 1 || ${elapsed} -ge ${OUT_BUFFER_INTERVAL} ]]; then
+      out_buffer_flush || true
+      flush=0
+      elapsed=0
+    fi
+  done
+  out_buffer_flush || true
+}
+
+# out_buffer_start <output file> [true|false]: buffer the rest of the script's
+# output; with true, also keep a gzip archive of it in <output file>.gz (one per
+# array element). The output file is resolved when the job runs, so the staged
+# script stays the same from run to run. Writes straight to the output if no
+# directory is writable.
+out_buffer_start() {
+  local output=$1 element=${SLURM_ARRAY_TASK_ID:-${PBS_ARRAY_INDEX:-}}
+  out_buffer_dir || return 0
+  OUT_BUFFER_FILE=$(mktemp "${REPLY}/job_output.XXXXXX" 2>/dev/null) || return 0
+  OUT_BUFFER_OFFSET=0
+  OUT_BUFFER_ARCHIVE=""
+  [[ "${2:-false}" == "true" && -n "${output}" ]] && OUT_BUFFER_ARCHIVE="${output}${element:+.${element}}.gz"
+  exec {OUT_BUFFER_SINK}>&1
+  exec >> "${OUT_BUFFER_FILE}" 2>&1
+  out_buffer_flusher "$$" > /dev/null 2>&1 &
+  OUT_BUFFER_PID=$!
+  trap out_buffer_stop EXIT
+  trap 'exit 143' TERM
+  trap 'exit 130' INT
+  trap 'exit 129' HUP
+}
+
+# out_buffer_stop: flush the rest and write straight to the output from here on
+out_buffer_stop() {
+  [[ -n "${OUT_BUFFER_PID:-}" ]] || return 0
+  kill -USR1 "${OUT_BUFFER_PID}" 2>/dev/null && wait "${OUT_BUFFER_PID}" 2>/dev/null
+  exec >&"${OUT_BUFFER_SINK}" 2>&1
+  rm -f "${OUT_BUFFER_FILE}"
+  OUT_BUFFER_PID=""
+}
@@ -0,0 +1,379 @@
+# Scheduler backend shared by v3.5, v4.0 and v5.0. Every query targets one job
+# (or one user's jobs) with limited fields, and states are normalized to
+#   PENDING RUNNING COMPLETING COMPLETED FAILED CANCELLED TIMEOUT PREEMPTED
+#   NODE_FAIL OUT_OF_MEMORY UNKNOWN (job not found)
+# SCHED_TYPE (slurm or pbs) must be set by the caller. With SLURMRESTD_URL set
+# (token in SLURM_JWT), SLURM job queries and cancellation go to slurmrestd and
+# fall back to the CLI when the request fails. SCHED_CALLS counts every scheduler
+# command or REST request made by this script.
+SCHED_REST_URL="${SCHED_REST_URL:-${SLURMRESTD_URL:-}}"
+SCHED_REST_VERSION="${SCHED_REST_VERSION:-v0.0.40}"
+SCHED_CALLS=0
+
+# sched_normalize <state> [exit_status]: sets REPLY to the normalized state.
+# PBS final states need the exit status: 271 is the walltime kill, -11/-12 and
+# 265 a qdel; a finished subjob (X) without one never ran.
+sched_normalize() {
+  local state=${1%% *} exit_status=${2:-}
+  if [[ "${SCHED_TYPE}" == "pbs" ]]; then
+    case "${state}" in
+      Q|H|W|T|M) REPLY=PENDING ;;
+      R|B|S|U) REPLY=RUNNING ;;
+      E) REPLY=COMPLETING ;;
+      C|F|X)
+        case "${exit_status}" in
+          0) REPLY=COMPLETED ;;
+          "") [[ "${state}" == "X" ]] && REPLY=CANCELLED || REPLY=COMPLETED ;;
+          271) REPLY=TIMEOUT ;;
+          -11|-12|265) REPLY=CANCELLED ;;
+          *) REPLY=FAILED ;;
+        esac
+        ;;
+      *) REPLY=UNKNOWN ;;
+    esac
+    return 0
+  fi
+  case "${state}" in
+    PD|PENDING|CF|CONFIGURING|RQ|REQUEUED|RH|REQUEUE_HOLD|RF|REQUEUE_FED|RD|RESV_DEL_HOLD) REPLY=PENDING ;;
+    R|RUNNING|S|SUSPENDED|ST|STOPPED|RS|RESIZING|SI|SIGNALING|SO|STAGE_OUT) REPLY=RUNNING ;;
+    CG|COMPLETING) REPLY=COMPLETING ;;
+    CD|COMPLETED) REPLY=COMPLETED ;;
+    CA|CANCELLED|RV|REVOKED) REPLY=CANCELLED ;;
+    TO|TIMEOUT|DL|DEADLINE) REPLY=TIMEOUT ;;
+    PR|PREEMPTED) REPLY=PREEMPTED ;;
+    NF|NODE_FAIL|BF|BOOT_FAIL) REPLY=NODE_FAIL ;;
+    OOM|OUT_OF_MEMORY) REPLY=OUT_OF_MEMORY ;;
+    F|FAILED|SE|SPECIAL_EXIT) REPLY=FAILED ;;
+    *) REPLY=UNKNOWN ;;
+  esac
+}
+
+# sched_epoch <time>: sets REPLY to the epoch seconds of a scheduler timestamp
+# (epoch, ISO 8601 or ctime format), or empty for N/A and unparseable values
+sched_epoch() {
+  REPLY=""
+  case "$1" in
+    ""|N/A|NONE|Unknown|None) ;;
+    *[!0-9]*) REPLY=$(date -d "$1" +%s 2>/dev/null) || REPLY="" ;;
+    *) [[ $1 -gt 0 ]] && REPLY=$1 ;;
+  esac
+  return 0
+}
+
+# sched_rest <method> <path>: slurmrestd request; fails on connection or HTTP errors
+sched_rest() {
+  local headers=(-H "X-SLURM-USER-NAME: ${USER}")
+  [[ -n "${SLURM_JWT:-}" ]] && headers+=(-H "X-SLURM-USER-TOKEN: ${SLURM_JWT}")
+  curl -sf --max-time 10 -X "$1" "${headers[@]}" "${SCHED_REST_URL%/}/slurm/${SCHED_REST_VERSION}/$2" 2>/dev/null
+}
+
+# sched_submit <script>: sets SCHED_JOBID (numeric) and SCHED_SUBMIT_OUTPUT
+sched_submit() {
+  local rc=0 line
+  SCHED_JOBID=""
+  SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    SCHED_SUBMIT_OUTPUT=$(sbatch --parsable "$1" 2>&1) || rc=$?
+    # <jobid>[;<cluster>] on the last line; warnings may precede it
+    line=${SCHED_SUBMIT_OUTPUT##*$'\n'}
+    line=${line%%;*}
+    line=${line##* }
+  else
+    SCHED_SUBMIT_OUTPUT=$(qsub "$1" 2>&1) || rc=$?
+    # <jobid>[.<server>], or <jobid>[].<server> for arrays
+    line=${SCHED_SUBMIT_OUTPUT##*$'\n'}
+    line=${line%%.*}
+    line=${line%%\[*}
+  fi
+  [[ ${rc} -eq 0 && "${line}" =~ ^[0-9]+$ ]] || return 1
+  SCHED_JOBID=${line}
+}
+
+# sched_job_state <jobid>: sets SCHED_STATE, SCHED_EXIT (empty if unknown) and,
+# for pending jobs, SCHED_START: the scheduler's start estimate in epoch seconds
+# (empty without one), taken from the same query
+sched_job_state() {
+  local jobid=$1 state="" start="" out="" re
+  SCHED_EXIT=""
+  SCHED_START=""
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    if [[ -n "${SCHED_REST_URL}" ]]; then
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      out=$(sched_rest GET "job/${jobid}") || out=""
+      # job_state is a list from v0.0.40 on and a string before
+      re='"job_state": *\[? *"([A-Z_]+)"'
+      [[ "${out}" =~ ${re} ]] && state=${BASH_REMATCH[1]}
+      re='"return_code": *\{[^}]*"number": *(-?[0-9]+)|"exit_code": *(-?[0-9]+)'
+      [[ "${out}" =~ ${re} ]] && SCHED_EXIT=${BASH_REMATCH[1]:-${BASH_REMATCH[2]}}
+      re='"start_time": *(\{[^}]*"number": *)?([0-9]+)'
+      [[ "${out}" =~ ${re} ]] && start=${BASH_REMATCH[2]}
+    fi
+    if [[ -z "${state}" ]]; then
+      # %S is the expected start time while the job is pending (squeue --start)
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      out=$(squeue -h -j "${jobid}" -o "%T %S" 2>/dev/null) || out=""
+      out=${out%%$'\n'*}
+      state=${out%% *}
+      [[ "${out}" == *" "* ]] && start=${out#* }
+    fi
+    if [[ -z "${state}" ]]; then
+      # Left the queue: accounting has the final state and <code>:<signal>
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      out=$(sacct -j "${jobid}" -X -P -n -o State,ExitCode 2>/dev/null) || out=""
+      out=${out%%$'\n'*}
+      if [[ -n "${out}" ]]; then
+        state=${out%%|*}
+        SCHED_EXIT=${out##*|}
+        SCHED_EXIT=${SCHED_EXIT%%:*}
+      fi
+    fi
+  else
+    # PBS Pro answers -F json -x (finished jobs included); Torque needs plain -f
+    SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+    if ! out=$(qstat -f -F json -x "${jobid}" 2>/dev/null); then
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      out=$(qstat -f "${jobid}" 2>/dev/null) || out=""
+    fi
+    re='"?job_state"? *[:=] *"?([A-Z])'
+    [[ "${out}" =~ ${re} ]] && state=${BASH_REMATCH[1]}
+    re='"?Exit_status"? *[:=] *(-?[0-9]+)'
+    [[ "${out}" =~ ${re} ]] && SCHED_EXIT=${BASH_REMATCH[1]}
+    # estimated.start_time, set by the scheduler's calendaring of queued jobs
+    re='"?start_time"? *[:=] *"?([^"'$'\n'',]+)'
+    [[ "${out}" =~ ${re} ]] && start=${BASH_REMATCH[1]}
+  fi
+  sched_normalize "${state}" "${SCHED_EXIT}"
+  SCHED_STATE=${REPLY}
+  if [[ "${SCHED_STATE}" == "PENDING" ]]; then
+    sched_epoch "${start}"
+    SCHED_START=${REPLY}
+  fi
+}
+
+# sched_user_states: "<jobid> <STATE> [<start estimate>]" for every job of ${USER},
+# in one query; fails without output if the scheduler could not be queried
+sched_user_states() {
+  local out jobid state exit_status start
+  SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    if ! out=$(squeue --me -h -o "%i %T - %S" 2>/dev/null); then
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      out=$(squeue -u "${USER}" -h -o "%i %T - %S" 2>/dev/null) || return 1
+    fi
+  elif command -v python3 >/dev/null 2>&1; then
+    out=$(qstat -f -F json 2>/dev/null | python3 -c '
+import json, sys
+for job_id, job in json.load(sys.stdin).get("Jobs", {}).items():
+    if job.get("Job_Owner", "").split("@")[0] == sys.argv[1]:
+        exit_status = job.get("Exit_status")
+        start = (job.get("estimated") or {}).get("start_time", "")
+        print(job_id.split(".")[0], job.get("job_state", ""), "-" if exit_status is None else exit_status, start)
+' "${USER}") || return 1
+  else
+    out=$(qstat -u "${USER}" 2>/dev/null | awk '$1 ~ /^[0-9]/ { split($1, a, "."); print a[1], $10 }') || return 1
+  fi
+  while read -r jobid state exit_status start; do
+    [[ -n "${jobid}" ]] || continue
+    [[ "${exit_status}" == "-" ]] && exit_status=""
+    sched_normalize "${state}" "${exit_status}"
+    state=${REPLY}
+    if [[ "${state}" == "PENDING" ]]; then
+      sched_epoch "${start}"
+      echo "${jobid} ${state}${REPLY:+ ${REPLY}}"
+    else
+      echo "${jobid} ${state}"
+    fi
+  done <<< "${out}"
+}
+
+# sched_job_usage <jobid>: accounting of a finished job, from one sacct (SLURM) or
+# qstat -f (PBS) call. Sets SCHED_ELAPSED, SCHED_CPU_TIME and SCHED_TIME_LIMIT
+# (seconds), SCHED_ALLOC_CPUS, SCHED_MAX_RSS_MB and SCHED_REQ_MEM_MB; each is
+# empty when the scheduler does not report it.
+sched_job_usage() {
+  local out
+  SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    # The allocation line carries the totals and requests, MaxRSS is per step
+    out=$(sacct -j "$1" -P -n -o JobID,Elapsed,TotalCPU,AllocCPUS,MaxRSS,ReqMem,Timelimit 2>/dev/null) || out=""
+  elif ! out=$(qstat -f -x "$1" 2>/dev/null); then
+    SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+    out=$(qstat -f "$1" 2>/dev/null) || out=""
+  fi
+  read -r SCHED_ELAPSED SCHED_CPU_TIME SCHED_ALLOC_CPUS SCHED_MAX_RSS_MB SCHED_REQ_MEM_MB SCHED_TIME_LIMIT < <(
+    awk -v scheduler="${SCHED_TYPE}" '
+      # [D-]HH:MM:SS[.mmm], MM:SS.mmm or seconds
+      function seconds(t,   days, n, part, s, i) {
+        if (t !~ /^[0-9]/) return ""
+        days = 0
+        if (t ~ /-/) { days = substr(t, 1, index(t, "-") - 1); t = substr(t, index(t, "-") + 1) }
+        n = split(t, part, ":")
+        for (i = 1; i <= n; i++) s = s * 60 + part[i]
+        return int(days * 86400 + s + 0.5)
+      }
+      # 123K, 4000M, 1.5G, 32gb, 1024kb; bare numbers are MB on SLURM, bytes on PBS
+      function megabytes(m, default_unit,   unit, v) {
+        if (m !~ /^[0-9]/) return ""
+        v = m + 0
+        unit = tolower(m); sub(/^[0-9.]+/, "", unit); sub(/b$/, "", unit)
+        if (unit == "") unit = default_unit
+        if (unit == "k") v /= 1024
+        else if (unit == "g") v *= 1024
+        else if (unit == "t") v *= 1048576
+        else if (unit == "") v /= 1048576
+        return int(v + 0.5)
+      }
+      function show(v) { return v == "" ? "-" : v }
+      scheduler == "slurm" {
+        split($0, f, "|")
+        if (f[1] !~ /\./) {
+          elapsed = seconds(f[2]); cpu = seconds(f[3]); cpus = f[4]; limit = seconds(f[7])
+          # Older releases suffix ReqMem with n (per node) or c (per CPU)
+          req = f[6]; per_cpu = req ~ /c$/; sub(/[nc]$/, "", req)
+          req = megabytes(req, "m"); if (per_cpu && req != "") req *= cpus
+        }
+        rss_step = megabytes(f[5], "m")
+        if (rss_step != "" && rss_step > rss + 0) rss = rss_step
+        next
+      }
+      {
+        split($0, kv, " = "); key = kv[1]; gsub(/ /, "", key); value = kv[2]
+        if (key == "resources_used.walltime") elapsed = seconds(value)
+        else if (key == "resources_used.cput") cpu = seconds(value)
+        else if (key == "resources_used.mem") rss = megabytes(value, "")
+        else if (key == "resources_used.ncpus" || (key == "Resource_List.ncpus" && cpus == "")) cpus = value
+        else if (key == "Resource_List.mem") req = megabytes(value, "")
+        else if (key == "Resource_List.walltime") limit = seconds(value)
+      }
+      END { print show(elapsed), show(cpu), show(cpus), show(rss), show(req), show(limit) }
+    ' <<< "${out}")
+  [[ "${SCHED_ELAPSED}" == "-" ]] && SCHED_ELAPSED=""
+  [[ "${SCHED_CPU_TIME}" == "-" ]] && SCHED_CPU_TIME=""
+  [[ "${SCHED_ALLOC_CPUS}" == "-" ]] && SCHED_ALLOC_CPUS=""
+  [[ "${SCHED_MAX_RSS_MB}" == "-" ]] && SCHED_MAX_RSS_MB=""
+  [[ "${SCHED_REQ_MEM_MB}" == "-" ]] && SCHED_REQ_MEM_MB=""
+  [[ "${SCHED_TIME_LIMIT}" == "-" ]] && SCHED_TIME_LIMIT=""
+  return 0
+}
+
+# sched_array_states <jobid>: "<element>|<STATE>|<exit code>" per array element,
+# from one sacct --array (SLURM) or qstat -t (PBS) call
+sched_array_states() {
+  local element state exit_status
+  SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    # ExitCode is <code>:<signal>; a signal is reported as 128 + signal
+    sacct -j "$1" --array -X -P -n -o JobID,State,ExitCode 2>/dev/null | awk -F'|' '
+      $1 ~ /_[0-9]+$/ {
+        split($1, id, "_"); split($3, code, ":")
+        print id[2] "|" $2 "|" (code[2] > 0 ? 128 + code[2] : code[1])
+      }'
+  else
+    qstat -f -t -x "$1" 2>/dev/null | awk '
+      function emit() { if (element != "") print element "|" state "|" code }
+      /^Job Id:/ {
+        emit()
+        element = ""; state = ""; code = ""
+        if (match($3, /\[[0-9]+\]/)) element = substr($3, RSTART + 1, RLENGTH - 2)
+        next
+      }
+      $1 == "job_state" { state = $3 }
+      $1 == "Exit_status" { code = $3 }
+      END { emit() }'
+  fi | while IFS='|' read -r element state exit_status; do
+    sched_normalize "${state}" "${exit_status}"
+    echo "${element}|${REPLY}|${exit_status}"
+  done
+}
+
+# sched_queue_depth [partition|queue]: sets REPLY to the number of pending jobs in
+# the partition (SLURM) or queue (PBS), or on the whole cluster without one, from
+# one squeue or qstat -Q call; 0 when the scheduler could not be queried
+sched_queue_depth() {
+  local target=${1:-}
+  [[ "${target}" == "undefined" ]] && target=""
+  SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    REPLY=$(squeue --noheader --states=PENDING ${target:+--partition="${target}"} --format=%i 2>/dev/null | wc -l)
+  else
+    REPLY=$(qstat -Q -f ${target:+"${target}"} 2>/dev/null | grep -oE 'Queued:[0-9]+' | cut -d: -f2 | awk '{ s += $1 } END { print s + 0 }')
+  fi
+  REPLY=$(( ${REPLY:-0} + 0 ))
+}
+
+# sched_job_nodes <jobid>: sets SCHED_NODES to the job's hosts, from the REST job
+# record or squeue %N (SLURM, expanded with scontrol show hostnames) or exec_host
+# in qstat -f (PBS); empty until the job has nodes
+sched_job_nodes() {
+  local out="" nodelist="" re
+  SCHED_NODES=()
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    if [[ -n "${SCHED_REST_URL}" ]]; then
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      out=$(sched_rest GET "job/$1") || out=""
+      re='"nodes": *"([^"]*)"'
+      [[ "${out}" =~ ${re} ]] && nodelist=${BASH_REMATCH[1]}
+    fi
+    if [[ -z "${out}" ]]; then
+      SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+      nodelist=$(squeue -h -j "$1" -o "%N" 2>/dev/null | head -n 1)
+    fi
+    [[ -n "${nodelist}" && "${nodelist}" != "(null)" ]] || return 0
+    SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+    mapfile -t SCHED_NODES < <(scontrol show hostnames "${nodelist}" 2>/dev/null || echo "${nodelist}")
+  else
+    # exec_host is host/cpu[*n]+host/cpu...; long values continue on tab-indented lines
+    SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+    mapfile -t SCHED_NODES < <(qstat -f "$1" 2>/dev/null | awk '
+      $1 == "exec_host" { hosts = $3; more = 1; next }
+      more && /^\t/ { sub(/^\t+/, ""); hosts = hosts $0; next }
+      { more = 0 }
+      END { print hosts }' | tr '+' '\n' | cut -d/ -f1 | sed '/^$/d' | sort -u)
+  fi
+}
+
+# sched_cancel <jobid>...: cancel the jobs, with one scancel/qdel call on the CLI
+# bounded by SCHED_CANCEL_TIMEOUT seconds
+SCHED_CANCEL_TIMEOUT="${SCHED_CANCEL_TIMEOUT:-30}"
+sched_cancel() {
+  local jobid failed=()
+  [[ $# -gt 0 ]] || return 0
+  if [[ "${SCHED_TYPE}" == "slurm" ]]; then
+    if [[ -n "${SCHED_REST_URL}" ]]; then
+      for jobid in "$@"; do
+        SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+        sched_rest DELETE "job/${jobid}" >/dev/null || failed+=("${jobid}")
+      done
+      [[ ${#failed[@]} -eq 0 ]] && return 0
+      set -- "${failed[@]}"
+    fi
+    SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+    timeout "${SCHED_CANCEL_TIMEOUT}" scancel "$@"
+  else
+    SCHED_CALLS=$(( SCHED_CALLS + 1 ))
+    timeout "${SCHED_CANCEL_TIMEOUT}" qdel "$@"
+  fi
+}
+
+# Adaptive polling: sched_next_poll <state> <previous state> sets SCHED_POLL, the
+# seconds to wait before the next status query. After a state change and outside
+# the queue it is SCHED_POLL_MIN; while the job stays PENDING it doubles up to
+# SCHED_POLL_MAX, but never beyond half the time left until the start estimate
+# (SCHED_START), so polling tightens as the job nears the head of the queue.
+SCHED_POLL_MIN="${SCHED_POLL_MIN:-15}"
+SCHED_POLL_MAX="${SCHED_POLL_MAX:-600}"
+SCHED_POLL=${SCHED_POLL_MIN}
+sched_next_poll() {
+  local until_start
+  if [[ "$1" != "PENDING" || "$1" != "$2" ]]; then
+    SCHED_POLL=${SCHED_POLL_MIN}
+    return 0
+  fi
+  SCHED_POLL=$(( SCHED_POLL * 2 < SCHED_POLL_MAX ? SCHED_POLL * 2 : SCHED_POLL_MAX ))
+  if [[ -n "${SCHED_START:-}" ]]; then
+    until_start=$(( (SCHED_START - $(date +%s)) / 2 ))
+    [[ ${until_start} -lt ${SCHED_POLL} ]] && SCHED_POLL=${until_start}
+  fi
+  [[ ${SCHED_POLL} -lt ${SCHED_POLL_MIN} ]] && SCHED_POLL=${SCHED_POLL_MIN}
+  return 0
+}
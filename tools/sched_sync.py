@@ -0,0 +1,166 @@
+"""Embed the shared shell libraries into the workflow step scripts.
+
+Steps run as standalone bash over SSH, so each workflow carries the libraries
+its steps use, once: the first step stages them with ``stage_library <file>``
+heredocs into ``WORKFLOW_LIB`` (``.workflow_lib/<job id>/`` of the v3.5 and v4.0
+rundir, ``lb_<job id>/.workflow_lib/`` for the v5.0 coordinator, the site
+directory for a v5.0 site job) and every later step on that filesystem sources
+``${WORKFLOW_LIB}/<file>``. ``tools/sched_backend.sh`` serves the steps that talk
+to a scheduler, ``tools/trace_spans.sh`` every traced step, ``tools/ssh_mux.sh``
+the steps that ssh to compute nodes or sites, ``tools/lb_state.sh`` the v5.0
+steps that read or write the coordination state, ``tools/marker_watch.sh`` the
+steps that wait for marker files and ``tools/job_tracking.sh`` the v4.0 PBS and
+SLURM steps that right-size a request or record a job's efficiency. Each copy
+sits between two marker lines; ``tools/out_buffer.sh`` sits in a heredoc that the
+steps writing job scripts add to the script when output buffering is on, and
+``tools/lb_telemetry.py`` in the heredoc the v5.0 summary step feeds to python3:
+
+    # >>> scheduler backend (tools/sched_backend.sh)
+    # <<< scheduler backend
+
+    # >>> trace spans (tools/trace_spans.sh)
+    # <<< trace spans
+
+    # >>> ssh multiplexing (tools/ssh_mux.sh)
+    # <<< ssh multiplexing
+
+    # >>> coordination state (tools/lb_state.sh)
+    # <<< coordination state
+
+    # >>> marker watch (tools/marker_watch.sh)
+    # <<< marker watch
+
+    # >>> job tracking (tools/job_tracking.sh)
+    # <<< job tracking
+
+    # >>> output buffer (tools/out_buffer.sh)
+    # <<< output buffer
+
+    # >>> telemetry store (tools/lb_telemetry.py)
+    # <<< telemetry store
+
+Running the module rewrites everything between the markers in the files listed
+in ``TARGETS``, ``TRACE_TARGETS``, ``MUX_TARGETS``, ``STATE_TARGETS``,
+``MARKER_TARGETS``, ``JOB_TARGETS``, ``BUFFER_TARGETS`` and ``TELEMETRY_TARGETS``
+and regenerates v5.0.yaml from its template:
+
+    python -m tools.sched_sync
+    python -m tools.sched_sync --check
+"""
+
+import argparse
+import pathlib
+import re
+import sys
+
+from tools import lb_generate
+
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+LIBRARY = ROOT / "tools" / "sched_backend.sh"
+TARGETS = ("v3.5.yaml", "v4.0.yaml", "tools/lb_template/site_job.yaml")
+BEGIN = "# >>> scheduler backend (tools/sched_backend.sh)"
+END = "# <<< scheduler backend"
+TRACE_LIBRARY = ROOT / "tools" / "trace_spans.sh"
+TRACE_TARGETS = ("v4.0.yaml", "tools/lb_template/workflow.yaml", "tools/lb_template/site_job.yaml")
+TRACE_BEGIN = "# >>> trace spans (tools/trace_spans.sh)"
+TRACE_END = "# <<< trace spans"
+MUX_LIBRARY = ROOT / "tools" / "ssh_mux.sh"
+MUX_TARGETS = ("v4.0.yaml", "tools/lb_template/workflow.yaml")
+MUX_BEGIN = "# >>> ssh multiplexing (tools/ssh_mux.sh)"
+MUX_END = "# <<< ssh multiplexing"
+STATE_LIBRARY = ROOT / "tools" / "lb_state.sh"
+STATE_TARGETS = ("tools/lb_template/workflow.yaml", "tools/lb_template/site_job.yaml")
+STATE_BEGIN = "# >>> coordination state (tools/lb_state.sh)"
+STATE_END = "# <<< coordination state"
+MARKER_LIBRARY = ROOT / "tools" / "marker_watch.sh"
+MARKER_TARGETS = ("v4.0.yaml", "tools/lb_template/workflow.yaml", "tools/lb_template/site_job.yaml")
+MARKER_BEGIN = "# >>> marker watch (tools/marker_watch.sh)"
+MARKER_END = "# <<< marker watch"
+JOB_LIBRARY = ROOT / "tools" / "job_tracking.sh"
+JOB_TARGETS = ("v4.0.yaml",)
+JOB_BEGIN = "# >>> job tracking (tools/job_tracking.sh)"
+JOB_END = "# <<< job tracking"
+BUFFER_LIBRARY = ROOT / "tools" / "out_buffer.sh"
+BUFFER_TARGETS = ("v4.0.yaml", "tools/lb_template/site_job.yaml")
+BUFFER_BEGIN = "# >>> output buffer (tools/out_buffer.sh)"
+BUFFER_END = "# <<< output buffer"
+TELEMETRY_LIBRARY = ROOT / "tools" / "lb_telemetry.py"
+TELEMETRY_TARGETS = ("tools/lb_template/workflow.yaml",)
+TELEMETRY_BEGIN = "# >>> telemetry store (tools/lb_telemetry.py)"
+TELEMETRY_END = "# <<< telemetry store"
+LIBRARIES = (
+    (LIBRARY, TARGETS, BEGIN, END),
+    (TRACE_LIBRARY, TRACE_TARGETS, TRACE_BEGIN, TRACE_END),
+    (MUX_LIBRARY, MUX_TARGETS, MUX_BEGIN, MUX_END),
+    (STATE_LIBRARY, STATE_TARGETS, STATE_BEGIN, STATE_END),
+    (MARKER_LIBRARY, MARKER_TARGETS, MARKER_BEGIN, MARKER_END),
+    (JOB_LIBRARY, JOB_TARGETS, JOB_BEGIN, JOB_END),
+    (BUFFER_LIBRARY, BUFFER_TARGETS, BUFFER_BEGIN, BUFFER_END),
+    (TELEMETRY_LIBRARY, TELEMETRY_TARGETS, TELEMETRY_BEGIN, TELEMETRY_END),
+)
+
+
+def block_pattern(begin, end):
+    return re.compile(
+        r"^(?P<indent>[ ]*)" + re.escape(begin) + r"\n.*?^(?P=indent)" + re.escape(end) + r"\n",
+        re.MULTILINE | re.DOTALL,
+    )
+
+
+BLOCK = block_pattern(BEGIN, END)
+
+
+def embed(text, library, begin=BEGIN, end=END):
+    """Replace every block in ``text`` marked by ``begin``/``end`` with ``library``."""
+
+    def block(match):
+        indent = match.group("indent")
+        body = "".join(indent + line if line.strip() else "\n" for line in library.splitlines(keepends=True))
+        return f"{indent}{begin}\n{body}{indent}{end}\n"
+
+    return block_pattern(begin, end).sub(block, text)
+
+
+def synced(root=ROOT):
+    """``{path: text}`` for every target file and v5.0.yaml as they should be."""
+    root = pathlib.Path(root)
+    files = {}
+    for library, targets, begin, end in LIBRARIES:
+        library = library.read_text(encoding="utf-8")
+        for name in targets:
+            path = root / name
+            text = files[path] if path in files else path.read_text(encoding="utf-8")
+            if begin not in text:
+                raise ValueError(f"{name} has no {begin[6:]} block")
+            files[path] = embed(text, library, begin, end)
+    template_dir = root / "tools" / "lb_template"
+    files[root / "v5.0.yaml"] = lb_generate.generate(
+        lb_generate.DEFAULT_SITES, template_dir,
+        site_job=files[template_dir / "site_job.yaml"], workflow=files[template_dir / "workflow.yaml"],
+    )
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embed the shared shell libraries into the workflows")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a workflow is not up to date")
+    args = parser.parse_args(argv)
+
+    stale = []
+    for path, text in synced().items():
+        if path.read_text(encoding="utf-8") == text:
+            continue
+        stale.append(path.relative_to(ROOT))
+        if not args.check:
+            path.write_text(text, encoding="utf-8")
+    if args.check and stale:
+        print(f"{', '.join(map(str, stale))} out of date; run python -m tools.sched_sync", file=sys.stderr)
+        return 1
+    for path in stale:
+        print(f"updated {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
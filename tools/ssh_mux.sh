@@ -0,0 +1,37 @@
+# SSH connection reuse for the node-level commands of v4.0 and the v5.0 output
+# collection (rsync -e "ssh ${SSH_MUX_OPTS[*]}" without -n). Every ssh opened here
+# goes through one OpenSSH ControlMaster per user and host: the first connection to
+# a host authenticates and is kept for SSH_MUX_PERSIST seconds after its last
+# session, and later connections to that host (the other cleanup handler, later
+# runs) open a channel on it instead of a new handshake. Sockets live in
+# SSH_MUX_DIR; SSH_MUX_PERSIST=0 turns reuse off.
+SSH_MUX_DIR=${SSH_MUX_DIR:-${XDG_RUNTIME_DIR:-/tmp}/job_runner_ssh_${USER:-$(id -un)}}
+SSH_MUX_PERSIST=${SSH_MUX_PERSIST:-300}
+SSH_MUX_OPTS=(-n -o BatchMode=yes -o ConnectTimeout=5)
+if [[ "${SSH_MUX_PERSIST}" != "0" ]] && mkdir -p -m 700 "${SSH_MUX_DIR}" 2>/dev/null; then
+  SSH_MUX_OPTS+=(-o ControlMaster=auto -o "ControlPath=${SSH_MUX_DIR}/%C" -o "ControlPersist=${SSH_MUX_PERSIST}")
+fi
+
+# ssh_mux <host> <command>: run a command on a host over the shared connection
+ssh_mux() {
+  ssh "${SSH_MUX_OPTS[@]}" "$@"
+}
+
+# node_fanout <timeout> <command> <node>...: run a command on every node at once,
+# each bounded by <timeout> seconds. REPLY is "<node>:<exit code>,..." in node order.
+node_fanout() {
+  local limit=$1 command=$2 node i rc pids=()
+  shift 2
+  for node in "$@"; do
+    timeout "${limit}" ssh "${SSH_MUX_OPTS[@]}" "${node}" "${command}" >/dev/null 2>&1 &
+    pids+=($!)
+  done
+  REPLY=""
+  i=0
+  for node in "$@"; do
+    rc=0
+    wait "${pids[i]}" || rc=$?
+    REPLY+="${REPLY:+,}${node}:${rc}"
+    i=$(( i + 1 ))
+  done
+}
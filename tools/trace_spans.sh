@@ -0,0 +1,129 @@
+# Overhead tracing shared by v4.0 and v5.0. Steps record timed spans, one line
+#   <start µs> <duration µs> <job> <step> <span>   (tab-separated)
+# per span in TRACE_FILE; trace_export turns span files into a Chrome trace
+# (chrome://tracing, ui.perfetto.dev) and OpenMetrics text. TRACE_FILE, TRACE_JOB
+# and TRACE_STEP must be set by the caller. The step's own span starts here and
+# ends, with every span still open, on exit: trace_close is the EXIT trap, and a
+# step that sets its own EXIT trap calls it from there.
+
+# trace_now: sets REPLY to the wall-clock time in microseconds
+trace_now() {
+  if [[ -n "${EPOCHREALTIME:-}" ]]; then
+    REPLY=${EPOCHREALTIME/[.,]/}
+  else
+    REPLY=$(date +%s%6N)
+  fi
+}
+
+# trace_mtime <file>: sets REPLY to the file's modification time in microseconds;
+# fails if the file does not exist
+trace_mtime() {
+  REPLY=$(stat -c %.6Y "$1" 2>/dev/null) || REPLY=""
+  if [[ ! "${REPLY}" =~ ^[0-9]+[.,][0-9]{6}$ ]]; then
+    REPLY=$(stat -c %Y "$1" 2>/dev/null) || { REPLY=""; return 1; }
+    REPLY=$(( REPLY * 1000000 ))
+    return 0
+  fi
+  REPLY=${REPLY/[.,]/}
+}
+
+# trace_span <span> <start µs> <end µs>: record a span measured by the caller
+trace_span() {
+  [[ -n "${TRACE_FILE:-}" && $2 -le $3 ]] || return 0
+  printf '%s\t%s\t%s\t%s\t%s\n' "$2" $(( $3 - $2 )) "${TRACE_JOB}" "${TRACE_STEP}" "$1" >> "${TRACE_FILE}" 2>/dev/null || true
+}
+
+# span_begin <span> / span_end <span>: time a phase; span_end leaves the end time
+# in REPLY. Spans may nest; ending a span that is not open does nothing.
+declare -A TRACE_OPEN=()
+span_begin() {
+  trace_now
+  TRACE_OPEN[$1]=${REPLY}
+}
+span_end() {
+  local start=${TRACE_OPEN[$1]:-}
+  [[ -n "${start}" ]] || return 0
+  unset "TRACE_OPEN[$1]"
+  trace_now
+  trace_span "$1" "${start}" "${REPLY}"
+}
+
+# trace_started [marker]: the job was seen running. Records queue_wait from the
+# end of the submit span (TRACE_SUBMITTED) to the start, and start_detect_lag
+# from the marker's mtime, when it exists, until now. Opens the run span; does
+# nothing while it is open.
+TRACE_SUBMITTED=""
+trace_started() {
+  local seen started
+  [[ -z "${TRACE_OPEN[run]:-}" ]] || return 0
+  trace_now
+  seen=${REPLY}
+  started=${seen}
+  if [[ -n "${1:-}" ]] && trace_mtime "$1" && [[ ${REPLY} -le ${seen} ]]; then
+    started=${REPLY}
+    trace_span start_detect_lag "${started}" "${seen}"
+  fi
+  [[ -n "${TRACE_SUBMITTED}" ]] && trace_span queue_wait "${TRACE_SUBMITTED}" "${started}"
+  TRACE_OPEN[run]=${started}
+}
+
+trace_close() {
+  local span
+  for span in "${!TRACE_OPEN[@]}"; do
+    span_end "${span}"
+  done
+  return 0
+}
+
+# trace_export <trace json> <metrics file> <span file>...: merge span files into a
+# Chrome trace (one process per job, one thread per step) and OpenMetrics text:
+# the summed duration and count of every span, and the time from the first span
+# to the first run span (the user script's start)
+trace_export() {
+  local trace=$1 metrics=$2
+  shift 2
+  cat "$@" 2>/dev/null | sort -n | awk -F'\t' -v trace="${trace}.tmp" -v metrics="${metrics}.tmp" '
+    function str(s) { gsub(/[\\"]/, "\\\\&", s); return "\"" s "\"" }
+    function event(e) { printf "%s%s", (events++ ? ",\n" : "{\"traceEvents\":[\n"), e > trace }
+    NF >= 5 && $1 ~ /^[0-9]+$/ {
+      if (first == "") first = $1
+      if ($5 == "run" && script == "") script = $1
+      if (!($3 in pid)) {
+        pid[$3] = ++pids
+        event(sprintf("{\"name\":\"process_name\",\"ph\":\"M\",\"pid\":%d,\"args\":{\"name\":%s}}", pids, str($3)))
+      }
+      thread = $3 SUBSEP $4
+      if (!(thread in tid)) {
+        tid[thread] = ++tids
+        event(sprintf("{\"name\":\"thread_name\",\"ph\":\"M\",\"pid\":%d,\"tid\":%d,\"args\":{\"name\":%s}}", pid[$3], tids, str($4)))
+      }
+      event(sprintf("{\"name\":%s,\"cat\":%s,\"ph\":\"X\",\"ts\":%s,\"dur\":%s,\"pid\":%d,\"tid\":%d}", str($5), str($3), $1, $2, pid[$3], tid[thread]))
+      key = $3 SUBSEP $4 SUBSEP $5
+      if (!(key in count)) keys[++nkeys] = key
+      count[key]++
+      sum[key] += $2
+    }
+    END {
+      if (!events) printf "{\"traceEvents\":[" > trace
+      print "\n],\"displayTimeUnit\":\"ms\"}" > trace
+      print "# TYPE job_runner_span_seconds summary" > metrics
+      print "# UNIT job_runner_span_seconds seconds" > metrics
+      print "# HELP job_runner_span_seconds Wall-clock time of traced workflow phases." > metrics
+      for (i = 1; i <= nkeys; i++) {
+        split(keys[i], k, SUBSEP)
+        labels = sprintf("{job=%s,step=%s,span=%s}", str(k[1]), str(k[2]), str(k[3]))
+        printf "job_runner_span_seconds_sum%s %.6f\n", labels, sum[keys[i]] / 1000000 > metrics
+        printf "job_runner_span_seconds_count%s %d\n", labels, count[keys[i]] > metrics
+      }
+      if (script != "") {
+        print "# TYPE job_runner_time_to_script_seconds gauge" > metrics
+        print "# UNIT job_runner_time_to_script_seconds seconds" > metrics
+        print "# HELP job_runner_time_to_script_seconds Time from the first traced step to the start of the user script." > metrics
+        printf "job_runner_time_to_script_seconds %.6f\n", (script - first) / 1000000 > metrics
+      }
+      print "# EOF" > metrics
+    }' && mv -f "${trace}.tmp" "${trace}" && mv -f "${metrics}.tmp" "${metrics}"
+}
+
+span_begin "${TRACE_STEP}"
+trap trace_close EXIT